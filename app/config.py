@@ -0,0 +1,30 @@
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+import os
+
+
+class Configuracion:
+    """Acceso tipado a las variables de entorno (incluidas las del archivo .env)."""
+
+    def texto(self, nombre: str, defecto: Optional[str] = None) -> Optional[str]:
+        return os.getenv(nombre, defecto)
+
+    def entero(self, nombre: str, defecto: int) -> int:
+        valor = os.getenv(nombre)
+        return int(valor) if valor not in (None, "") else defecto
+
+    def decimal(self, nombre: str, defecto: float) -> float:
+        valor = os.getenv(nombre)
+        return float(valor) if valor not in (None, "") else defecto
+
+    def booleano(self, nombre: str, defecto: bool) -> bool:
+        valor = os.getenv(nombre)
+        return valor.lower() == "true" if valor not in (None, "") else defecto
+
+
+@lru_cache(maxsize=1)
+def obtener_configuracion() -> Configuracion:
+    """Carga el .env una sola vez por proceso y retorna la configuracion compartida."""
+    load_dotenv()
+    return Configuracion()
@@ -1,12 +1,22 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, func, and_
+from sqlalchemy import desc, func, and_, select
 from typing import List, Optional, Type, Tuple
 from datetime import date
 from app import models, schemas
 from app.models import LogSistema
-from app.services.security import hashear_password
+from app.services import security
+from app.services.cache import CacheVersionada
+from app.services.miniaturas import url_miniatura
+from app.config import obtener_configuracion
 
+from collections import Counter
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+config = obtener_configuracion()
+
+# Las horas se guardan en UTC; los reportes agrupan por hora local
+ZONA_HORARIA_REPORTES = ZoneInfo(config.texto("ZONA_HORARIA_REPORTES", "America/Mexico_City"))
 
 
 # OPERACIONES CRUD PARA Usuario
@@ -16,6 +26,28 @@ def get_user_by_id(db: Session, usuario_id: int) -> Optional[models.Usuario]:
     return db.query(models.Usuario).filter(models.Usuario.usuario_id == usuario_id).first()
 
 
+def get_version_token(db: Session, usuario_id: int) -> Optional[int]:
+    """Obtener la version de token vigente de un usuario (None si no existe)."""
+    fila = db.query(models.Usuario.version_token).filter(models.Usuario.usuario_id == usuario_id).first()
+    return (fila[0] or 0) if fila else None
+
+
+def cambiar_password_usuario(db: Session, usuario: models.Usuario, nuevo_hash: str) -> models.Usuario:
+    """Actualizar el hash de contraseña de un usuario e invalidar sus tokens emitidos."""
+    usuario.hash_contrasena = nuevo_hash
+    usuario.version_token = (usuario.version_token or 0) + 1
+    db.commit()
+    security.invalidar_version_token(usuario.usuario_id)
+    return usuario
+
+
+def actualizar_hash_password(db: Session, usuario: models.Usuario, nuevo_hash: str) -> models.Usuario:
+    """Reemplazar el hash de la misma contraseña (cambio de costo de bcrypt), sin invalidar tokens."""
+    usuario.hash_contrasena = nuevo_hash
+    db.commit()
+    return usuario
+
+
 def get_user_by_username(db: Session, nombre_usuario: str) -> Optional[models.Usuario]:
     """Obtener un usuario por su nombre de usuario."""
     return db.query(models.Usuario).filter(models.Usuario.nombre_usuario == nombre_usuario).first()
@@ -35,7 +67,7 @@ def create_user(db: Session, user: schemas.UsuarioCreate) -> models.Usuario:
     """Crear un nuevo usuario con la contraseña hasheada."""
     print('-----' *20)
     print('password original: ' + user.password)
-    hashed_password = hashear_password(user.password)
+    hashed_password = security.hashear_password(user.password)
     print('password hashed: ' + hashed_password)
     db_user = models.Usuario(
         nombre_usuario=user.nombre_usuario,
@@ -93,6 +125,91 @@ def get_eventos_por_fecha(db: Session, fecha_evento) -> List[models.Evento]:
     )
 
 
+def get_tarjetas_galeria(db: Session, fecha_evento: date, skip: int = 0, limit: int = 12) -> Tuple[List[dict], int]:
+    """
+    Datos de las tarjetas de la galeria para una fecha, paginados por evento_id.
+    Solo trae columnas y conteos (sin cargar detecciones): imagen de vista previa (la de mas detecciones),
+    maximo de detecciones y horas de la primera y ultima imagen. Retorna (tarjetas, total de eventos del dia).
+    """
+    filtro_fecha = models.Evento.fecha_evento == fecha_evento
+    total = db.query(func.count(models.Evento.evento_id)).filter(filtro_fecha).scalar() or 0
+
+    eventos = db.query(
+        models.Evento.evento_id,
+        models.Evento.fecha_evento,
+        models.Evento.descripcion,
+        models.Evento.estatus
+    ).filter(filtro_fecha).order_by(models.Evento.evento_id).offset(skip).limit(limit).all()
+
+    if not eventos:
+        return [], total
+
+    imagenes = db.query(
+        models.Imagen.imagen_id,
+        models.Imagen.evento_id,
+        models.Imagen.ruta_imagen,
+        models.Imagen.hora_subida,
+        func.count(models.Deteccion.deteccion_id).label("detecciones")
+    ).outerjoin(
+        models.Deteccion, models.Deteccion.imagen_id == models.Imagen.imagen_id
+    ).filter(
+        models.Imagen.evento_id.in_([evento.evento_id for evento in eventos])
+    ).group_by(
+        models.Imagen.imagen_id, models.Imagen.evento_id, models.Imagen.ruta_imagen, models.Imagen.hora_subida
+    ).order_by(models.Imagen.evento_id, models.Imagen.imagen_id).all()
+
+    resumen = {}
+    for imagen in imagenes:
+        datos = resumen.get(imagen.evento_id)
+        if datos is None:
+            resumen[imagen.evento_id] = {
+                "preview": imagen.ruta_imagen,
+                "preview_id": imagen.imagen_id,
+                "max_detecciones": imagen.detecciones,
+                "hora_inicio": imagen.hora_subida,
+                "hora_fin": imagen.hora_subida
+            }
+            continue
+        if imagen.detecciones > datos["max_detecciones"]:
+            datos["preview"] = imagen.ruta_imagen
+            datos["preview_id"] = imagen.imagen_id
+            datos["max_detecciones"] = imagen.detecciones
+        if imagen.hora_subida is not None:
+            if datos["hora_inicio"] is None or imagen.hora_subida < datos["hora_inicio"]:
+                datos["hora_inicio"] = imagen.hora_subida
+            if datos["hora_fin"] is None or imagen.hora_subida > datos["hora_fin"]:
+                datos["hora_fin"] = imagen.hora_subida
+
+    sin_imagenes = {"preview": None, "preview_id": None, "max_detecciones": 0, "hora_inicio": None, "hora_fin": None}
+    tarjetas = [{
+        "evento_id": evento.evento_id,
+        "fecha_evento": evento.fecha_evento,
+        "descripcion": evento.descripcion,
+        "estatus": evento.estatus.value,
+        **resumen.get(evento.evento_id, sin_imagenes)
+    } for evento in eventos]
+    return tarjetas, total
+
+
+def get_imagenes_con_detecciones(db: Session, evento_id: int) -> List[dict]:
+    """Imagenes de un evento con las cajas de sus detecciones, en el formato que usa el visor de la galeria."""
+    filas = db.query(
+        models.Imagen.imagen_id,
+        models.Imagen.ruta_imagen,
+        models.Deteccion.x1, models.Deteccion.y1, models.Deteccion.x2, models.Deteccion.y2
+    ).outerjoin(
+        models.Deteccion, models.Deteccion.imagen_id == models.Imagen.imagen_id
+    ).filter(
+        models.Imagen.evento_id == evento_id
+    ).order_by(models.Imagen.imagen_id, models.Deteccion.deteccion_id).all()
+
+    imagenes = {}
+    for fila in filas:
+        imagen = imagenes.setdefault(fila.imagen_id, {"url": fila.ruta_imagen, "detections": []})
+        if fila.x1 is not None:
+            imagen["detections"].append({"x_min": fila.x1, "y_min": fila.y1, "x_max": fila.x2, "y_max": fila.y2})
+    return list(imagenes.values())
+
 
 def create_evento(db: Session, evento: schemas.EventoCreate) -> models.Evento:
     """Crear un nuevo evento."""
@@ -103,6 +220,23 @@ def create_evento(db: Session, evento: schemas.EventoCreate) -> models.Evento:
     return db_evento
 
 
+def create_evento_con_notificacion(db: Session, evento: schemas.EventoCreate) -> models.Evento:
+    """Crear un nuevo evento y su notificacion push en el outbox, en una sola transaccion."""
+    db_evento = models.Evento(**evento.model_dump())
+    db.add(db_evento)
+    db.flush()
+
+    db.add(models.NotificacionOutbox(
+        evento_id=db_evento.evento_id,
+        tipo="nuevo_evento",
+        proximo_intento=datetime.utcnow()
+    ))
+
+    db.commit()
+    db.refresh(db_evento)
+    return db_evento
+
+
 def update_evento(db: Session, evento_id: int, evento_update: schemas.EventoUpdate) -> Optional[models.Evento]:
     """Actualizar el estatus, usuario y descripción de un evento."""
     db_evento = get_evento_by_id(db, evento_id)
@@ -126,6 +260,42 @@ def update_evento_descripcion(db: Session, evento_id: int, evento_update: schema
     return db_evento
 
 
+def marcar_eventos_modificados(db: Session, evento_ids) -> None:
+    """Actualizar fecha_modificacion de los eventos (sin commit; va en la transaccion del cambio)."""
+    evento_ids = {evento_id for evento_id in evento_ids if evento_id is not None}
+    if evento_ids:
+        db.query(models.Evento).filter(models.Evento.evento_id.in_(evento_ids)).update(
+            {models.Evento.fecha_modificacion: func.now(6)}, synchronize_session=False
+        )
+
+
+def filtro_fechas_evento(fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> list:
+    """Condiciones de rango sobre fecha_evento (lista vacia si no hay fechas)."""
+    condiciones = []
+    if fecha_inicio:
+        condiciones.append(models.Evento.fecha_evento >= fecha_inicio)
+    if fecha_fin:
+        condiciones.append(models.Evento.fecha_evento <= fecha_fin)
+    return condiciones
+
+
+def get_version_eventos(db: Session, condiciones: list) -> tuple:
+    """
+    Version de los eventos que cumplen `condiciones`: (total de eventos, suma de IDs, ultima modificacion).
+    Cambia si se crea, borra o modifica uno de esos eventos o se le agregan imagenes o registros de aire.
+    """
+    return tuple(db.query(
+        func.count(models.Evento.evento_id),
+        func.coalesce(func.sum(models.Evento.evento_id), 0),
+        func.max(models.Evento.fecha_modificacion)
+    ).filter(*condiciones).one())
+
+
+def get_version_datos_reporte(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> tuple:
+    """Version de los datos de un rango de fechas (ver get_version_eventos)."""
+    return get_version_eventos(db, filtro_fechas_evento(fecha_inicio, fecha_fin))
+
+
 def delete_evento(db: Session, evento_id: int) -> bool:
     """Eliminar un evento por su ID."""
     db_evento = db.query(models.Evento).filter(models.Evento.evento_id == evento_id).first()
@@ -189,7 +359,8 @@ def calcular_campos_evento(evento: models.Evento, incluir_todas_imagenes: bool =
         "promedio_pm10": promedio_pm10,
         "promedio_pm2p5": promedio_pm2p5,
         "promedio_pm1p0": promedio_pm1p0,
-        "imagen_preview": imagen_preview
+        "imagen_preview": imagen_preview,
+        "miniatura_preview": url_miniatura(imagen_preview.imagen_id) if imagen_preview else None
     }
 
     # Solo incluir todas las imagenes si se solicita (para detalle)
@@ -200,15 +371,8 @@ def calcular_campos_evento(evento: models.Evento, incluir_todas_imagenes: bool =
     return resultado
 
 
-def get_eventos_optimizado(db: Session, filtros: schemas.EventosFiltros ) -> Tuple[List[models.Evento], int]:
-    """ Obtiene eventos con filtros y ordenamiento optimizado. Retorna una tupla (eventos, total_count) """
-    query = db.query(models.Evento).options(
-        joinedload(models.Evento.usuario),
-        joinedload(models.Evento.imagenes).joinedload(models.Imagen.detecciones),
-        joinedload(models.Evento.registros_calidad_aire)
-    )
-
-    # Aplicar filtros
+def condiciones_eventos_optimizado(filtros: schemas.EventosFiltros) -> list:
+    """Condiciones de los filtros de eventos (estatus, usuario y rango de fechas)."""
     conditions = []
 
     if filtros.estatus:
@@ -229,6 +393,19 @@ def get_eventos_optimizado(db: Session, filtros: schemas.EventosFiltros ) -> Tup
     elif filtros.fecha_fin:
         conditions.append(models.Evento.fecha_evento <= filtros.fecha_fin)
 
+    return conditions
+
+
+def get_eventos_optimizado(db: Session, filtros: schemas.EventosFiltros ) -> Tuple[List[models.Evento], int]:
+    """ Obtiene eventos con filtros y ordenamiento optimizado. Retorna una tupla (eventos, total_count) """
+    query = db.query(models.Evento).options(
+        joinedload(models.Evento.usuario),
+        joinedload(models.Evento.imagenes).joinedload(models.Imagen.detecciones),
+        joinedload(models.Evento.registros_calidad_aire)
+    )
+
+    # Aplicar filtros
+    conditions = condiciones_eventos_optimizado(filtros)
     if conditions:
         query = query.filter(and_(*conditions))
 
@@ -242,38 +419,24 @@ def get_eventos_optimizado(db: Session, filtros: schemas.EventosFiltros ) -> Tup
 
 
 def get_estadisticas_eventos(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> dict:
-    """Obtiene estadisticas generales de eventos."""
+    """Obtiene estadisticas generales de eventos (con consultas agregadas, sin cargar los eventos)."""
+    filtro_fechas = filtro_fechas_evento(fecha_inicio, fecha_fin)
 
-    query = db.query(models.Evento)
-
-    # Aplicar filtros de fecha
-    if fecha_inicio and fecha_fin:
-        query = query.filter(
-            and_(
-                models.Evento.fecha_evento >= fecha_inicio,
-                models.Evento.fecha_evento <= fecha_fin
-            )
-        )
-    elif fecha_inicio:
-        query = query.filter(models.Evento.fecha_evento >= fecha_inicio)
-    elif fecha_fin:
-        query = query.filter(models.Evento.fecha_evento <= fecha_fin)
+    conteos = dict(db.query(
+        models.Evento.estatus, func.count(models.Evento.evento_id)
+    ).filter(*filtro_fechas).group_by(models.Evento.estatus).all())
 
-    total_eventos = query.count()
-    eventos_pendientes = query.filter(models.Evento.estatus == models.EstatusEventoEnum.pendiente).count()
-    eventos_confirmados = query.filter(models.Evento.estatus == models.EstatusEventoEnum.confirmado).count()
-    eventos_descartados = query.filter(models.Evento.estatus == models.EstatusEventoEnum.descartado).count()
+    total_eventos = sum(conteos.values())
+    eventos_pendientes = conteos.get(models.EstatusEventoEnum.pendiente, 0)
+    eventos_confirmados = conteos.get(models.EstatusEventoEnum.confirmado, 0)
+    eventos_descartados = conteos.get(models.EstatusEventoEnum.descartado, 0)
 
     # Calcular total de detecciones
-    eventos = query.options(
-        joinedload(models.Evento.imagenes).joinedload(models.Imagen.detecciones)
-    ).all()
-
-    total_detecciones = sum(
-        len(imagen.detecciones)
-        for evento in eventos
-        for imagen in evento.imagenes
-    )
+    total_detecciones = db.query(func.count(models.Deteccion.deteccion_id)).join(
+        models.Imagen, models.Deteccion.imagen_id == models.Imagen.imagen_id
+    ).join(
+        models.Evento, models.Imagen.evento_id == models.Evento.evento_id
+    ).filter(*filtro_fechas).scalar() or 0
 
     promedio_detecciones = total_detecciones / total_eventos if total_eventos > 0 else 0
 
@@ -289,6 +452,146 @@ def get_estadisticas_eventos(db: Session, fecha_inicio: Optional[date] = None, f
     }
 
 
+def _subconsulta_promedios_aire(evento_ids_query):
+    """
+    Promedios de PM por evento usando un solo registro por minuto (el primero),
+    igual que calcular_campos_evento. `evento_ids_query` limita los eventos considerados.
+    """
+    minuto = func.date_format(models.CalidadAire.hora_medicion, "%Y-%m-%d %H:%i")
+    registros_unicos = (
+        select(func.min(models.CalidadAire.registro_id))
+        .where(
+            models.CalidadAire.evento_id.in_(evento_ids_query),
+            models.CalidadAire.hora_medicion.isnot(None)
+        )
+        .group_by(models.CalidadAire.evento_id, minuto)
+    )
+
+    return (
+        select(
+            models.CalidadAire.evento_id.label("evento_id"),
+            func.avg(models.CalidadAire.pm10).label("promedio_pm10"),
+            func.avg(models.CalidadAire.pm2p5).label("promedio_pm2p5"),
+            func.avg(models.CalidadAire.pm1p0).label("promedio_pm1p0")
+        )
+        .where(models.CalidadAire.registro_id.in_(registros_unicos))
+        .group_by(models.CalidadAire.evento_id)
+        .subquery()
+    )
+
+
+def get_promedios_aire_por_evento(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> List[tuple]:
+    """Promedios (pm10, pm2p5, pm1p0) de cada evento del rango con registros de aire; NULL si falta el parametro."""
+    eventos_rango = select(models.Evento.evento_id).where(*filtro_fechas_evento(fecha_inicio, fecha_fin))
+    promedios = _subconsulta_promedios_aire(eventos_rango)
+
+    return [tuple(fila) for fila in db.query(
+        promedios.c.promedio_pm10, promedios.c.promedio_pm2p5, promedios.c.promedio_pm1p0
+    ).all()]
+
+
+def get_detecciones_por_hora_y_dia(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> List[tuple]:
+    """
+    Detecciones del rango agrupadas por hora local (ZONA_HORARIA_REPORTES) de subida de la imagen:
+    [(dia de la semana 0=lunes, hora, total)].
+    La BD agrupa por fecha y hora UTC (a lo mas 24 filas por dia) y aqui se pasa cada grupo a la hora local,
+    sin depender de que MySQL tenga cargadas las tablas de zonas horarias.
+    """
+    fecha_utc = func.date(models.Imagen.hora_subida)
+    hora_utc = func.hour(models.Imagen.hora_subida)
+
+    filas = db.query(
+        fecha_utc, hora_utc, func.count(models.Deteccion.deteccion_id)
+    ).join(
+        models.Imagen, models.Deteccion.imagen_id == models.Imagen.imagen_id
+    ).join(
+        models.Evento, models.Imagen.evento_id == models.Evento.evento_id
+    ).filter(
+        models.Imagen.hora_subida.isnot(None),
+        *filtro_fechas_evento(fecha_inicio, fecha_fin)
+    ).group_by(fecha_utc, hora_utc).all()
+
+    totales = Counter()
+    for fecha, hora, total in filas:
+        local = datetime(fecha.year, fecha.month, fecha.day, hora, tzinfo=ZoneInfo("UTC")).astimezone(ZONA_HORARIA_REPORTES)
+        totales[(local.weekday(), local.hour)] += total
+    return [(dia, hora, total) for (dia, hora), total in totales.items()]
+
+
+def get_duraciones_eventos(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None) -> List[int]:
+    """Duracion en segundos de cada evento del rango con imagenes (de la primera a la ultima imagen)."""
+    duracion = (func.unix_timestamp(func.max(models.Imagen.hora_subida))
+                - func.unix_timestamp(func.min(models.Imagen.hora_subida)))
+
+    return [fila[0] for fila in db.query(duracion).join(
+        models.Evento, models.Imagen.evento_id == models.Evento.evento_id
+    ).filter(
+        models.Imagen.hora_subida.isnot(None),
+        *filtro_fechas_evento(fecha_inicio, fecha_fin)
+    ).group_by(models.Imagen.evento_id).all()]
+
+
+def get_filas_reporte_eventos(db: Session, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None,
+                              limite: int = 500) -> List[dict]:
+    """
+    Filas del detalle de eventos del reporte: los `limite` eventos mas recientes del rango con
+    operador, maximo de detecciones por imagen y promedios de calidad del aire, todo calculado en SQL.
+    """
+    eventos = db.query(
+        models.Evento.evento_id,
+        models.Evento.fecha_evento,
+        models.Evento.descripcion,
+        models.Evento.estatus,
+        models.Evento.usuario_id,
+        models.Usuario.nombre_usuario
+    ).outerjoin(
+        models.Usuario, models.Evento.usuario_id == models.Usuario.usuario_id
+    ).filter(
+        *filtro_fechas_evento(fecha_inicio, fecha_fin)
+    ).order_by(
+        desc(models.Evento.fecha_evento), desc(models.Evento.evento_id)
+    ).limit(limite).all()
+
+    if not eventos:
+        return []
+
+    evento_ids = [evento.evento_id for evento in eventos]
+
+    # Maximo de detecciones en una sola imagen por evento
+    detecciones_por_imagen = select(
+        models.Imagen.evento_id.label("evento_id"),
+        func.count(models.Deteccion.deteccion_id).label("detecciones")
+    ).outerjoin(
+        models.Deteccion, models.Deteccion.imagen_id == models.Imagen.imagen_id
+    ).where(
+        models.Imagen.evento_id.in_(evento_ids)
+    ).group_by(models.Imagen.imagen_id, models.Imagen.evento_id).subquery()
+
+    max_detecciones = dict(db.query(
+        detecciones_por_imagen.c.evento_id, func.max(detecciones_por_imagen.c.detecciones)
+    ).group_by(detecciones_por_imagen.c.evento_id).all())
+
+    promedios = _subconsulta_promedios_aire(evento_ids)
+    promedios_aire = {fila.evento_id: fila for fila in db.query(promedios).all()}
+
+    filas = []
+    for evento in eventos:
+        aire = promedios_aire.get(evento.evento_id)
+        filas.append({
+            "evento_id": evento.evento_id,
+            "fecha_evento": evento.fecha_evento.strftime("%d/%m/%Y"),
+            "descripcion": evento.descripcion,
+            "estatus": evento.estatus.value,
+            "usuario_id": evento.usuario_id,
+            "usuario": {"nombre_usuario": evento.nombre_usuario},
+            "max_detecciones": max_detecciones.get(evento.evento_id, 0),
+            "promedio_pm10": float(aire.promedio_pm10) if aire and aire.promedio_pm10 is not None else None,
+            "promedio_pm2p5": float(aire.promedio_pm2p5) if aire and aire.promedio_pm2p5 is not None else None,
+            "promedio_pm1p0": float(aire.promedio_pm1p0) if aire and aire.promedio_pm1p0 is not None else None,
+        })
+    return filas
+
+
 # OPERACIONES CRUD PARA Imagen Y Deteccion (a menudo se crean juntas)
 
 def create_imagen_con_detecciones(db: Session, evento_id: int, imagen: schemas.ImagenBase, detecciones: List[schemas.DeteccionBase]) -> models.Imagen:
@@ -305,17 +608,37 @@ def create_imagen_con_detecciones(db: Session, evento_id: int, imagen: schemas.I
         db_det = models.Deteccion(**det.model_dump(), imagen_id=db_imagen.imagen_id)
         db.add(db_det)
 
+    marcar_eventos_modificados(db, [evento_id])
     db.commit()
     db.refresh(db_imagen)
     return db_imagen
 
 
+def get_ruta_imagen(db: Session, imagen_id: int) -> Optional[str]:
+    """Ruta (URL) de la imagen original, o None si no existe."""
+    return db.query(models.Imagen.ruta_imagen).filter(models.Imagen.imagen_id == imagen_id).scalar()
+
+
+def existe_imagen_cercana(db: Session, evento_id: Optional[int], hora: datetime, minutos: int = 10) -> bool:
+    """Verificar si un evento tiene imagenes subidas dentro de +/- `minutos` de una hora dada."""
+    if evento_id is None:
+        return False
+
+    margen = timedelta(minutes=minutos)
+    return db.query(models.Imagen.imagen_id).filter(
+        models.Imagen.evento_id == evento_id,
+        models.Imagen.hora_subida >= hora - margen,
+        models.Imagen.hora_subida <= hora + margen
+    ).first() is not None
+
+
 # OPERACIONES CRUD PARA CalidadAire
 
 def create_calidad_aire(db: Session, registro: schemas.CalidadAireCreate) -> models.CalidadAire:
     """Crear un nuevo registro de calidad del aire para un evento."""
     db_registro = models.CalidadAire(**registro.model_dump())
     db.add(db_registro)
+    marcar_eventos_modificados(db, [db_registro.evento_id])
     db.commit()
     db.refresh(db_registro)
     return db_registro
@@ -326,11 +649,50 @@ def get_registros_calidad_aire_por_evento(db: Session, evento_id: int) -> List[m
     return db.query(models.CalidadAire).filter(models.CalidadAire.evento_id == evento_id).all()
 
 
+def get_horas_calidad_aire(db: Session, desde: datetime, hasta: datetime) -> set:
+    """Obtener las horas de medicion ya registradas en un rango (para evitar duplicados al importar)."""
+    horas = db.query(models.CalidadAire.hora_medicion).filter(
+        models.CalidadAire.hora_medicion >= desde,
+        models.CalidadAire.hora_medicion <= hasta
+    ).distinct().all()
+    return {hora[0] for hora in horas}
+
+
+def get_intervalos_eventos(db: Session, desde: datetime, hasta: datetime) -> List[Tuple[int, datetime, datetime]]:
+    """
+    Obtener (evento_id, inicio, fin) de los eventos con imagenes en un rango de tiempo.
+    El intervalo de cada evento va de su primera a su ultima imagen.
+    """
+    eventos_en_rango = db.query(models.Imagen.evento_id).filter(
+        models.Imagen.hora_subida >= desde,
+        models.Imagen.hora_subida <= hasta
+    ).distinct()
+
+    return db.query(
+        models.Imagen.evento_id,
+        func.min(models.Imagen.hora_subida),
+        func.max(models.Imagen.hora_subida)
+    ).filter(
+        models.Imagen.evento_id.in_(eventos_en_rango)
+    ).group_by(models.Imagen.evento_id).all()
+
+
+def insertar_calidad_aire_lote(db: Session, registros: List[dict]) -> int:
+    """Insertar un lote de registros de calidad del aire en una sola transaccion."""
+    if not registros:
+        return 0
+    db.bulk_insert_mappings(models.CalidadAire, registros)
+    marcar_eventos_modificados(db, (registro.get("evento_id") for registro in registros))
+    db.commit()
+    return len(registros)
+
+
 def update_calidad_aire_tipo(db: Session, registro_id: int, nuevo_tipo: schemas.TipoMedicionEnum) -> Optional[models.CalidadAire]:
     """Actualizar el tipo de un registro de calidad del aire."""
     db_registro = db.query(models.CalidadAire).filter(models.CalidadAire.registro_id == registro_id).first()
     if db_registro:
         db_registro.tipo = nuevo_tipo
+        marcar_eventos_modificados(db, [db_registro.evento_id])
         db.commit()
         db.refresh(db_registro)
     return db_registro
@@ -349,15 +711,51 @@ def create_log(db: Session, log: schemas.LogSistemaCreate) -> models.LogSistema:
 
 def get_logs(db: Session, fecha_log: Optional[date] = None, tipo_log: Optional[models.TipoLogEnum] = None) -> list[Type[LogSistema]]:
     """Obtener una lista de logs del sistema con filtros opcionales por fecha y tipo."""
-    query = db.query(models.LogSistema)
+    query = db.query(models.LogSistema).filter(*_filtros_logs(fecha_log, tipo_log))
+    return query.order_by(desc(models.LogSistema.hora_log)).all()
 
-    if fecha_log:
-        query = query.filter(func.date(models.LogSistema.hora_log) == fecha_log)
 
+def _filtros_logs(fecha_log: Optional[date], tipo_log: Optional[models.TipoLogEnum]) -> list:
+    condiciones = []
+    if fecha_log:
+        condiciones.append(func.date(models.LogSistema.hora_log) == fecha_log)
     if tipo_log:
-        query = query.filter(models.LogSistema.tipo == tipo_log)
+        condiciones.append(models.LogSistema.tipo == tipo_log)
+    return condiciones
+
+
+def get_version_logs(db: Session, fecha_log: Optional[date] = None, tipo_log: Optional[models.TipoLogEnum] = None) -> tuple:
+    """Version de los logs con esos filtros: (total, ultimo log_id, hora del ultimo log)."""
+    return tuple(db.query(
+        func.count(models.LogSistema.log_id),
+        func.max(models.LogSistema.log_id),
+        func.max(models.LogSistema.hora_log)
+    ).filter(*_filtros_logs(fecha_log, tipo_log)).one())
 
-    return query.order_by(desc(models.LogSistema.hora_log)).all()
+
+# VERSIONES DE CACHE (invalidacion entre workers)
+
+VERSION_TOKENS_OPERADORES = "tokens_operadores"
+
+# Cada worker revisa la version como maximo cada N segundos antes de reutilizar su lista
+cache_tokens_operadores = CacheVersionada(
+    revalidar_segundos=config.decimal("TOKENS_OPERADORES_REVALIDAR_S", 5)
+)
+
+
+def get_version_cache(db: Session, nombre: str) -> int:
+    """Obtener el contador de version de una cache (0 si aun no existe)."""
+    version = db.query(models.VersionCache.version).filter(models.VersionCache.nombre == nombre).scalar()
+    return version or 0
+
+
+def incrementar_version_cache(db: Session, nombre: str):
+    """Incrementar el contador de version. No hace commit: se escribe en la transaccion del cambio."""
+    actualizadas = db.query(models.VersionCache).filter(models.VersionCache.nombre == nombre).update(
+        {models.VersionCache.version: models.VersionCache.version + 1}, synchronize_session=False
+    )
+    if not actualizadas:
+        db.add(models.VersionCache(nombre=nombre, version=1))
 
 
 # OPERACIONES CRUD PARA TokenFCM
@@ -366,8 +764,10 @@ def create_token_fcm(db: Session, token: schemas.TokenFCMCreate) -> models.Token
     """Crear un nuevo token FCM para un usuario."""
     db_token = models.TokenFCM(**token.model_dump())
     db.add(db_token)
+    incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
     db.commit()
     db.refresh(db_token)
+    cache_tokens_operadores.invalidar()
     return db_token
 
 
@@ -387,23 +787,99 @@ def get_token_fcm_existente(db: Session, usuario_id: int, token_fcm: str) -> Opt
     ).first()
 
 
+def registrar_token_fcm(db: Session, usuario_id: int, token_fcm: str, dispositivo: Optional[str] = None) -> models.TokenFCM:
+    """
+    Registrar (o reactivar) el token FCM de un usuario.
+    Se mantiene un solo token activo por (usuario_id, dispositivo) y el mismo token
+    no queda activo para otros usuarios (sesion cambiada en el mismo telefono).
+    Los registros sin `dispositivo` no se deduplican: no desactivan otros tokens del usuario y cada
+    token queda activo hasta que FCM lo reporte como invalido o se desactive.
+    La app vuelve a registrar su token en cada inicio; la cache de tokens de operadores solo se
+    invalida si se agrego un token o cambio el estado activo de alguno.
+    """
+    desactivados = 0
+    if dispositivo:
+        desactivados += db.query(models.TokenFCM).filter(
+            models.TokenFCM.usuario_id == usuario_id,
+            models.TokenFCM.dispositivo == dispositivo,
+            models.TokenFCM.token_fcm != token_fcm,
+            models.TokenFCM.activo == True
+        ).update({models.TokenFCM.activo: False}, synchronize_session=False)
+
+    desactivados += db.query(models.TokenFCM).filter(
+        models.TokenFCM.token_fcm == token_fcm,
+        models.TokenFCM.usuario_id != usuario_id,
+        models.TokenFCM.activo == True
+    ).update({models.TokenFCM.activo: False}, synchronize_session=False)
+
+    db_token = get_token_fcm_existente(db, usuario_id=usuario_id, token_fcm=token_fcm)
+    if db_token:
+        # Si ya existe, solo actualizamos la fecha y lo activamos
+        cambio_activos = desactivados > 0 or not db_token.activo
+        db_token.activo = True
+        db_token.fecha_registro = func.now()
+        if dispositivo:
+            db_token.dispositivo = dispositivo
+    else:
+        cambio_activos = True
+        db_token = models.TokenFCM(usuario_id=usuario_id, token_fcm=token_fcm, dispositivo=dispositivo)
+        db.add(db_token)
+
+    if cambio_activos:
+        incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
+    db.commit()
+    db.refresh(db_token)
+    if cambio_activos:
+        cache_tokens_operadores.invalidar()
+    return db_token
+
+
+def desactivar_tokens_fcm_por_valor(db: Session, tokens_fcm: List[str]) -> int:
+    """Desactivar en bloque los tokens que FCM reporto como invalidos. Retorna cuantos se desactivaron."""
+    if not tokens_fcm:
+        return 0
+    desactivados = db.query(models.TokenFCM).filter(
+        models.TokenFCM.token_fcm.in_(tokens_fcm),
+        models.TokenFCM.activo == True
+    ).update({models.TokenFCM.activo: False}, synchronize_session=False)
+    if desactivados:
+        incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
+    db.commit()
+    if desactivados:
+        cache_tokens_operadores.invalidar()
+    return desactivados
+
+
 def desactivar_token_fcm(db: Session, token_id: int) -> bool:
     """Desactivar un token FCM."""
     db_token = db.query(models.TokenFCM).filter(models.TokenFCM.token_id == token_id).first()
     if db_token:
         db_token.activo = False
+        incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
         db.commit()
+        cache_tokens_operadores.invalidar()
         return True
     return False
 
 
-def get_tokens_operadores_activos(db: Session) -> List[str]:
-    """Obtener tokens FCM de todos los operadores con sesion activa."""
+def _consultar_tokens_operadores_activos(db: Session) -> tuple:
     tokens = db.query(models.TokenFCM.token_fcm).join(models.Usuario).filter(
         models.Usuario.rol == models.RolUsuarioEnum.operador,
         models.TokenFCM.activo == True
     ).all()
-    return [token[0] for token in tokens]
+    return tuple(token[0] for token in tokens)
+
+
+def get_tokens_operadores_activos(db: Session) -> List[str]:
+    """
+    Obtener tokens FCM de todos los operadores con sesion activa.
+    Usa la lista en cache mientras la version 'tokens_operadores' de la BD no cambie.
+    """
+    tokens = cache_tokens_operadores.obtener(
+        lambda: get_version_cache(db, VERSION_TOKENS_OPERADORES),
+        lambda: _consultar_tokens_operadores_activos(db)
+    )
+    return list(tokens)
 
 
 # OPERACIONES CRUD PARA GESTION DE USUARIOS (ADMIN)
@@ -443,6 +919,8 @@ def update_user(db: Session, usuario_id: int, user_update: schemas.UsuarioUpdate
     if not db_user:
         return None
 
+    nombre_anterior = db_user.nombre_usuario
+
     if user_update.nombre_usuario is not None:
         # Verificar que el nuevo nombre no este en uso
         existing = db.query(models.Usuario).filter(
@@ -463,15 +941,33 @@ def update_user(db: Session, usuario_id: int, user_update: schemas.UsuarioUpdate
             raise ValueError("El correo electronico ya esta en uso")
         db_user.correo_electronico = user_update.correo_electronico
 
+    # Cambiar contraseña o rol invalida los tokens emitidos antes del cambio
+    invalidar_tokens = False
+
     if user_update.password is not None:
-        from app.services.security import hashear_password
-        db_user.hash_contrasena = hashear_password(user_update.password)
+        db_user.hash_contrasena = security.hashear_password(user_update.password)
+        invalidar_tokens = True
+
+    # El cambio de rol agrega o quita los tokens del usuario de la lista de operadores
+    cambio_rol = user_update.rol is not None and db_user.rol != user_update.rol
 
     if user_update.rol is not None:
+        if cambio_rol:
+            invalidar_tokens = True
         db_user.rol = user_update.rol
 
+    if invalidar_tokens:
+        db_user.version_token = (db_user.version_token or 0) + 1
+
+    if cambio_rol:
+        incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
+
     db.commit()
     db.refresh(db_user)
+    security.invalidar_principal(nombre_anterior, db_user.nombre_usuario)
+    security.invalidar_version_token(usuario_id)
+    if cambio_rol:
+        cache_tokens_operadores.invalidar()
     return db_user
 
 
@@ -479,8 +975,14 @@ def delete_user(db: Session, usuario_id: int) -> bool:
     """Eliminar un usuario (solo admin)."""
     db_user = get_user_by_id(db, usuario_id)
     if db_user:
+        nombre_usuario = db_user.nombre_usuario
         db.delete(db_user)
+        # Sus tokens FCM se borran en cascada
+        incrementar_version_cache(db, VERSION_TOKENS_OPERADORES)
         db.commit()
+        security.invalidar_principal(nombre_usuario)
+        security.invalidar_version_token(usuario_id)
+        cache_tokens_operadores.invalidar()
         return True
     return False
 
@@ -564,17 +1066,175 @@ def marcar_token_como_usado(db: Session, token: str) -> bool:
     return False
 
 
-def limpiar_tokens_expirados(db: Session) -> int:
+def eliminar_por_lotes(db: Session, modelo, columna_id, condiciones: list, tam_lote: int = 1000) -> int:
+    """
+    Eliminar filas que cumplan las condiciones en lotes de `tam_lote`, con un commit por lote.
+    Evita transacciones largas y bloqueos sobre tablas grandes.
+    """
+    total = 0
+    while True:
+        ids = [fila[0] for fila in db.query(columna_id).filter(*condiciones).limit(tam_lote).all()]
+        if not ids:
+            break
+        total += db.query(modelo).filter(columna_id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        if len(ids) < tam_lote:
+            break
+    return total
+
+
+def limpiar_tokens_expirados(db: Session, tam_lote: int = 1000) -> int:
     """Eliminar tokens expirados de la base de datos."""
-    from datetime import datetime
+    return eliminar_por_lotes(
+        db,
+        models.PasswordResetToken,
+        models.PasswordResetToken.token_id,
+        [models.PasswordResetToken.fecha_expiracion < datetime.utcnow()],
+        tam_lote
+    )
+
+
+def eliminar_logs_antiguos(db: Session, dias_retencion: int, tam_lote: int = 1000) -> int:
+    """Eliminar logs del sistema con mas de `dias_retencion` dias."""
+    limite = datetime.utcnow() - timedelta(days=dias_retencion)
+    return eliminar_por_lotes(
+        db,
+        models.LogSistema,
+        models.LogSistema.log_id,
+        [models.LogSistema.hora_log < limite],
+        tam_lote
+    )
+
+
+def eliminar_tokens_fcm_inactivos(db: Session, dias_retencion: int, tam_lote: int = 1000) -> int:
+    """Eliminar tokens FCM desactivados registrados hace mas de `dias_retencion` dias."""
+    limite = datetime.utcnow() - timedelta(days=dias_retencion)
+    return eliminar_por_lotes(
+        db,
+        models.TokenFCM,
+        models.TokenFCM.token_id,
+        [models.TokenFCM.activo == False, models.TokenFCM.fecha_registro < limite],
+        tam_lote
+    )
+
+
+def eliminar_notificaciones_antiguas(db: Session, dias_retencion: int, tam_lote: int = 1000) -> int:
+    """Eliminar notificaciones del outbox ya enviadas o fallidas cuyo ultimo intento fue hace mas de `dias_retencion` dias."""
+    limite = datetime.utcnow() - timedelta(days=dias_retencion)
+    return eliminar_por_lotes(
+        db,
+        models.NotificacionOutbox,
+        models.NotificacionOutbox.notificacion_id,
+        [
+            models.NotificacionOutbox.estado.in_([models.EstadoNotificacionEnum.enviada,
+                                                  models.EstadoNotificacionEnum.fallida]),
+            models.NotificacionOutbox.proximo_intento < limite
+        ],
+        tam_lote
+    )
+
+
+# OPERACIONES CRUD PARA EL OUTBOX DE NOTIFICACIONES
+
+def get_notificaciones_pendientes(db: Session, limite: int = 20) -> List[models.NotificacionOutbox]:
+    """
+    Obtener y bloquear notificaciones pendientes cuyo proximo intento ya vencio.
+    Usa SKIP LOCKED para que varios workers no tomen la misma notificacion.
+    """
+    return db.query(models.NotificacionOutbox).filter(
+        models.NotificacionOutbox.estado == models.EstadoNotificacionEnum.pendiente,
+        models.NotificacionOutbox.proximo_intento <= datetime.utcnow()
+    ).order_by(
+        models.NotificacionOutbox.proximo_intento
+    ).limit(limite).with_for_update(skip_locked=True).all()
 
-    tokens_eliminados = db.query(models.PasswordResetToken).filter(
-        models.PasswordResetToken.fecha_expiracion < datetime.utcnow()
-    ).delete()
 
+def get_ultimo_envio_notificacion(db: Session) -> Optional[datetime]:
+    """Hora (UTC) del ultimo envio exitoso de una notificacion del outbox."""
+    return db.query(func.max(models.NotificacionOutbox.fecha_envio)).filter(
+        models.NotificacionOutbox.estado == models.EstadoNotificacionEnum.enviada
+    ).scalar()
+
+
+def get_notificaciones_fallidas(db: Session, skip: int = 0, limit: int = 100) -> List[models.NotificacionOutbox]:
+    """Obtener las notificaciones que agotaron sus reintentos (dead letter)."""
+    return db.query(models.NotificacionOutbox).filter(
+        models.NotificacionOutbox.estado == models.EstadoNotificacionEnum.fallida
+    ).order_by(desc(models.NotificacionOutbox.notificacion_id)).offset(skip).limit(limit).all()
+
+
+def get_notificacion(db: Session, notificacion_id: int) -> Optional[models.NotificacionOutbox]:
+    return db.query(models.NotificacionOutbox).filter(
+        models.NotificacionOutbox.notificacion_id == notificacion_id
+    ).first()
+
+
+def reintentar_notificacion(db: Session, notificacion_id: int) -> Optional[models.NotificacionOutbox]:
+    """
+    Regresar una notificacion fallida a pendiente para enviarla de nuevo.
+    Retorna None si no existe o no esta fallida (una enviada o en cola no se vuelve a enviar).
+    """
+    actualizadas = db.query(models.NotificacionOutbox).filter(
+        models.NotificacionOutbox.notificacion_id == notificacion_id,
+        models.NotificacionOutbox.estado == models.EstadoNotificacionEnum.fallida
+    ).update({
+        models.NotificacionOutbox.estado: models.EstadoNotificacionEnum.pendiente,
+        models.NotificacionOutbox.intentos: 0,
+        models.NotificacionOutbox.proximo_intento: datetime.utcnow()
+    }, synchronize_session=False)
     db.commit()
-    return tokens_eliminados
+    return get_notificacion(db, notificacion_id) if actualizadas else None
 
 
+# OPERACIONES CRUD PARA TRABAJOS DE REPORTE
 
+def create_trabajo_reporte(db: Session, trabajo_id: str, usuario_id: Optional[int], fecha_inicio: Optional[date],
+                           fecha_fin: Optional[date], ttl_segundos: float) -> models.TrabajoReporte:
+    """Registrar un trabajo de reporte pendiente."""
+    ahora = datetime.utcnow()
+    db_trabajo = models.TrabajoReporte(
+        trabajo_id=trabajo_id,
+        usuario_id=usuario_id,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        fecha_creacion=ahora,
+        fecha_expiracion=ahora + timedelta(seconds=ttl_segundos)
+    )
+    db.add(db_trabajo)
+    db.commit()
+    db.refresh(db_trabajo)
+    return db_trabajo
+
+
+def get_trabajo_reporte(db: Session, trabajo_id: str) -> Optional[models.TrabajoReporte]:
+    """Obtener un trabajo de reporte por su ID."""
+    return db.query(models.TrabajoReporte).filter(models.TrabajoReporte.trabajo_id == trabajo_id).first()
+
+
+def actualizar_trabajo_reporte(db: Session, trabajo_id: str, **campos) -> Optional[models.TrabajoReporte]:
+    """Actualizar estado, archivo, error o fechas de un trabajo de reporte."""
+    db_trabajo = get_trabajo_reporte(db, trabajo_id)
+    if db_trabajo:
+        for campo, valor in campos.items():
+            setattr(db_trabajo, campo, valor)
+        db.commit()
+        db.refresh(db_trabajo)
+    return db_trabajo
+
+
+def get_trabajos_reporte_expirados(db: Session, limite: int = 1000) -> List[models.TrabajoReporte]:
+    """Obtener trabajos cuya fecha de expiracion ya paso."""
+    return db.query(models.TrabajoReporte).filter(
+        models.TrabajoReporte.fecha_expiracion < datetime.utcnow()
+    ).limit(limite).all()
 
+
+def eliminar_trabajos_reporte(db: Session, trabajo_ids: List[str]) -> int:
+    """Eliminar registros de trabajos de reporte por ID."""
+    if not trabajo_ids:
+        return 0
+    eliminados = db.query(models.TrabajoReporte).filter(
+        models.TrabajoReporte.trabajo_id.in_(trabajo_ids)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return eliminados
@@ -1,17 +1,16 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-import os
+from app.config import obtener_configuracion
 
-load_dotenv()
+config = obtener_configuracion()
 
 # Obtener las credenciales del archivo .env
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
+DB_USER = config.texto("DB_USER")
+DB_PASSWORD = config.texto("DB_PASSWORD")
+DB_HOST = config.texto("DB_HOST")
+DB_PORT = config.texto("DB_PORT")
+DB_NAME = config.texto("DB_NAME")
 
 
 # crear el motor de la base de datos
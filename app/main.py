@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request
+from app import plantillas
 from app.routes.routers import router as api_router
 from app.routes.publicEndpoints import router as public_router
 from app.routes.routers_optimizado import router as optimizado_router
@@ -7,6 +8,7 @@ from app.routes_hard.privacy_policy import router as privacy_router
 from app.routes_hard.gallery import router as gallery_router
 from app.routes.routers_admin import router as admin_router
 from app.routes_hard.reset_password_web import router as reset_password_router
+from app.services import mantenimiento, outbox_notificaciones, email_service, reportes_trabajos, precarga
 
 import time
 
@@ -29,6 +31,22 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
+@app.on_event("startup")
+def iniciar_tareas_fondo():
+    print(f"Plantillas HTML compiladas: {plantillas.precompilar()}")
+    mantenimiento.iniciar()
+    outbox_notificaciones.iniciar()
+    precarga.iniciar()
+
+
+@app.on_event("shutdown")
+def detener_tareas_fondo():
+    outbox_notificaciones.detener()
+    email_service.detener()
+    reportes_trabajos.detener()
+    mantenimiento.detener()
+
+
 # Registrar los routers
 app.include_router(api_router)
 app.include_router(gallery_router)
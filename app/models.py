@@ -8,7 +8,7 @@ import enum
 
 import enum
 from sqlalchemy import (Column, Integer, String, Float, DateTime, Enum as SQLAlchemyEnum,
-                        ForeignKey, Text, Date, Boolean)
+                        ForeignKey, Text, Date, Boolean, Index)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -37,6 +37,19 @@ class TipoLogEnum(str, enum.Enum):
     advertencia = "advertencia"
     error = "error"
 
+
+class EstadoTrabajoEnum(str, enum.Enum):
+    pendiente = "pendiente"
+    procesando = "procesando"
+    completado = "completado"
+    fallido = "fallido"
+
+
+class EstadoNotificacionEnum(str, enum.Enum):
+    pendiente = "pendiente"
+    enviada = "enviada"
+    fallida = "fallida"  # agoto sus reintentos (dead letter)
+
 # modelos de la base de datos
 
 class Usuario(Base):
@@ -48,6 +61,8 @@ class Usuario(Base):
     correo_electronico = Column(String(100), unique=True, nullable=False)
     hash_contrasena = Column(String(255), nullable=False)
     rol = Column(SQLAlchemyEnum(RolUsuarioEnum), default=RolUsuarioEnum.operador)
+    # Se incrementa al cambiar rol o contraseña para invalidar los tokens emitidos
+    version_token = Column(Integer, default=0, nullable=False)
 
     # Relación: Un usuario puede gestionar muchos eventos.
     eventos = relationship("Evento", back_populates="usuario")
@@ -64,6 +79,9 @@ class Evento(Base):
     fecha_evento = Column(Date, nullable=False, index=True)
     descripcion = Column(Text)
     estatus = Column(SQLAlchemyEnum(EstatusEventoEnum), default=EstatusEventoEnum.pendiente)
+    # Cambia con el evento o al agregarle imagenes / registros de aire (version de datos para caches).
+    # NOW(6): con precision de segundos dos cambios en el mismo segundo darian la misma version
+    fecha_modificacion = Column(DateTime, default=func.now(6), onupdate=func.now(6))
 
     # Llave foránea que conecta con la tabla de usuarios.
     usuario_id = Column(Integer, ForeignKey("usuarios.usuario_id", ondelete="SET NULL"))
@@ -144,10 +162,13 @@ class LogSistema(Base):
 class TokenFCM(Base):
     """Modelo para la tabla 'tokens_fcm'"""
     __tablename__ = "tokens_fcm"
+    __table_args__ = (
+        Index("idx_usuario_dispositivo", "usuario_id", "dispositivo"),
+    )
 
     token_id = Column(Integer, primary_key=True, autoincrement=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.usuario_id", ondelete="CASCADE"))
-    token_fcm = Column(String(255), nullable=False)
+    token_fcm = Column(String(255), nullable=False, index=True)
     dispositivo = Column(String(100))
     fecha_registro = Column(DateTime, default=func.now())
     activo = Column(Boolean, default=True)
@@ -170,3 +191,44 @@ class PasswordResetToken(Base):
     # Relacion con usuario
     usuario = relationship("Usuario", backref="tokens_recuperacion")
 
+
+class NotificacionOutbox(Base):
+    """Modelo para la tabla 'notificaciones_outbox' (notificaciones push pendientes de envio)"""
+    __tablename__ = "notificaciones_outbox"
+    __table_args__ = (
+        Index("idx_estado_proximo_intento", "estado", "proximo_intento"),
+    )
+
+    notificacion_id = Column(Integer, primary_key=True, autoincrement=True)
+    evento_id = Column(Integer, ForeignKey("eventos.evento_id", ondelete="CASCADE"), index=True)
+    tipo = Column(String(50), nullable=False, default="nuevo_evento")
+    estado = Column(SQLAlchemyEnum(EstadoNotificacionEnum), default=EstadoNotificacionEnum.pendiente)
+    intentos = Column(Integer, nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False)
+    ultimo_error = Column(Text)
+    fecha_creacion = Column(DateTime, default=func.now())
+    fecha_envio = Column(DateTime, index=True)
+
+
+class VersionCache(Base):
+    """Modelo para la tabla 'versiones_cache' (contadores para invalidar caches entre workers)"""
+    __tablename__ = "versiones_cache"
+
+    nombre = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class TrabajoReporte(Base):
+    """Modelo para la tabla 'trabajos_reporte' (reportes PDF generados en segundo plano)"""
+    __tablename__ = "trabajos_reporte"
+
+    trabajo_id = Column(String(36), primary_key=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.usuario_id", ondelete="SET NULL"), index=True)
+    estado = Column(SQLAlchemyEnum(EstadoTrabajoEnum), default=EstadoTrabajoEnum.pendiente)
+    fecha_inicio = Column(Date)
+    fecha_fin = Column(Date)
+    ruta_archivo = Column(String(500))
+    error = Column(Text)
+    fecha_creacion = Column(DateTime, nullable=False)
+    fecha_completado = Column(DateTime)
+    fecha_expiracion = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,54 @@
+"""
+Plantillas HTML compiladas (Jinja2) para las paginas renderizadas en el servidor.
+
+Las plantillas viven en app/templates, se compilan una sola vez al iniciar el worker
+(`precompilar`) y se sirven como flujo: el navegador recibe el inicio de la pagina mientras
+el resto se sigue generando. El autoescape esta activo para todo archivo .html.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+from fastapi.responses import StreamingResponse
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from zoneinfo import ZoneInfo
+import os
+
+DIRECTORIO_PLANTILLAS = os.path.join(os.path.dirname(__file__), "templates")
+
+# Fragmentos de salida que se juntan antes de enviar cada bloque al cliente
+PLANTILLAS_BUFFER = 8
+
+ZONA_HORARIA_MEXICO = ZoneInfo("America/Mexico_City")
+
+
+def hora_mexico(hora: Optional[datetime], formato: str = "%H:%M:%S") -> str:
+    """Convierte una hora UTC sin zona a la hora de la Ciudad de Mexico."""
+    if hora is None:
+        return "--:--"
+    return hora.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZONA_HORARIA_MEXICO).strftime(formato)
+
+
+entorno = Environment(
+    loader=FileSystemLoader(DIRECTORIO_PLANTILLAS),
+    autoescape=select_autoescape(["html"]),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    # Las plantillas no cambian con el servidor corriendo: no revisar el archivo en cada render
+    auto_reload=False,
+)
+entorno.filters["hora_mexico"] = hora_mexico
+
+
+def precompilar() -> int:
+    """Compila todas las plantillas y las deja en la cache del entorno; retorna cuantas son."""
+    nombres = [nombre for nombre in entorno.list_templates() if nombre.endswith(".html")]
+    for nombre in nombres:
+        entorno.get_template(nombre)
+    return len(nombres)
+
+
+def respuesta_plantilla(nombre: str, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                        **contexto) -> StreamingResponse:
+    """Renderiza la plantilla como flujo de fragmentos HTML."""
+    flujo = entorno.get_template(nombre).stream(**contexto)
+    flujo.enable_buffering(PLANTILLAS_BUFFER)
+    return StreamingResponse(flujo, status_code=status_code, headers=headers, media_type="text/html")
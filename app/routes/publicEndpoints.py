@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request
+from fastapi.responses import Response
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import timedelta, date
 from typing import Optional
@@ -8,9 +10,13 @@ from app import crud, schemas, models
 from app.database import get_db
 
 from app.services import security
+from app.services.limitador import (aplicar_limites, limitador_login_ip, limitador_login_usuario,
+                                    limitador_recuperacion_ip, limitador_recuperacion_correo)
 from app.services.aire import consumir_api_aire
-from app.services.firebase_notifications import enviar_notificacion_multiple
-from app.services.email_service import enviar_correo_recuperacion
+from app.services import outbox_notificaciones, miniaturas
+from app.services.validacion_http import calcular_etag, encabezados_validacion, respuesta_no_modificado
+from app.services.email_service import encolar_correo_recuperacion
+from app.services.anomalias_aire import procesar_lectura
 
 import secrets
 
@@ -18,23 +24,39 @@ router = APIRouter()
 
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(request: Request, db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
 
-    # 1. Busca el usuario en la base de datos
-    user = crud.get_user_by_username(db, nombre_usuario=form_data.username)
+    # 0. Limitar intentos por IP y por usuario antes de tocar la BD o bcrypt
+    aplicar_limites(
+        (limitador_login_ip, request.client.host if request.client else None),
+        (limitador_login_usuario, form_data.username.lower())
+    )
+
+    # 1. Busca el usuario en la base de datos (fuera del event loop)
+    user = await run_in_threadpool(crud.get_user_by_username, db, nombre_usuario=form_data.username)
 
-    # 2. Verifica si el usuario existe y la contraseña es correcta
-    if not user or not security.verificar_password(form_data.password, user.hash_contrasena):
+    # 2. Verifica si el usuario existe y la contraseña es correcta (bcrypt en su executor)
+    password_valida, nuevo_hash = False, None
+    if user:
+        password_valida, nuevo_hash = await security.verificar_y_actualizar_password_async(
+            form_data.password, user.hash_contrasena
+        )
+
+    if not password_valida:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Nombre de usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Re-hashear con el costo actual si el hash guardado usa uno anterior
+    if nuevo_hash:
+        await run_in_threadpool(crud.actualizar_hash_password, db, user, nuevo_hash)
+
     # 3. Crea el token
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.crear_access_token(
-        data={"sub": user.nombre_usuario}, expires_delta=access_token_expires
+        data=security.claims_usuario(user), expires_delta=access_token_expires
     )
 
     # 4. Devuelve el token
@@ -47,19 +69,10 @@ async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth
 def crear_evento(evento: schemas.EventoCreate, db: Session = Depends(get_db)):
     """Crea un nuevo evento. Requiere autenticacion."""
 
-    # Crear el evento
-    nuevo_evento = crud.create_evento(db=db, evento=evento)
-
-    # Obtener tokens FCM de todos los operadores activos
-    tokens_operadores = crud.get_tokens_operadores_activos(db)
-
-    # Enviar notificaciones a todos los operadores
-    if tokens_operadores:
-        try:
-            enviar_notificacion_multiple(tokens_operadores, nuevo_evento.evento_id)
-        except Exception as e:
-            print(f"Error al enviar notificaciones push: {e}")
-            # No fallar la creacion del evento si las notificaciones fallan
+    # El evento y su notificacion push se guardan en la misma transaccion;
+    # el despachador del outbox la envia en segundo plano
+    nuevo_evento = crud.create_evento_con_notificacion(db=db, evento=evento)
+    outbox_notificaciones.despertar()
 
     return nuevo_evento
 
@@ -67,8 +80,16 @@ def crear_evento(evento: schemas.EventoCreate, db: Session = Depends(get_db)):
 # ENDPOINTS DE LOGS
 
 @router.get("/logs", response_model=list[schemas.LogSistema])
-def listar_logs(fecha: Optional[date] = Query(default=None), tipo: Optional[models.TipoLogEnum] = Query(default=None), db: Session = Depends(get_db)):
+def listar_logs(request: Request, response: Response, fecha: Optional[date] = Query(default=None), tipo: Optional[models.TipoLogEnum] = Query(default=None), db: Session = Depends(get_db)):
     """ Obtiene una lista de logs del sistema con filtros opcionales por fecha y tipo. """
+    # Responde 304 si no hay logs nuevos desde la version que tiene el cliente (ETag / Last-Modified)
+    total, ultimo_id, ultima_hora = crud.get_version_logs(db, fecha_log=fecha, tipo_log=tipo)
+    etag = calcular_etag("logs", fecha, tipo.value if tipo else None, total, ultimo_id)
+    no_modificado = respuesta_no_modificado(request, etag, ultima_hora)
+    if no_modificado:
+        return no_modificado
+
+    response.headers.update(encabezados_validacion(etag, ultima_hora))
     return crud.get_logs(db=db, fecha_log=fecha, tipo_log=tipo)
 
 
@@ -77,7 +98,8 @@ def listar_logs(fecha: Optional[date] = Query(default=None), tipo: Optional[mode
 # ENDPOINT COMBINADO para Imagen y Detecciones
 
 @router.post("/eventos/{evento_id}/imagenes", response_model=schemas.Imagen, status_code=status.HTTP_201_CREATED)
-def agregar_imagen_con_detecciones(evento_id: int, data: schemas.ImagenConDetecciones, db: Session = Depends(get_db)):
+def agregar_imagen_con_detecciones(evento_id: int, data: schemas.ImagenConDetecciones, background_tasks: BackgroundTasks,
+                                   db: Session = Depends(get_db)):
     """
     Añade una nueva imagen a un evento, junto con todas sus detecciones.
     """
@@ -86,6 +108,7 @@ def agregar_imagen_con_detecciones(evento_id: int, data: schemas.ImagenConDetecc
         raise HTTPException(status_code=404, detail="Evento no encontrado.")
 
     datos_aire = consumir_api_aire()
+    registro_aire = None
 
     if datos_aire.descrip != "error":
         # Creamos un nuevo registro de calidad del aire asociado al evento
@@ -101,14 +124,56 @@ def agregar_imagen_con_detecciones(evento_id: int, data: schemas.ImagenConDetecc
             hora_medicion=datos_aire.hora_medicion,
             tipo=schemas.TipoMedicionEnum.durante
         )
-        crud.create_calidad_aire(db, registro=calidad_aire_data)
+        registro_aire = crud.create_calidad_aire(db, registro=calidad_aire_data)
 
         crud.create_log(db, log=schemas.LogSistemaCreate(
             nivel="INFO",
             mensaje=f"Se agrega imagen y detecciones, evento: {evento_id}, calidad de aire: {calidad_aire_data.model_dump_json(indent=4)}"
         ))
 
-    return crud.create_imagen_con_detecciones(db, evento_id=evento_id, imagen=data.imagen, detecciones=data.detecciones)
+    db_imagen = crud.create_imagen_con_detecciones(db, evento_id=evento_id, imagen=data.imagen, detecciones=data.detecciones)
+
+    # Las miniaturas se generan despues de responder, asi la galeria no espera la primera vez
+    if miniaturas.MINIATURAS_PREGENERAR:
+        background_tasks.add_task(miniaturas.pregenerar, db_imagen.ruta_imagen)
+
+    # Evaluar la lectura despues de guardar la imagen para que cuente como evento de imagen
+    if registro_aire is not None:
+        procesar_lectura(db, registro_aire)
+
+    return db_imagen
+
+
+# ENDPOINTS DE MINIATURAS
+
+@router.get("/miniaturas/{imagen_id}")
+def obtener_miniatura_imagen(request: Request, imagen_id: int, formato: Optional[str] = Query(default=None),
+                             v: Optional[str] = Query(default=None), db: Session = Depends(get_db)):
+    """
+    Miniatura de una imagen (webp o jpeg); se genera la primera vez que se pide.
+    Sin `formato` se elige segun el encabezado Accept del cliente. Solo las URLs con la version
+    vigente de las miniaturas (`v`, ver url_miniatura) se marcan como inmutables.
+    """
+    if formato is not None and formato not in miniaturas.FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato no soportado, usa webp o jpeg.")
+
+    ruta_imagen = crud.get_ruta_imagen(db, imagen_id)
+    if ruta_imagen is None:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada.")
+    if not miniaturas.origen_permitido(ruta_imagen):
+        raise HTTPException(status_code=404, detail="La imagen no tiene miniatura.")
+
+    formato_elegido = formato or miniaturas.formato_para(request.headers.get("accept"))
+    try:
+        contenido = miniaturas.obtener_miniatura(ruta_imagen, formato_elegido)
+    except Exception as e:
+        print(f"Error al generar la miniatura de la imagen {imagen_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="No se pudo generar la miniatura.")
+
+    headers = {"Cache-Control": miniaturas.cache_control_para(v)}
+    if formato is None:
+        headers["Vary"] = "Accept"
+    return Response(content=contenido, media_type=miniaturas.FORMATOS[formato_elegido][1], headers=headers)
 
 
 # ENDPOINTS DE LOGS
@@ -121,11 +186,16 @@ def crear_log(log: schemas.LogSistemaCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/auth/forgot-password")
-async def solicitar_recuperacion_password( solicitud: schemas.SolicitudRecuperacionPassword, db: Session = Depends(get_db) ):
+def solicitar_recuperacion_password( solicitud: schemas.SolicitudRecuperacionPassword, request: Request, db: Session = Depends(get_db) ):
     """
     Solicitar recuperacion de contraseña.
     Envia un correo con un enlace para restablecer la contraseña.
     """
+    aplicar_limites(
+        (limitador_recuperacion_ip, request.client.host if request.client else None),
+        (limitador_recuperacion_correo, solicitud.correo_electronico.lower())
+    )
+
     print(f"Solicitud de recuperacion de contraseña para correo: {solicitud.correo_electronico}")
 
     # Buscar usuario por correo
@@ -148,16 +218,16 @@ async def solicitar_recuperacion_password( solicitud: schemas.SolicitudRecuperac
     crud.crear_token_recuperacion(db, usuario.usuario_id, token, minutos_expiracion=30)
 
     print(f"se enviara correo a: {usuario.correo_electronico}")
-    # Enviar correo
-    correo_enviado = enviar_correo_recuperacion(
+    # Encolar correo: el envio (y sus reintentos) ocurre en segundo plano
+    correo_encolado = encolar_correo_recuperacion(
         email_destino=usuario.correo_electronico,
         nombre_usuario=usuario.nombre_usuario,
         token=token
     )
 
-    if not correo_enviado:
+    if not correo_encolado:
         # Log del error pero no revelar al usuario
-        print(f"Error al enviar correo a {usuario.correo_electronico}")
+        print(f"Error al encolar correo a {usuario.correo_electronico}")
 
     # Crear log del sistema
     crud.create_log(db, log=schemas.LogSistemaCreate(
@@ -204,8 +274,8 @@ async def restablecer_password(datos: schemas.RestablecerPassword, db: Session =
         )
 
     # Actualizar contraseña
-    nueva_password_hash = security.hashear_password(datos.nueva_password)
-    usuario.hash_contrasena = nueva_password_hash
+    nueva_password_hash = await security.hashear_password_async(datos.nueva_password)
+    crud.cambiar_password_usuario(db, usuario, nueva_password_hash)
 
     # Marcar token como usado
     crud.marcar_token_como_usado(db, datos.token)
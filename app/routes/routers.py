@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
 from app import crud, schemas, models
 from app.services import security
 from app.database import get_db
+from app.services.anomalias_aire import procesar_lectura
 from datetime import date
 
 router = APIRouter(
-    dependencies=[Depends(security.get_current_user)]
+    dependencies=[Depends(security.get_principal_token)]
 )
 
 
@@ -16,7 +16,7 @@ router = APIRouter(
 
 
 @router.get("/usuarios/me", response_model=schemas.Usuario)
-def read_users_me(current_user: models.Usuario = Depends(security.get_current_user)):
+def read_users_me(current_user: schemas.Usuario = Depends(security.get_current_user)):
     """ Devuelve la información del usuario actualmente autenticado. """
     return current_user
 
@@ -46,8 +46,8 @@ def obtener_evento(evento_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/eventos/{evento_id}/status", response_model=schemas.Evento)
-def actualizar_estatus_evento(evento_id: int, estatus: models.EstatusEventoEnum, db: Session = Depends(get_db), current_user: models.Usuario = Depends(
-    security.get_current_user)):
+def actualizar_estatus_evento(evento_id: int, estatus: models.EstatusEventoEnum, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(
+    security.get_principal_token)):
     """ Confirma o descarta un evento, asignando al usuario actual como el que realizó la acción. """
     update_data = schemas.EventoUpdate(estatus=estatus, usuario_id=current_user.usuario_id)
     db_evento = crud.update_evento(db, evento_id=evento_id, evento_update=update_data)
@@ -75,7 +75,9 @@ def agregar_medicion_calidad_aire(evento_id: int, medicion: schemas.CalidadAireB
 
     # Creamos el objeto completo para la función crud
     medicion_data = schemas.CalidadAireCreate(evento_id=evento_id, **medicion.model_dump())
-    return crud.create_calidad_aire(db, registro=medicion_data)
+    db_registro = crud.create_calidad_aire(db, registro=medicion_data)
+    procesar_lectura(db, db_registro)
+    return db_registro
 
 
 @router.patch("/calidad-aire/{registro_id}/tipo", response_model=schemas.CalidadAire)
@@ -99,36 +101,16 @@ def actualizar_tipo_de_medicion( registro_id: int, nuevo_tipo: schemas.TipoMedic
 # ENDPOINTS DE TOKEN FCM
 
 @router.post("/registrar-token-fcm", response_model=schemas.TokenFCM, status_code=status.HTTP_201_CREATED)
-def registrar_token_fcm(token_data: schemas.TokenFCMRegistro, db: Session = Depends(get_db), current_user: models.Usuario = Depends(
-    security.get_current_user)):
-    """Registra el token FCM del dispositivo del usuario autenticado."""
-
-    # Verificar si el token ya existe para este usuario
-    token_existente = crud.get_token_fcm_existente(
+def registrar_token_fcm(token_data: schemas.TokenFCMRegistro, db: Session = Depends(get_db), current_user: schemas.TokenData = Depends(
+    security.get_principal_token)):
+    """Registra el token FCM del dispositivo del usuario autenticado (uno activo por dispositivo)."""
+    return crud.registrar_token_fcm(
         db,
-        usuario_id=current_user.usuario_id,
-        token_fcm=token_data.token_fcm
-    )
-
-    if token_existente:
-        # Si ya existe, solo actualizamos la fecha y lo activamos
-        token_existente.activo = True
-        token_existente.fecha_registro = func.now()
-        if token_data.dispositivo:
-            token_existente.dispositivo = token_data.dispositivo
-        db.commit()
-        db.refresh(token_existente)
-        return token_existente
-
-    # Crear nuevo token
-    nuevo_token = schemas.TokenFCMCreate(
         usuario_id=current_user.usuario_id,
         token_fcm=token_data.token_fcm,
         dispositivo=token_data.dispositivo
     )
 
-    return crud.create_token_fcm(db=db, token=nuevo_token)
-
 
 @router.delete("/desactivar-token-fcm/{token_id}", status_code=status.HTTP_204_NO_CONTENT)
 def desactivar_token(token_id: int, db: Session = Depends(get_db)):
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import io
+import os
 
-from fastapi.responses import FileResponse
-from app.services.reportes_pdf import generar_reporte_pdf
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from datetime import date as date_type, datetime
 
 from app import crud, schemas, models
 from app.services import security
+from app.services.backfill_aire import importar_historico
+from app.services.limitador import obtener_metricas_limitadores
+from app.services import mantenimiento, outbox_notificaciones, email_service, reportes_trabajos, precarga, miniaturas
+from app.services.reportes_trabajos import abrir_reporte, iterar_bloques
 from app.database import get_db
+from app.config import obtener_configuracion
 
+config = obtener_configuracion()
+
+
+# Comprimir la descarga de reportes con gzip cuando el cliente lo acepte
+REPORTES_GZIP = config.booleano("REPORTES_GZIP", True)
 
 
 router = APIRouter(
@@ -21,7 +33,8 @@ router = APIRouter(
 
 
 @router.get("/reportes/generar-pdf")
-def generar_reporte_pdf_endpoint(
+async def generar_reporte_pdf_endpoint(
+        request: Request,
         fecha_inicio: Optional[date_type] = Query(None),
         fecha_fin: Optional[date_type] = Query(None),
         db: Session = Depends(get_db)
@@ -34,72 +47,130 @@ def generar_reporte_pdf_endpoint(
     - fecha_fin: Fecha fin del periodo (YYYY-MM-DD)
 
     Si no se especifican fechas, se generara un reporte con todos los eventos.
+    El PDF se genera en el pool de reportes; responde 429 si hay demasiados en proceso.
     """
 
-    # Obtener estadisticas
-    fecha_inicio_str = fecha_inicio.strftime("%Y-%m-%d") if fecha_inicio else None
-    fecha_fin_str = fecha_fin.strftime("%Y-%m-%d") if fecha_fin else None
-
-    estadisticas = crud.get_estadisticas_eventos(db, fecha_inicio, fecha_fin)
-
-    # Obtener eventos con filtro de fechas
-    filtros = schemas.EventosFiltros(
-        fecha_inicio=fecha_inicio_str,
-        fecha_fin=fecha_fin_str,
-        skip=0,
-        limit=500  # Maximo 500 eventos en el reporte
-    )
-
-    eventos_db, total = crud.get_eventos_optimizado(db, filtros)
-
-    # Convertir eventos a dict con campos calculados
-    eventos_list = []
-    for evento in eventos_db:
-        campos_calculados = crud.calcular_campos_evento(evento, incluir_todas_imagenes=False)
-
-        evento_dict = {
-            "evento_id": evento.evento_id,
-            "fecha_evento": evento.fecha_evento.strftime("%d/%m/%Y"),
-            "descripcion": evento.descripcion,
-            "estatus": evento.estatus.value,
-            "usuario_id": evento.usuario_id,
-            "usuario": {
-                "nombre_usuario": evento.usuario.nombre_usuario if evento.usuario else None
-            },
-            **campos_calculados
-        }
-        eventos_list.append(evento_dict)
-
     # Generar nombre del archivo
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"reporte_thermal_monitoring_{timestamp}.pdf"
-    output_path = f"/tmp/{filename}"
 
-    # Generar PDF
+    # Generar PDF en el pool de procesos (o reutilizarlo de la cache si los datos del periodo no cambiaron)
     try:
-        generar_reporte_pdf(
-            estadisticas=estadisticas,
-            eventos=eventos_list,
-            fecha_inicio=fecha_inicio_str,
-            fecha_fin=fecha_fin_str,
-            output_path=output_path
-        )
-
-        # Devolver el archivo PDF
-        return FileResponse(
-            path=output_path,
-            media_type='application/pdf',
-            filename=filename,
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
-        )
+        archivo = await abrir_reporte(db, fecha_inicio, fecha_fin)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al generar el reporte: {str(e)}"
         )
 
+    return _respuesta_pdf(request, archivo, filename)
+
+
+def _respuesta_pdf(request: Request, archivo, filename: str) -> StreamingResponse:
+    """Envia un PDF abierto por bloques (gzip si el cliente lo acepta) y lo cierra al terminar."""
+    comprimir = REPORTES_GZIP and "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    if comprimir:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    else:
+        archivo.seek(0, os.SEEK_END)
+        headers["Content-Length"] = str(archivo.tell())
+        archivo.seek(0)
+
+    return StreamingResponse(
+        iterar_bloques(archivo, comprimir=comprimir),
+        media_type='application/pdf',
+        headers=headers,
+        background=BackgroundTask(archivo.close)
+    )
+
+
+@router.post("/reportes/trabajos", response_model=schemas.TrabajoReporte, status_code=status.HTTP_202_ACCEPTED)
+def crear_trabajo_reporte(
+        fecha_inicio: Optional[date_type] = Query(None),
+        fecha_fin: Optional[date_type] = Query(None),
+        db: Session = Depends(get_db),
+        principal: schemas.TokenData = Depends(security.get_principal_token)
+):
+    """
+    Encola la generacion de un reporte PDF y retorna el trabajo.
+    Consultar /admin/reportes/trabajos/{trabajo_id} hasta que el estado sea 'completado'.
+    """
+    return reportes_trabajos.encolar_reporte(db, principal.usuario_id, fecha_inicio, fecha_fin)
+
+
+@router.get("/reportes/trabajos/{trabajo_id}", response_model=schemas.TrabajoReporte)
+def consultar_trabajo_reporte(trabajo_id: str, db: Session = Depends(get_db)):
+    """Consultar el estado de un trabajo de reporte."""
+    trabajo = crud.get_trabajo_reporte(db, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado o expirado")
+    return trabajo
+
+
+@router.get("/reportes/trabajos/{trabajo_id}/descargar")
+def descargar_trabajo_reporte(trabajo_id: str, request: Request, db: Session = Depends(get_db)):
+    """Descargar el PDF de un trabajo completado."""
+    trabajo = crud.get_trabajo_reporte(db, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Trabajo no encontrado o expirado")
+
+    if trabajo.estado != models.EstadoTrabajoEnum.completado:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"El reporte no esta listo (estado: {trabajo.estado.value})"
+        )
+
+    try:
+        archivo = open(trabajo.ruta_archivo, "rb") if trabajo.ruta_archivo else None
+    except FileNotFoundError:
+        archivo = None
+    if archivo is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="El archivo del reporte ya no existe")
+
+    filename = f"reporte_thermal_monitoring_{trabajo.fecha_creacion.strftime('%Y%m%d_%H%M%S')}.pdf"
+    return _respuesta_pdf(request, archivo, filename)
+
+
+@router.get("/metricas")
+def obtener_metricas():
+    """Metricas internas del servidor (executor de contraseñas, caches, limitadores, mantenimiento, notificaciones, correos, reportes, miniaturas y precarga)."""
+    return {
+        "hash_password": security.obtener_metricas_hash(),
+        "cache_principales": security.cache_principales.metricas(),
+        "cache_versiones_token": security.cache_versiones_token.metricas(),
+        "limitadores": obtener_metricas_limitadores(),
+        "mantenimiento": mantenimiento.obtener_estado(),
+        "notificaciones": outbox_notificaciones.obtener_metricas(),
+        "cache_tokens_operadores": crud.cache_tokens_operadores.metricas(),
+        "correos": email_service.obtener_metricas(),
+        "reportes": reportes_trabajos.obtener_metricas(),
+        "cache_miniaturas": miniaturas.cache_miniaturas.metricas(),
+        "precarga": precarga.obtener_estado()
+    }
+
+
+@router.get("/notificaciones/fallidas", response_model=List[schemas.NotificacionOutbox])
+def listar_notificaciones_fallidas(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Listar las notificaciones push que agotaron sus reintentos."""
+    return crud.get_notificaciones_fallidas(db, skip=skip, limit=limit)
+
+
+@router.post("/notificaciones/{notificacion_id}/reintentar", response_model=schemas.NotificacionOutbox)
+def reintentar_notificacion(notificacion_id: int, db: Session = Depends(get_db)):
+    """Regresar una notificacion fallida a la cola de envio."""
+    notificacion = crud.reintentar_notificacion(db, notificacion_id)
+    if notificacion is None:
+        if crud.get_notificacion(db, notificacion_id) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificacion no encontrada")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Solo se pueden reintentar notificaciones fallidas")
+    outbox_notificaciones.despertar()
+    return notificacion
+
 
 @router.get("/usuarios", response_model=List[schemas.UsuarioListaAdmin])
 def listar_todos_usuarios(db: Session = Depends(get_db)):
@@ -162,7 +233,7 @@ def actualizar_usuario(
 def eliminar_usuario(
         usuario_id: int,
         db: Session = Depends(get_db),
-        current_user: models.Usuario = Depends(security.get_current_user)
+        current_user: schemas.TokenData = Depends(security.get_principal_token)
 ):
     """Eliminar un usuario del sistema."""
     # No permitir que el admin se elimine a si mismo
@@ -196,3 +267,31 @@ def obtener_usuario(
     return db_user
 
 
+@router.post("/calidad-aire/backfill")
+def importar_historico_calidad_aire(
+        archivo: UploadFile = File(...),
+        tam_lote: int = Query(5000, ge=100, le=50000),
+        db: Session = Depends(get_db)
+):
+    """
+    Importa un archivo JSON de historicos exportado de WeatherLink a calidad_aire.
+    Las lecturas se asocian a los eventos que se traslapan en tiempo y se insertan por lotes.
+    """
+    texto = io.TextIOWrapper(archivo.file, encoding="utf-8")
+    try:
+        resultado = importar_historico(db, texto, tam_lote=tam_lote)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error al importar el archivo: {str(e)}"
+        )
+    finally:
+        texto.detach()
+
+    crud.create_log(db, log=schemas.LogSistemaCreate(
+        tipo=models.TipoLogEnum.info,
+        mensaje=f"Importacion de historicos de calidad del aire ({archivo.filename}): "
+                f"{resultado['insertados']} registros insertados de {resultado['leidos']}"
+    ))
+
+    return resultado
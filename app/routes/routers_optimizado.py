@@ -1,14 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import Optional, List
 from datetime import date
 
 from app import crud, schemas, models
-from app.services import security
+from app.services import security, miniaturas
+from app.services.validacion_http import calcular_etag, encabezados_validacion, respuesta_no_modificado
 from app.database import get_db
 
 router = APIRouter(
-    dependencies=[Depends(security.get_current_user)]
+    dependencies=[Depends(security.get_principal_token)]
 )
 
 
@@ -28,6 +29,8 @@ def obtener_estadisticas_eventos(
 
 @router.get("/eventosfront/optimizado", response_model=List[schemas.EventoOptimizado])
 def listar_eventos_optimizado(
+        request: Request,
+        response: Response,
         estatus: Optional[models.EstatusEventoEnum] = Query(None),
         usuario_id: Optional[int] = Query(None),
         fecha_inicio: Optional[date] = Query(None),
@@ -56,6 +59,15 @@ def listar_eventos_optimizado(
         #limit=limit
     )
 
+    # Si los eventos filtrados no cambiaron desde la ultima consulta del cliente: 304 sin cargarlos
+    total, suma_ids, ultima_modificacion = crud.get_version_eventos(db, crud.condiciones_eventos_optimizado(filtros))
+    etag = calcular_etag("eventos_optimizado", filtros.model_dump_json(), total, suma_ids, ultima_modificacion,
+                         miniaturas.VERSION_VARIANTE)
+    no_modificado = respuesta_no_modificado(request, etag, ultima_modificacion, privado=True)
+    if no_modificado:
+        return no_modificado
+    response.headers.update(encabezados_validacion(etag, ultima_modificacion, privado=True))
+
     eventos, total_count = crud.get_eventos_optimizado(db, filtros)
 
     # Construir respuesta con campos calculados (sin todas las imagenes)
@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, date
 from typing import Optional, List
-from app.models import RolUsuarioEnum, EstatusEventoEnum, TipoMedicionEnum, TipoLogEnum
+from app.models import (RolUsuarioEnum, EstatusEventoEnum, TipoMedicionEnum, TipoLogEnum, EstadoNotificacionEnum,
+                        EstadoTrabajoEnum)
 
 
 
@@ -172,6 +173,8 @@ class EventoOptimizado(BaseModel):
 
     # Solo la imagen con mas detecciones para preview
     imagen_preview: Optional[Imagen] = None
+    # URL versionada de la miniatura de la imagen preview (ver /miniaturas/{imagen_id})
+    miniatura_preview: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -239,6 +242,9 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     """Schema para los datos contenidos dentro de un token JWT (payload)."""
     nombre_usuario: Optional[str] = None
+    usuario_id: Optional[int] = None
+    rol: Optional[RolUsuarioEnum] = None
+    version_token: Optional[int] = None
 
 
 class UsuarioLogin(BaseModel):
@@ -280,6 +286,7 @@ class TokenFCM(TokenFCMBase):
 class TokenFCMRegistro(BaseModel):
     """Schema para registrar token desde la app."""
     token_fcm: str
+    # Identifica el telefono: sin el, los tokens viejos del mismo dispositivo no se desactivan
     dispositivo: Optional[str] = None
 
 
@@ -340,3 +347,37 @@ class RestablecerPasswordResponse(BaseModel):
     exito: bool
     mensaje: str
 
+
+# ESQUEMAS PARA EL OUTBOX DE NOTIFICACIONES
+
+class NotificacionOutbox(BaseModel):
+    """Schema para leer una notificacion del outbox."""
+    notificacion_id: int
+    evento_id: Optional[int] = None
+    tipo: str
+    estado: EstadoNotificacionEnum
+    intentos: int
+    proximo_intento: datetime
+    ultimo_error: Optional[str] = None
+    fecha_creacion: Optional[datetime] = None
+    fecha_envio: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+# ESQUEMAS PARA TRABAJOS DE REPORTE
+
+class TrabajoReporte(BaseModel):
+    """Schema para consultar el estado de un trabajo de reporte PDF."""
+    trabajo_id: str
+    estado: EstadoTrabajoEnum
+    fecha_inicio: Optional[date] = None
+    fecha_fin: Optional[date] = None
+    error: Optional[str] = None
+    fecha_creacion: datetime
+    fecha_completado: Optional[datetime] = None
+    fecha_expiracion: datetime
+
+    class Config:
+        from_attributes = True
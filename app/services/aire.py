@@ -1,12 +1,10 @@
-import requests
 import json
 import datetime
-from dotenv import load_dotenv
-import os
 from pydantic import BaseModel
 from enum import Enum
 
 from app.schemas import CalidadAireBase
+from app.config import obtener_configuracion
 
 
 def retornar_error_general(mensaje: str) -> CalidadAireBase:
@@ -24,18 +22,46 @@ def retornar_error_general(mensaje: str) -> CalidadAireBase:
     )
 
 
+# Sensores de calidad del aire de la estacion
+LSIDS_AIRE = (794536, 794537)
+TIPOS_SENSOR_AIRE = (323, 326)
+
+
+def mapear_datos_sensor(datosSensor: dict) -> dict:
+    """
+    Mapear una lectura de sensor de WeatherLink a los campos de CalidadAireBase.
+    Compartido por la consulta en vivo y la importacion de historicos.
+    """
+    tsLectura = datosSensor.get('ts', 0)
+    horaLectura = datetime.datetime.fromtimestamp(tsLectura)
+
+    return {
+        'temp': datosSensor.get('temp'),
+        'humedad': datosSensor.get('hum'),
+        'pm1p0': datosSensor.get('pm_1'),   # API 'pm_1' -> Schema 'pm1p0'
+        'pm2p5': datosSensor.get('pm_2p5'), # API 'pm_2p5' -> Schema 'pm2p5'
+        'pm10': datosSensor.get('pm_10'),  # API 'pm_10' -> Schema 'pm10'
+        'aqi': datosSensor.get('aqi_val'),  # API 'aqi_val' -> Schema 'aqi'
+        'descrip': datosSensor.get('aqi_desc'), # API 'aqi_desc' -> Schema 'descrip'
+        'hora_medicion': horaLectura
+    }
+
+
 def consumir_api_aire() -> CalidadAireBase:
     """
     Consumir la API de WeatherLink y retornar un schema CalidadAireBase.
     Retorna None si hay un error o no se encuentran datos.
     """
 
+    # Import diferido: requests solo se carga cuando se consulta la estacion
+    import requests
+
     # TODO: manejar errores
-    load_dotenv()
+    config = obtener_configuracion()
 
-    apikey = os.getenv("API_KEY")
-    XApiSecret = os.getenv("X_API_SECRET")
-    id_station = os.getenv("ID_STATION")
+    apikey = config.texto("API_KEY")
+    XApiSecret = config.texto("X_API_SECRET")
+    id_station = config.texto("ID_STATION")
 
     urlApi = f"https://api.weatherlink.com/v2/current/{id_station}?api-key={apikey}"
 
@@ -57,27 +83,14 @@ def consumir_api_aire() -> CalidadAireBase:
             lsid = sensor.get('lsid')
             tipoSensor = sensor.get('sensor_type')
 
-            if lsid == 794536 or lsid == 794537:
+            if lsid in LSIDS_AIRE:
 
                 if sensor.get('data'):
 
-                    if tipoSensor == 323 or tipoSensor == 326:
+                    if tipoSensor in TIPOS_SENSOR_AIRE:
 
                         datosSensor = sensor['data'][0]
-                        tsLectura = datosSensor.get('ts', 0)
-                        horaLectura = datetime.datetime.fromtimestamp(tsLectura)
-
-                        datosParaSchema = {
-                            'temp': datosSensor.get('temp'),
-                            'humedad': datosSensor.get('hum'),
-                            'pm1p0': datosSensor.get('pm_1'),   # API 'pm_1' -> Schema 'pm1p0'
-                            'pm2p5': datosSensor.get('pm_2p5'), # API 'pm_2p5' -> Schema 'pm2p5'
-                            'pm10': datosSensor.get('pm_10'),  # API 'pm_10' -> Schema 'pm10'
-                            'aqi': datosSensor.get('aqi_val'),  # API 'aqi_val' -> Schema 'aqi'
-                            'descrip': datosSensor.get('aqi_desc'), # API 'aqi_desc' -> Schema 'descrip'
-                            'hora_medicion': horaLectura
-
-                        }
+                        datosParaSchema = mapear_datos_sensor(datosSensor)
 
                         schemaCalidadAire = CalidadAireBase(**datosParaSchema)
 
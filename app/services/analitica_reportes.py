@@ -0,0 +1,84 @@
+"""
+Analitica del reporte PDF calculada con NumPy.
+
+Recibe resultados de consultas agregadas (una fila por grupo o por evento, nunca objetos ORM)
+y los convierte en arreglos para obtener conteos, percentiles e histogramas sin ciclos en Python.
+Todo se retorna en tipos basicos para poder enviarlo a los procesos de graficas y serializarlo.
+"""
+from typing import List, Optional, Sequence
+import numpy as np
+
+DIAS_SEMANA = ('Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom')
+PARAMETROS_AIRE = ('pm10', 'pm2p5', 'pm1p0')
+PERCENTILES = (10, 25, 50, 75, 90)
+# Limites (en minutos) de los intervalos del histograma de duracion de eventos
+LIMITES_DURACION_MIN = (0, 1, 5, 15, 30, 60, 120)
+
+
+def matriz_detecciones(filas: Sequence[tuple]) -> np.ndarray:
+    """Matriz 7x24 (dia de la semana x hora) a partir de filas (dia 0=lunes, hora, total)."""
+    matriz = np.zeros((7, 24), dtype=np.int64)
+    if len(filas):
+        datos = np.asarray(filas, dtype=np.int64)
+        np.add.at(matriz, (datos[:, 0], datos[:, 1]), datos[:, 2])
+    return matriz
+
+
+def resumen_valores(valores: np.ndarray) -> Optional[dict]:
+    """Promedio, maximo y minimo ignorando NaN; None si no hay valores."""
+    valores = valores[~np.isnan(valores)]
+    if valores.size == 0:
+        return None
+    return {"promedio": float(valores.mean()), "maximo": float(valores.max()), "minimo": float(valores.min())}
+
+
+def bandas_percentiles(valores: np.ndarray) -> Optional[dict]:
+    """Percentiles 10/25/50/75/90 ignorando NaN; None si no hay valores."""
+    valores = valores[~np.isnan(valores)]
+    if valores.size == 0:
+        return None
+    bandas = np.percentile(valores, PERCENTILES)
+    resultado = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, bandas)}
+    resultado["eventos"] = int(valores.size)
+    return resultado
+
+
+def histograma_duraciones(segundos: Sequence[float]) -> dict:
+    """Eventos por intervalo de duracion (minutos), con mediana y percentil 90."""
+    minutos = np.asarray(segundos, dtype=float) / 60
+    limites = np.array(LIMITES_DURACION_MIN + (np.inf,))
+    conteos, _ = np.histogram(minutos, bins=limites)
+
+    etiquetas = [f"{a}-{b}" for a, b in zip(LIMITES_DURACION_MIN, LIMITES_DURACION_MIN[1:])]
+    etiquetas.append(f"{LIMITES_DURACION_MIN[-1]}+")
+
+    return {
+        "etiquetas": etiquetas,
+        "conteos": conteos.tolist(),
+        "mediana_min": round(float(np.median(minutos)), 1) if minutos.size else None,
+        "p90_min": round(float(np.percentile(minutos, 90)), 1) if minutos.size else None,
+    }
+
+
+def arreglo_promedios_aire(filas: Sequence[tuple]) -> np.ndarray:
+    """Arreglo (eventos x 3) de promedios PM10, PM2.5, PM1.0; los NULL quedan como NaN."""
+    return np.array(filas, dtype=float).reshape(-1, len(PARAMETROS_AIRE))
+
+
+def calcular_analitica(detecciones_hora_dia: List[tuple], promedios_aire: List[tuple],
+                       duraciones_s: List[float]) -> dict:
+    """
+    Reune la analitica del reporte:
+    detecciones por hora y por dia de la semana, resumen y percentiles de PM por evento
+    e histograma de duracion de eventos.
+    """
+    matriz = matriz_detecciones(detecciones_hora_dia)
+    aire = arreglo_promedios_aire(promedios_aire)
+
+    return {
+        "detecciones_por_hora": matriz.sum(axis=0).tolist(),
+        "detecciones_por_dia": matriz.sum(axis=1).tolist(),
+        "calidad_aire": {clave: resumen_valores(aire[:, i]) for i, clave in enumerate(PARAMETROS_AIRE)},
+        "percentiles_aire": {clave: bandas_percentiles(aire[:, i]) for i, clave in enumerate(PARAMETROS_AIRE)},
+        "duraciones": histograma_duraciones(duraciones_s),
+    }
@@ -0,0 +1,130 @@
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+import math
+import threading
+
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+# Configuracion del detector (variables de entorno opcionales)
+ANOMALIA_VENTANA = config.entero("ANOMALIA_PM25_VENTANA", 60)
+ANOMALIA_MIN_MUESTRAS = config.entero("ANOMALIA_PM25_MIN_MUESTRAS", 10)
+ANOMALIA_UMBRAL_Z = config.decimal("ANOMALIA_PM25_UMBRAL_Z", 3.0)
+ANOMALIA_MARGEN_IMAGEN_MIN = config.entero("ANOMALIA_PM25_MARGEN_IMAGEN_MIN", 10)
+ANOMALIA_ENFRIAMIENTO_MIN = config.entero("ANOMALIA_PM25_ENFRIAMIENTO_MIN", 15)
+ANOMALIA_NOTIFICAR = config.booleano("ANOMALIA_PM25_NOTIFICAR", False)
+
+
+class DetectorAnomaliasPM25:
+    """
+    Detector en linea de picos de PM2.5 con z-score sobre una ventana deslizante.
+
+    El estado es acotado (una deque de tamaño fijo mas la suma y la suma de cuadrados
+    de la ventana), por lo que cada lectura se procesa en O(1) sin consultar la tabla.
+    El estado es por proceso: cada worker mantiene su propia ventana.
+    """
+
+    def __init__(self, ventana: int = ANOMALIA_VENTANA, min_muestras: int = ANOMALIA_MIN_MUESTRAS,
+                 umbral_z: float = ANOMALIA_UMBRAL_Z):
+        self.ventana = deque(maxlen=ventana)
+        self.min_muestras = min_muestras
+        self.umbral_z = umbral_z
+        self.suma = 0.0
+        self.suma_cuadrados = 0.0
+        self.ultima_hora: Optional[datetime] = None
+        self.ultima_alerta: Optional[datetime] = None
+        self.lock = threading.Lock()
+
+    def actualizar(self, valor: float, hora: Optional[datetime]) -> Optional[dict]:
+        """
+        Incorpora una lectura a la ventana.
+        Retorna un dict con la media, desviacion y z-score si la lectura es un pico, None en otro caso.
+        """
+        with self.lock:
+            # La API devuelve la misma lectura para varias imagenes del mismo minuto
+            if hora is not None and hora == self.ultima_hora:
+                return None
+            self.ultima_hora = hora
+
+            resultado = None
+            n = len(self.ventana)
+            if n >= self.min_muestras:
+                media = self.suma / n
+                varianza = max(self.suma_cuadrados / n - media * media, 0.0)
+                desviacion = math.sqrt(varianza)
+                if desviacion > 0:
+                    z = (valor - media) / desviacion
+                    if z >= self.umbral_z:
+                        resultado = {"media": media, "desviacion": desviacion, "z": z}
+
+            # Actualizar la ventana de forma incremental
+            if n == self.ventana.maxlen:
+                saliente = self.ventana[0]
+                self.suma -= saliente
+                self.suma_cuadrados -= saliente * saliente
+            self.ventana.append(valor)
+            self.suma += valor
+            self.suma_cuadrados += valor * valor
+
+            return resultado
+
+    def en_enfriamiento(self, ahora: datetime) -> bool:
+        """Evita repetir alertas mientras dura un mismo pico."""
+        with self.lock:
+            if self.ultima_alerta and ahora - self.ultima_alerta < timedelta(minutes=ANOMALIA_ENFRIAMIENTO_MIN):
+                return True
+            self.ultima_alerta = ahora
+            return False
+
+
+detector_pm25 = DetectorAnomaliasPM25()
+
+
+def procesar_lectura(db: Session, registro: models.CalidadAire) -> bool:
+    """
+    Evalua una nueva lectura de calidad del aire recien guardada.
+    Si PM2.5 presenta un pico sin imagenes cercanas en el evento, registra una advertencia
+    y, opcionalmente, notifica a los operadores. Retorna True si se emitio una alerta.
+    """
+    if registro.pm2p5 is None:
+        return False
+
+    anomalia = detector_pm25.actualizar(registro.pm2p5, registro.hora_medicion)
+    if anomalia is None:
+        return False
+
+    hora = registro.hora_medicion or datetime.utcnow()
+
+    # Un pico acompañado de imagenes es un evento ya detectado por la camara
+    if crud.existe_imagen_cercana(db, registro.evento_id, hora, minutos=ANOMALIA_MARGEN_IMAGEN_MIN):
+        return False
+
+    if detector_pm25.en_enfriamiento(hora):
+        return False
+
+    mensaje = (
+        f"Pico de PM2.5 sin evento de imagen: {registro.pm2p5:.1f} ug/m3 "
+        f"(media {anomalia['media']:.1f}, z={anomalia['z']:.1f}), evento: {registro.evento_id}, "
+        f"hora: {hora.strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+    crud.create_log(db, log=schemas.LogSistemaCreate(
+        tipo=models.TipoLogEnum.advertencia,
+        mensaje=mensaje
+    ))
+
+    if ANOMALIA_NOTIFICAR:
+        try:
+            from app.services.firebase_notifications import enviar_notificacion_anomalia
+            tokens_operadores = crud.get_tokens_operadores_activos(db)
+            if tokens_operadores:
+                resultado = enviar_notificacion_anomalia(tokens_operadores, registro.pm2p5, registro.evento_id)
+                crud.desactivar_tokens_fcm_por_valor(db, resultado["tokens_invalidos"])
+        except Exception as e:
+            print(f"Error al enviar notificacion de anomalia: {e}")
+
+    return True
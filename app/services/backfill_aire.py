@@ -0,0 +1,233 @@
+"""
+Importacion masiva de historicos de calidad del aire exportados de WeatherLink.
+
+Uso desde la linea de comandos:
+    python -m app.services.backfill_aire exportacion_1.json exportacion_2.json --lote 5000
+
+Los archivos se leen por bloques y las lecturas se insertan por lotes, por lo que
+la memoria se mantiene constante sin importar el tamaño del archivo.
+"""
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional, TextIO
+import argparse
+import json
+import re
+import time
+
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.services.aire import mapear_datos_sensor
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+BACKFILL_TAM_LOTE = config.entero("BACKFILL_TAM_LOTE", 5000)
+BACKFILL_MARGEN_MIN = config.entero("BACKFILL_MARGEN_MIN", 10)
+TAM_BLOQUE_LECTURA = 64 * 1024
+# Tamaño maximo de una lectura; si un objeto no termina de decodificarse antes, se considera invalido
+BACKFILL_MAX_OBJETO = config.entero("BACKFILL_MAX_OBJETO", 1024 * 1024)
+
+_RE_CLAVE_DATA = re.compile(r'"data"\s*:\s*')
+_CAMPOS_PM = ('pm_1', 'pm_2p5', 'pm_10')
+
+
+def _siguiente_registro(buffer: str, desde: int) -> int:
+    """Posicion del siguiente objeto ('{') o del fin del arreglo (']') a partir de `desde`."""
+    candidatos = [i for i in (buffer.find('{', desde), buffer.find(']', desde)) if i != -1]
+    return min(candidatos) if candidatos else len(buffer)
+
+
+def iterar_lecturas_sensor(archivo: TextIO, tam_bloque: int = TAM_BLOQUE_LECTURA,
+                           max_objeto: int = BACKFILL_MAX_OBJETO) -> Iterator[dict]:
+    """
+    Recorre de forma incremental todos los objetos dentro de los arreglos "data" de una
+    exportacion de WeatherLink (un JSON por archivo o uno por linea).
+    Solo mantiene en memoria el bloque actual (y a lo mas `max_objeto` caracteres de una lectura).
+    Un objeto que no se puede decodificar se omite (se imprime su posicion) y se continua con el siguiente.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    # Caracteres ya descartados del inicio del buffer, para reportar posiciones en el archivo
+    descartados = 0
+    en_arreglo = False
+    fin_archivo = False
+
+    while True:
+        necesita_mas = False
+
+        if not en_arreglo:
+            m = _RE_CLAVE_DATA.search(buffer, pos)
+            if m is None:
+                # Conservar una cola por si la clave quedo partida entre bloques
+                inicio = max(pos, len(buffer) - 64)
+                descartados += inicio
+                buffer = buffer[inicio:]
+                pos = 0
+                necesita_mas = True
+            elif m.end() >= len(buffer):
+                descartados += m.start()
+                buffer = buffer[m.start():]
+                pos = 0
+                necesita_mas = True
+            elif buffer[m.end()] != '[':
+                pos = m.end()
+            else:
+                en_arreglo = True
+                pos = m.end() + 1
+        else:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+
+            if pos >= len(buffer):
+                necesita_mas = True
+            elif buffer[pos] == ']':
+                en_arreglo = False
+                pos += 1
+            else:
+                try:
+                    objeto, fin = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if not fin_archivo and len(buffer) - pos <= max_objeto:
+                        # Objeto incompleto, leer el siguiente bloque
+                        necesita_mas = True
+                    else:
+                        print(f"Lectura invalida en el caracter {descartados + pos} ({e.msg}), se omite")
+                        pos = _siguiente_registro(buffer, pos + 1)
+                else:
+                    pos = fin
+                    if isinstance(objeto, dict):
+                        yield objeto
+
+            if necesita_mas:
+                descartados += pos
+                buffer = buffer[pos:]
+                pos = 0
+
+        if necesita_mas:
+            if fin_archivo:
+                return
+            bloque = archivo.read(tam_bloque)
+            if not bloque:
+                fin_archivo = True
+            buffer += bloque
+
+
+def _asignar_evento(hora: datetime, intervalos: List[tuple], inicios: List[datetime],
+                    margen: timedelta) -> tuple:
+    """Buscar el evento cuyo intervalo (con margen) contiene la hora y clasificar la medicion."""
+    mejor = None
+    mejor_distancia = None
+
+    # Los intervalos estan ordenados por inicio; solo se revisan los que inician antes de hora + margen
+    limite = bisect_right(inicios, hora + margen)
+    for evento_id, inicio, fin in intervalos[:limite]:
+        if hora < inicio - margen or hora > fin + margen:
+            continue
+        if hora < inicio:
+            distancia, tipo = inicio - hora, models.TipoMedicionEnum.antes
+        elif hora > fin:
+            distancia, tipo = hora - fin, models.TipoMedicionEnum.despues
+        else:
+            distancia, tipo = timedelta(0), models.TipoMedicionEnum.durante
+        if mejor_distancia is None or distancia < mejor_distancia:
+            mejor, mejor_distancia = (evento_id, tipo), distancia
+
+    return mejor if mejor else (None, models.TipoMedicionEnum.pendiente)
+
+
+def _guardar_lote(db: Session, lote: List[dict], margen: timedelta) -> tuple:
+    """Asociar el lote a eventos, descartar lecturas ya existentes e insertarlo. Retorna (insertados, omitidos)."""
+    desde = min(r['hora_medicion'] for r in lote)
+    hasta = max(r['hora_medicion'] for r in lote)
+
+    existentes = crud.get_horas_calidad_aire(db, desde, hasta)
+    intervalos = sorted(crud.get_intervalos_eventos(db, desde - margen, hasta + margen), key=lambda i: i[1])
+    inicios = [inicio for _, inicio, _ in intervalos]
+
+    registros = []
+    vistos = set()
+    for registro in lote:
+        hora = registro['hora_medicion']
+        if hora in existentes or hora in vistos:
+            continue
+        vistos.add(hora)
+        registro['evento_id'], registro['tipo'] = _asignar_evento(hora, intervalos, inicios, margen)
+        registros.append(registro)
+
+    insertados = crud.insertar_calidad_aire_lote(db, registros)
+    return insertados, len(lote) - insertados
+
+
+def importar_historico(db: Session, archivo: TextIO, tam_lote: int = BACKFILL_TAM_LOTE,
+                       margen_minutos: int = BACKFILL_MARGEN_MIN,
+                       reportar: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Importar un archivo de historicos a calidad_aire.
+    Usa el mismo mapeo de campos que consumir_api_aire y omite lecturas sin datos de PM
+    (por ejemplo, de sensores que no son de calidad del aire) o ya registradas.
+    """
+    margen = timedelta(minutes=margen_minutos)
+    progreso = {"leidos": 0, "insertados": 0, "omitidos": 0, "lotes": 0}
+    inicio = time.perf_counter()
+    lote = []
+
+    def procesar_lote():
+        insertados, omitidos = _guardar_lote(db, lote, margen)
+        progreso["insertados"] += insertados
+        progreso["omitidos"] += omitidos
+        progreso["lotes"] += 1
+        progreso["segundos"] = round(time.perf_counter() - inicio, 2)
+        lote.clear()
+        if reportar:
+            reportar(dict(progreso))
+
+    for lectura in iterar_lecturas_sensor(archivo):
+        progreso["leidos"] += 1
+        if 'ts' not in lectura or all(lectura.get(campo) is None for campo in _CAMPOS_PM):
+            progreso["omitidos"] += 1
+            continue
+
+        lote.append(mapear_datos_sensor(lectura))
+        if len(lote) >= tam_lote:
+            procesar_lote()
+
+    if lote:
+        procesar_lote()
+
+    progreso["segundos"] = round(time.perf_counter() - inicio, 2)
+    return progreso
+
+
+def _imprimir_progreso(progreso: dict):
+    print(f"Lote {progreso['lotes']}: {progreso['leidos']} leidos, {progreso['insertados']} insertados, "
+          f"{progreso['omitidos']} omitidos ({progreso['segundos']} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importar historicos de WeatherLink a calidad_aire")
+    parser.add_argument("archivos", nargs="+", help="Archivos JSON exportados de WeatherLink")
+    parser.add_argument("--lote", type=int, default=BACKFILL_TAM_LOTE, help="Registros por transaccion")
+    parser.add_argument("--margen", type=int, default=BACKFILL_MARGEN_MIN,
+                        help="Minutos antes/despues de un evento para asociar lecturas")
+    args = parser.parse_args()
+
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        for ruta in args.archivos:
+            print(f"Importando {ruta}...")
+            with open(ruta, encoding="utf-8") as archivo:
+                resultado = importar_historico(db, archivo, tam_lote=args.lote,
+                                               margen_minutos=args.margen, reportar=_imprimir_progreso)
+            print(f"{ruta}: {resultado['insertados']} registros insertados de {resultado['leidos']} "
+                  f"en {resultado['segundos']} s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
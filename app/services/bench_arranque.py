@@ -0,0 +1,87 @@
+"""
+Medir el arranque de un worker nuevo.
+
+Uso:
+    python -m app.services.bench_arranque --repeticiones 5 [--precargar]
+
+Cada medicion corre en un interprete nuevo: tiempo de `import app.main`, memoria residente (RSS)
+al terminar y que librerias pesadas quedaron cargadas. Con --precargar tambien mide la precarga
+de servicios (lo que hace PRECARGA_SERVICIOS=true en segundo plano).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+LIBRERIAS_PESADAS = ("matplotlib", "reportlab", "firebase_admin", "sendgrid", "requests")
+
+# Se ejecuta en el proceso hijo; imprime una linea JSON con el resultado
+_SCRIPT_MEDICION = """
+import json, sys, time
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as estado:
+            for linea in estado:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo / (1024 * 1024) if sys.platform == "darwin" else maximo / 1024
+
+resultado = {"rss_inicial_mb": rss_mb()}
+inicio = time.perf_counter()
+import app.main
+resultado["importacion_ms"] = (time.perf_counter() - inicio) * 1000
+resultado["rss_mb"] = rss_mb()
+resultado["cargadas"] = [nombre for nombre in LIBRERIAS if nombre in sys.modules]
+
+if PRECARGAR:
+    from app.services import precarga
+    inicio = time.perf_counter()
+    precarga.precargar_servicios()
+    resultado["precarga_ms"] = (time.perf_counter() - inicio) * 1000
+    resultado["rss_precarga_mb"] = rss_mb()
+
+print("RESULTADO " + json.dumps(resultado))
+"""
+
+
+def medir_arranque(precargar: bool = False) -> dict:
+    """Importa la aplicacion en un interprete nuevo y retorna tiempos y memoria."""
+    codigo = f"PRECARGAR = {precargar!r}\nLIBRERIAS = {LIBRERIAS_PESADAS!r}\n" + _SCRIPT_MEDICION
+    proceso = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True)
+    for linea in proceso.stdout.splitlines():
+        if linea.startswith("RESULTADO "):
+            return json.loads(linea[len("RESULTADO "):])
+    raise RuntimeError(f"La medicion fallo:\n{proceso.stderr.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Medir tiempo de importacion y memoria de un worker nuevo")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Interpretes nuevos a medir")
+    parser.add_argument("--precargar", action="store_true", help="Medir tambien la precarga de servicios")
+    args = parser.parse_args()
+
+    mediciones = []
+    for i in range(args.repeticiones):
+        medicion = medir_arranque(args.precargar)
+        mediciones.append(medicion)
+        print(f"  corrida {i + 1}: {medicion['importacion_ms']:8.1f} ms, RSS {medicion['rss_mb']:6.1f} MB")
+
+    print(f"\nImportacion de app.main (mediana): {statistics.median(m['importacion_ms'] for m in mediciones):.1f} ms")
+    print(f"RSS del worker (mediana): {statistics.median(m['rss_mb'] for m in mediciones):.1f} MB "
+          f"(interprete vacio: {statistics.median(m['rss_inicial_mb'] for m in mediciones):.1f} MB)")
+    cargadas = mediciones[-1]["cargadas"]
+    print(f"Librerias pesadas cargadas al importar: {', '.join(cargadas) if cargadas else 'ninguna'}")
+
+    if args.precargar:
+        print(f"Precarga de servicios (mediana): {statistics.median(m['precarga_ms'] for m in mediciones):.1f} ms, "
+              f"RSS {statistics.median(m['rss_precarga_mb'] for m in mediciones):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
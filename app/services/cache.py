@@ -0,0 +1,232 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import os
+import threading
+import time
+import uuid
+
+
+class CacheTTL:
+    """
+    Cache en memoria con expiracion (TTL) y desalojo LRU al alcanzar `max_entradas`.
+    Es por proceso y seguro para hilos; expone contadores de aciertos y fallos.
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl_segundos: float = 60.0):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Retorna el valor guardado o None si no existe o ya expiro."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            valor, expira = entrada
+            if expira < ahora:
+                del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave: Hashable, valor: Any):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl_segundos)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave: Hashable):
+        with self._lock:
+            if self._datos.pop(clave, None) is not None:
+                self.invalidaciones += 1
+
+    def limpiar(self):
+        with self._lock:
+            self.invalidaciones += len(self._datos)
+            self._datos.clear()
+
+    def metricas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl_segundos,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0,
+                "desalojos": self.desalojos,
+                "invalidaciones": self.invalidaciones,
+            }
+
+
+class CacheVersionada:
+    """
+    Cache de un solo valor validado contra un contador de version compartido (p. ej. una fila en la BD).
+    Cada worker revisa la version como maximo cada `revalidar_segundos`; si cambio, recarga el valor.
+    Las escrituras del mismo proceso llaman `invalidar()` para verse de inmediato.
+    """
+
+    def __init__(self, revalidar_segundos: float = 5.0):
+        self.revalidar_segundos = revalidar_segundos
+        self._valor = None
+        self._version = None
+        self._verificado = 0.0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.validaciones = 0
+        self.recargas = 0
+        self.invalidaciones = 0
+
+    def obtener(self, leer_version: Callable[[], Any], cargar: Callable[[], Any]) -> Any:
+        """Retorna el valor en cache; `leer_version` y `cargar` solo se llaman cuando hace falta."""
+        ahora = time.monotonic()
+        with self._lock:
+            if self._version is not None and ahora - self._verificado < self.revalidar_segundos:
+                self.aciertos += 1
+                return self._valor
+            version_cache = self._version
+            valor_cache = self._valor
+
+        # La version se lee antes que el valor: si cambia en medio, la siguiente validacion recarga
+        version = leer_version()
+        if version_cache is not None and version == version_cache:
+            with self._lock:
+                self._verificado = ahora
+                self.validaciones += 1
+            return valor_cache
+
+        valor = cargar()
+        with self._lock:
+            self._valor = valor
+            self._version = version
+            self._verificado = ahora
+            self.recargas += 1
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self._valor = None
+            self._version = None
+            self.invalidaciones += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "version": self._version,
+                "revalidar_segundos": self.revalidar_segundos,
+                "aciertos": self.aciertos,
+                "validaciones": self.validaciones,
+                "recargas": self.recargas,
+                "invalidaciones": self.invalidaciones,
+            }
+
+
+class CacheDiscoLRU:
+    """
+    Cache de archivos en un directorio, limitada por tamaño total con desalojo LRU
+    (la fecha de modificacion se actualiza en cada acierto). Varios procesos pueden
+    compartir el mismo directorio: los archivos se publican con un rename atomico.
+    """
+
+    # Temporales huerfanos (proceso que murio a medio escribir) se borran despues de este tiempo
+    EDAD_MAX_TEMPORAL_S = 3600
+
+    def __init__(self, directorio: str, max_bytes: int, extension: str = ""):
+        self.directorio = os.path.abspath(directorio)
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}{self.extension}")
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """Retorna la ruta del archivo en cache o None si no existe."""
+        ruta = self.ruta(clave)
+        try:
+            os.utime(ruta, None)
+        except FileNotFoundError:
+            with self._lock:
+                self.fallos += 1
+            return None
+        with self._lock:
+            self.aciertos += 1
+        return ruta
+
+    def ruta_temporal(self, clave: str) -> str:
+        """Ruta donde escribir un archivo nuevo antes de publicarlo con `guardar`."""
+        os.makedirs(self.directorio, exist_ok=True)
+        return os.path.join(self.directorio, f".{clave}.{uuid.uuid4().hex}.tmp")
+
+    def guardar(self, clave: str, ruta_temporal: str) -> str:
+        """Publica el archivo temporal bajo `clave` y desaloja lo necesario. Retorna la ruta final."""
+        ruta = self.ruta(clave)
+        os.replace(ruta_temporal, ruta)
+        self._recortar()
+        return ruta
+
+    def _recortar(self):
+        ahora = time.time()
+        archivos = []
+        try:
+            entradas = list(os.scandir(self.directorio))
+        except FileNotFoundError:
+            return
+        for entrada in entradas:
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            if entrada.name.startswith("."):
+                if ahora - info.st_mtime > self.EDAD_MAX_TEMPORAL_S:
+                    self._borrar(entrada.path)
+                continue
+            archivos.append((info.st_mtime, info.st_size, entrada.path))
+
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= self.max_bytes:
+                break
+            if self._borrar(ruta):
+                total -= tamano
+                with self._lock:
+                    self.desalojos += 1
+
+    @staticmethod
+    def _borrar(ruta: str) -> bool:
+        try:
+            os.remove(ruta)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"No se pudo borrar {ruta} de la cache: {e}")
+            return False
+
+    def metricas(self) -> dict:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "directorio": self.directorio,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 4) if total else 0,
+                "desalojos": self.desalojos,
+            }
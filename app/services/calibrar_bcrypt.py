@@ -0,0 +1,68 @@
+"""
+Calibrar el costo de bcrypt para el host actual.
+
+Uso:
+    python -m app.services.calibrar_bcrypt --objetivo-ms 250
+
+Mide el tiempo de hashear_password con distintos costos y sugiere el mayor costo
+cuyo tiempo mediano queda dentro del objetivo. El valor se configura con BCRYPT_ROUNDS.
+"""
+from passlib.context import CryptContext
+import argparse
+import statistics
+import time
+
+from app.services import security
+
+COSTO_MINIMO = 10
+COSTO_MAXIMO = 16
+
+
+def medir_costo(rounds: int, repeticiones: int = 5) -> float:
+    """Tiempo mediano en milisegundos para hashear con un costo dado."""
+    contexto = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        contexto.hash("calibracion-bcrypt")
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def calibrar(objetivo_ms: float, repeticiones: int = 5) -> dict:
+    """Recorre los costos de menor a mayor y se detiene al superar el objetivo."""
+    resultados = {}
+    recomendado = COSTO_MINIMO
+    for rounds in range(COSTO_MINIMO, COSTO_MAXIMO + 1):
+        tiempo_ms = medir_costo(rounds, repeticiones)
+        resultados[rounds] = tiempo_ms
+        print(f"  costo {rounds:2d}: {tiempo_ms:8.1f} ms")
+        if tiempo_ms > objetivo_ms:
+            break
+        recomendado = rounds
+    return {"recomendado": recomendado, "tiempos_ms": resultados}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrar el costo de bcrypt para este host")
+    parser.add_argument("--objetivo-ms", type=float, default=250, help="Latencia objetivo por hash (ms)")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Mediciones por costo")
+    args = parser.parse_args()
+
+    # Tiempo real del camino de produccion con el costo configurado (incluye el executor)
+    inicio = time.perf_counter()
+    security.hashear_password("calibracion-bcrypt")
+    actual_ms = (time.perf_counter() - inicio) * 1000
+    print(f"Costo configurado (BCRYPT_ROUNDS={security.BCRYPT_ROUNDS}): {actual_ms:.1f} ms por hash_password")
+
+    print(f"Midiendo costos {COSTO_MINIMO}-{COSTO_MAXIMO} (objetivo {args.objetivo_ms:.0f} ms):")
+    resultado = calibrar(args.objetivo_ms, args.repeticiones)
+
+    print(f"\nCosto recomendado: {resultado['recomendado']}")
+    print(f"Agregar al archivo .env:  BCRYPT_ROUNDS={resultado['recomendado']}")
+    if resultado['recomendado'] != security.BCRYPT_ROUNDS:
+        print("Los hashes existentes se actualizaran al nuevo costo en el siguiente inicio de sesion de cada usuario.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,225 @@
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from dotenv import load_dotenv
-import os
+from collections import deque
+from email.mime.text import MIMEText
+from string import Template
+from typing import Optional
+import html
+import queue
+import smtplib
+import threading
 
-load_dotenv()
+from app.config import obtener_configuracion
 
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
-SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL")
+config = obtener_configuracion()
 
+SENDGRID_API_KEY = config.texto("SENDGRID_API_KEY")
+SENDGRID_FROM_EMAIL = config.texto("SENDGRID_FROM_EMAIL")
 
+# Transporte de correo: "sendgrid", "smtp" (p. ej. un MailHog local) o "falso" (en memoria)
+EMAIL_TRANSPORTE = config.texto("EMAIL_TRANSPORTE", "sendgrid").lower()
+EMAIL_COLA_MAX = config.entero("EMAIL_COLA_MAX", 1000)
+EMAIL_MAX_INTENTOS = config.entero("EMAIL_MAX_INTENTOS", 3)
+EMAIL_BACKOFF_BASE_S = config.decimal("EMAIL_BACKOFF_BASE_S", 2)
 
-def enviar_correo_recuperacion(email_destino: str, nombre_usuario: str, token: str) -> bool:
+SMTP_HOST = config.texto("SMTP_HOST", "localhost")
+SMTP_PORT = config.entero("SMTP_PORT", 1025)
+SMTP_USUARIO = config.texto("SMTP_USUARIO")
+SMTP_PASSWORD = config.texto("SMTP_PASSWORD")
+SMTP_TLS = config.booleano("SMTP_TLS", False)
+
+URL_BASE_RECUPERACION = config.texto("URL_BASE_RECUPERACION", "http://48.192.80.197:8000")
 
-    # Construir enlace de recuperacion
-    enlace_recuperacion = f"http://48.192.80.197:8000/reset-password?token={token}"
+ASUNTO_RECUPERACION = "Recuperacion de Contraseña - Thermal Monitoring"
 
-    # Contenido HTML del correo
-    html_content = f"""
+# Plantilla compilada una sola vez al importar; los valores se escapan al sustituir
+PLANTILLA_RECUPERACION = Template("""
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{
+            body {
                 font-family: Arial, sans-serif;
                 line-height: 1.6;
                 color: #333;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <div class="content">
                 <h1>Recuperacion de Contraseña</h1>
-                <p>Hola <strong>{nombre_usuario}</strong>,</p>
-                
+                <p>Hola <strong>$nombre_usuario</strong>,</p>
+
                 <p>Recibimos una solicitud para restablecer la contraseña de tu cuenta en Thermal Monitoring.</p>
-                
+
                 <p>Para crear una nueva contraseña, haz clic en el siguiente boton:</p>
-                <a href="{enlace_recuperacion}" >Restablecer Contraseña</a>
-                
+                <a href="$enlace_recuperacion" >Restablecer Contraseña</a>
+
                 <p>Si tienes problemas, contacta al administrador del sistema.</p>
                 <p>Saludos,<br><strong>Equipo de Thermal Monitoring</strong></p>
             </div>
         </div>
     </body>
     </html>
-    """
-
-    # Crear mensaje
-    message = Mail(
-        from_email=SENDGRID_FROM_EMAIL,
-        to_emails=email_destino,
-        subject='Recuperacion de Contraseña - Thermal Monitoring',
-        html_content=html_content
+    """)
+
+
+def construir_correo_recuperacion(nombre_usuario: str, token: str) -> str:
+    """Genera el HTML del correo de recuperacion a partir de la plantilla precompilada."""
+    enlace_recuperacion = f"{URL_BASE_RECUPERACION}/reset-password?token={token}"
+    return PLANTILLA_RECUPERACION.substitute(
+        nombre_usuario=html.escape(nombre_usuario),
+        enlace_recuperacion=html.escape(enlace_recuperacion, quote=True)
     )
 
-    try:
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        response = sg.send(message)
 
+class TransporteSendGrid:
+    """Envia con la API de SendGrid reutilizando un solo cliente HTTP."""
+    nombre = "sendgrid"
+
+    def __init__(self):
+        self._cliente = None
+
+    def enviar(self, destino: str, asunto: str, html_content: str):
+        from sendgrid.helpers.mail import Mail
+
+        if self._cliente is None:
+            from sendgrid import SendGridAPIClient
+            self._cliente = SendGridAPIClient(SENDGRID_API_KEY)
+
+        message = Mail(
+            from_email=SENDGRID_FROM_EMAIL,
+            to_emails=destino,
+            subject=asunto,
+            html_content=html_content
+        )
+        response = self._cliente.send(message)
+        if response.status_code >= 300:
+            raise RuntimeError(f"SendGrid respondio {response.status_code}")
         print(f"Correo enviado exitosamente. Status code: {response.status_code}")
-        return True
 
-    except Exception as e:
-        print(f"Error al enviar correo: {str(e)}")
-        return False
\ No newline at end of file
+
+class TransporteSMTP:
+    """Envia por SMTP; util para desarrollo con un servidor local (MailHog, smtp4dev)."""
+    nombre = "smtp"
+
+    def enviar(self, destino: str, asunto: str, html_content: str):
+        mensaje = MIMEText(html_content, "html", "utf-8")
+        mensaje["Subject"] = asunto
+        mensaje["From"] = SENDGRID_FROM_EMAIL or "no-reply@localhost"
+        mensaje["To"] = destino
+
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as servidor:
+            if SMTP_TLS:
+                servidor.starttls()
+            if SMTP_USUARIO:
+                servidor.login(SMTP_USUARIO, SMTP_PASSWORD)
+            servidor.send_message(mensaje)
+        print(f"Correo enviado por SMTP a {destino}")
+
+
+class TransporteFalso:
+    """Guarda los correos en memoria en lugar de enviarlos."""
+    nombre = "falso"
+
+    def __init__(self):
+        self.bandeja = deque(maxlen=100)
+
+    def enviar(self, destino: str, asunto: str, html_content: str):
+        self.bandeja.append({"destino": destino, "asunto": asunto, "html": html_content})
+        print(f"[correo falso] {asunto} -> {destino}")
+
+
+_TRANSPORTES = {"sendgrid": TransporteSendGrid, "smtp": TransporteSMTP, "falso": TransporteFalso}
+transporte = _TRANSPORTES.get(EMAIL_TRANSPORTE, TransporteSendGrid)()
+
+_cola: "queue.Queue[dict]" = queue.Queue(maxsize=EMAIL_COLA_MAX)
+_detener = threading.Event()
+_hilo: Optional[threading.Thread] = None
+_hilo_lock = threading.Lock()
+_metricas = {"encolados": 0, "enviados": 0, "reintentos": 0, "fallidos": 0, "rechazados": 0}
+_metricas_lock = threading.Lock()
+
+
+def _contar(clave: str):
+    with _metricas_lock:
+        _metricas[clave] += 1
+
+
+def _enviar_con_reintentos(correo: dict) -> bool:
+    for intento in range(1, EMAIL_MAX_INTENTOS + 1):
+        try:
+            transporte.enviar(correo["destino"], correo["asunto"], correo["html"])
+            _contar("enviados")
+            return True
+        except Exception as e:
+            print(f"Error al enviar correo a {correo['destino']} (intento {intento}/{EMAIL_MAX_INTENTOS}): {e}")
+            if intento == EMAIL_MAX_INTENTOS or _detener.wait(EMAIL_BACKOFF_BASE_S * (2 ** (intento - 1))):
+                break
+            _contar("reintentos")
+    _contar("fallidos")
+    return False
+
+
+def _ciclo():
+    while True:
+        try:
+            correo = _cola.get(timeout=1)
+        except queue.Empty:
+            if _detener.is_set():
+                return
+            continue
+        try:
+            _enviar_con_reintentos(correo)
+        finally:
+            _cola.task_done()
+
+
+def _asegurar_hilo():
+    global _hilo
+    with _hilo_lock:
+        if _hilo is None or not _hilo.is_alive():
+            _detener.clear()
+            _hilo = threading.Thread(target=_ciclo, name="cola_correos", daemon=True)
+            _hilo.start()
+
+
+def encolar_correo(destino: str, asunto: str, html_content: str) -> bool:
+    """Agrega un correo a la cola de envio. Retorna False si la cola esta llena."""
+    _asegurar_hilo()
+    try:
+        _cola.put_nowait({"destino": destino, "asunto": asunto, "html": html_content})
+    except queue.Full:
+        _contar("rechazados")
+        print(f"Cola de correos llena, se descarta el correo a {destino}")
+        return False
+    _contar("encolados")
+    return True
+
+
+def encolar_correo_recuperacion(email_destino: str, nombre_usuario: str, token: str) -> bool:
+    """Encola el correo de recuperacion de contraseña; el envio ocurre en segundo plano."""
+    return encolar_correo(email_destino, ASUNTO_RECUPERACION, construir_correo_recuperacion(nombre_usuario, token))
+
+
+def enviar_correo_recuperacion(email_destino: str, nombre_usuario: str, token: str) -> bool:
+    """Envia el correo de recuperacion de forma sincrona (con reintentos)."""
+    return _enviar_con_reintentos({
+        "destino": email_destino,
+        "asunto": ASUNTO_RECUPERACION,
+        "html": construir_correo_recuperacion(nombre_usuario, token)
+    })
+
+
+def detener(timeout: float = 10):
+    """Detiene el hilo de correos despues de vaciar la cola (se llama al apagar la aplicacion)."""
+    _detener.set()
+    if _hilo is not None:
+        _hilo.join(timeout=timeout)
+
+
+def obtener_metricas() -> dict:
+    with _metricas_lock:
+        metricas = dict(_metricas)
+    metricas["pendientes"] = _cola.qsize()
+    metricas["transporte"] = transporte.nombre
+    return metricas
@@ -1,18 +1,36 @@
 import firebase_admin
-from firebase_admin import credentials, messaging
-import os
-from dotenv import load_dotenv
+from firebase_admin import credentials, messaging, exceptions as firebase_exceptions
+import threading
 
-load_dotenv()
+from app.config import obtener_configuracion
 
-FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
+config = obtener_configuracion()
 
-try:
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-    firebase_admin.initialize_app(cred)
-    print("Firebase Admin SDK inicializado correctamente")
-except Exception as e:
-    print(f"Error al inicializar Firebase Admin SDK: {e}")
+FIREBASE_CREDENTIALS_PATH = config.texto("FIREBASE_CREDENTIALS_PATH")
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def inicializar_firebase() -> bool:
+    """
+    Inicializa el Admin SDK la primera vez que se necesita (envio o precarga), no al importar.
+    Retorna True si la app de Firebase queda disponible.
+    """
+    global _app
+    if _app is not None:
+        return True
+    with _app_lock:
+        if _app is not None:
+            return True
+        try:
+            cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+            _app = firebase_admin.initialize_app(cred)
+            print("Firebase Admin SDK inicializado correctamente")
+            return True
+        except Exception as e:
+            print(f"Error al inicializar Firebase Admin SDK: {e}")
+            return False
 
 
 def enviar_notificacion_nuevo_evento(token_fcm: str, evento_id: int):
@@ -30,6 +48,7 @@ def enviar_notificacion_nuevo_evento(token_fcm: str, evento_id: int):
     )
 
     try:
+        inicializar_firebase()
         response = messaging.send(message)
         print(f"Notificacion enviada exitosamente: {response}")
         return True
@@ -38,39 +57,125 @@ def enviar_notificacion_nuevo_evento(token_fcm: str, evento_id: int):
         return False
 
 
-def enviar_notificacion_multiple(tokens_fcm: list, evento_id: int):
-    """Envia notificacion a multiples dispositivos (todos los operadores)"""
-    if not tokens_fcm:
-        print("No hay tokens FCM para enviar notificaciones")
-        return False
+# Limite de tokens por llamada multicast de FCM
+FCM_MAX_TOKENS_POR_LLAMADA = 500
+
 
-    # Enviar notificaciones una por una
-    exitosos = 0
-    fallidos = 0
+# Errores por token que indican que el token ya no puede recibir mensajes
+# (app desinstalada/reinstalada, token mal formado o de otro proyecto de Firebase)
+ERRORES_TOKEN_INVALIDO = (
+    messaging.UnregisteredError,
+    messaging.SenderIdMismatchError,
+    firebase_exceptions.InvalidArgumentError,
+)
 
-    for token in tokens_fcm:
+
+def es_token_invalido(error: Exception) -> bool:
+    """True si el error de envio significa que el token debe desactivarse."""
+    return isinstance(error, ERRORES_TOKEN_INVALIDO)
+
+
+def _enviar_multicast(tokens_fcm: list, notificacion: messaging.Notification, data: dict) -> dict:
+    """
+    Envia el mismo mensaje a varios tokens en lotes multicast y agrega el resultado por token.
+    Retorna {"exitosos": int, "fallidos": int, "errores": {token: excepcion}, "tokens_invalidos": [token]}.
+    """
+    inicializar_firebase()
+
+    # send_multicast fue reemplazado por send_each_for_multicast en firebase-admin 6
+    enviar = getattr(messaging, "send_each_for_multicast", None) or messaging.send_multicast
+
+    # Quitar duplicados conservando el orden
+    tokens = list(dict.fromkeys(tokens_fcm))
+    resultado = {"exitosos": 0, "fallidos": 0, "errores": {}, "tokens_invalidos": []}
+
+    for i in range(0, len(tokens), FCM_MAX_TOKENS_POR_LLAMADA):
+        lote = tokens[i:i + FCM_MAX_TOKENS_POR_LLAMADA]
+        mensaje = messaging.MulticastMessage(notification=notificacion, data=data, tokens=lote)
         try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Nuevo Evento Detectado",
-                    body=f"Se ha detectado un nuevo evento #{evento_id}. Requiere revision."
-                ),
-                data={
-                    "evento_id": str(evento_id),
-                    "tipo": "nuevo_evento"
-                },
-                token=token
-            )
-
-            response = messaging.send(message)
-            print(f"Notificacion enviada a token: {token[:20]}...")
-            exitosos += 1
+            respuesta = enviar(mensaje)
         except Exception as e:
-            print(f"Error al enviar notificacion a token {token[:20]}...: {e}")
-            fallidos += 1
+            # Fallo de todo el lote (red, credenciales): se reporta para cada token
+            print(f"Error al enviar lote multicast de {len(lote)} tokens: {e}")
+            resultado["fallidos"] += len(lote)
+            for token in lote:
+                resultado["errores"][token] = e
+            continue
+
+        for token, respuesta_token in zip(lote, respuesta.responses):
+            if respuesta_token.success:
+                resultado["exitosos"] += 1
+            else:
+                resultado["fallidos"] += 1
+                resultado["errores"][token] = respuesta_token.exception
+                # Solo errores por token; un fallo del lote completo no invalida los tokens
+                if es_token_invalido(respuesta_token.exception):
+                    resultado["tokens_invalidos"].append(token)
+
+    return resultado
+
+
+def enviar_notificacion_multiple(tokens_fcm: list, evento_id: int) -> dict:
+    """Envia notificacion a multiples dispositivos (todos los operadores) con envios multicast"""
+    if not tokens_fcm:
+        print("No hay tokens FCM para enviar notificaciones")
+        return {"exitosos": 0, "fallidos": 0, "errores": {}, "tokens_invalidos": []}
+
+    # El payload se construye una sola vez por evento
+    notificacion = messaging.Notification(
+        title="Nuevo Evento Detectado",
+        body=f"Se ha detectado un nuevo evento #{evento_id}. Requiere revision."
+    )
+    data = {
+        "evento_id": str(evento_id),
+        "tipo": "nuevo_evento"
+    }
+
+    resultado = _enviar_multicast(tokens_fcm, notificacion, data)
+
+    print(f"{resultado['exitosos']} notificaciones enviadas exitosamente de {len(tokens_fcm)}")
+    if resultado["fallidos"] > 0:
+        print(f"{resultado['fallidos']} notificaciones fallaron ({len(resultado['tokens_invalidos'])} tokens invalidos)")
+
+    return resultado
+
+
+def enviar_resumen_eventos(tokens_fcm: list, evento_ids: list) -> dict:
+    """Envia una sola notificacion que agrupa varios eventos creados dentro de la ventana de agrupacion"""
+    if not tokens_fcm:
+        return {"exitosos": 0, "fallidos": 0, "errores": {}, "tokens_invalidos": []}
+
+    notificacion = messaging.Notification(
+        title=f"{len(evento_ids)} nuevos eventos detectados",
+        body=f"Se detectaron {len(evento_ids)} eventos nuevos (ultimo #{max(evento_ids)}). Requieren revision."
+    )
+    data = {
+        "evento_ids": ",".join(str(evento_id) for evento_id in evento_ids),
+        "total": str(len(evento_ids)),
+        "tipo": "resumen_eventos"
+    }
+
+    resultado = _enviar_multicast(tokens_fcm, notificacion, data)
+
+    print(f"Resumen de {len(evento_ids)} eventos enviado a {resultado['exitosos']} de {len(tokens_fcm)} dispositivos")
+    return resultado
+
+
+def enviar_notificacion_anomalia(tokens_fcm: list, pm2p5: float, evento_id: int = None) -> dict:
+    """Envia una alerta a los operadores cuando hay un pico de PM2.5 sin imagenes asociadas"""
+    if not tokens_fcm:
+        return {"exitosos": 0, "fallidos": 0, "errores": {}, "tokens_invalidos": []}
+
+    notificacion = messaging.Notification(
+        title="Pico de PM2.5 detectado",
+        body=f"Se registro PM2.5 de {pm2p5:.1f} ug/m3 sin imagenes del evento. Requiere revision."
+    )
+    data = {
+        "evento_id": str(evento_id) if evento_id is not None else "",
+        "tipo": "anomalia_pm25"
+    }
 
-    print(f"{exitosos} notificaciones enviadas exitosamente de {len(tokens_fcm)}")
-    if fallidos > 0:
-        print(f"{fallidos} notificaciones fallaron")
+    resultado = _enviar_multicast(tokens_fcm, notificacion, data)
 
-    return exitosos > 0
+    print(f"{resultado['exitosos']} alertas de anomalia enviadas de {len(tokens_fcm)}")
+    return resultado
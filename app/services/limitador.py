@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from fastapi import HTTPException, status
+import math
+import threading
+import time
+
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+# Intentos permitidos por minuto (tambien es la rafaga maxima); 0 desactiva el limite
+LOGIN_INTENTOS_IP = config.decimal("LOGIN_INTENTOS_IP", 20)
+LOGIN_INTENTOS_USUARIO = config.decimal("LOGIN_INTENTOS_USUARIO", 5)
+RECUPERACION_INTENTOS_IP = config.decimal("RECUPERACION_INTENTOS_IP", 5)
+RECUPERACION_INTENTOS_CORREO = config.decimal("RECUPERACION_INTENTOS_CORREO", 3)
+LIMITADOR_MAX_CLAVES = config.entero("LIMITADOR_MAX_CLAVES", 10000)
+
+
+class LimitadorTokenBucket:
+    """
+    Limitador token bucket en memoria, por proceso.
+    Cada clave ocupa una entrada de tamaño fijo [tokens, ultima_actualizacion]; al superar
+    `max_claves` se desaloja la clave usada hace mas tiempo. Con `intentos_por_minuto` <= 0 no limita.
+    """
+
+    def __init__(self, nombre: str, intentos_por_minuto: float, max_claves: int = LIMITADOR_MAX_CLAVES):
+        self.nombre = nombre
+        self.activo = intentos_por_minuto > 0
+        self.capacidad = intentos_por_minuto
+        self.tasa = intentos_por_minuto / 60.0
+        self.max_claves = max_claves
+        self._cubetas: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.permitidas = 0
+        self.rechazadas = 0
+
+    def consumir(self, clave: str) -> float:
+        """Consume un intento. Retorna 0 si se permite o los segundos a esperar si se rechaza."""
+        if not self.activo:
+            with self._lock:
+                self.permitidas += 1
+            return 0.0
+
+        ahora = time.monotonic()
+        with self._lock:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = [self.capacidad, ahora]
+                self._cubetas[clave] = cubeta
+                if len(self._cubetas) > self.max_claves:
+                    self._cubetas.popitem(last=False)
+            else:
+                cubeta[0] = min(self.capacidad, cubeta[0] + (ahora - cubeta[1]) * self.tasa)
+                cubeta[1] = ahora
+                self._cubetas.move_to_end(clave)
+
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                self.permitidas += 1
+                return 0.0
+
+            self.rechazadas += 1
+            return (1 - cubeta[0]) / self.tasa
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "claves": len(self._cubetas),
+                "intentos_por_minuto": self.capacidad,
+                "permitidas": self.permitidas,
+                "rechazadas": self.rechazadas,
+            }
+
+
+limitador_login_ip = LimitadorTokenBucket("login_ip", LOGIN_INTENTOS_IP)
+limitador_login_usuario = LimitadorTokenBucket("login_usuario", LOGIN_INTENTOS_USUARIO)
+limitador_recuperacion_ip = LimitadorTokenBucket("recuperacion_ip", RECUPERACION_INTENTOS_IP)
+limitador_recuperacion_correo = LimitadorTokenBucket("recuperacion_correo", RECUPERACION_INTENTOS_CORREO)
+
+LIMITADORES = (limitador_login_ip, limitador_login_usuario, limitador_recuperacion_ip, limitador_recuperacion_correo)
+
+
+def aplicar_limites(*verificaciones: tuple):
+    """
+    Recibe pares (limitador, clave) y lanza 429 con el primero que rechace.
+    Se debe llamar antes de cualquier consulta a la BD o calculo de hash.
+    """
+    for limitador, clave in verificaciones:
+        if not clave:
+            continue
+        espera = limitador.consumir(clave)
+        if espera:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Demasiados intentos, intenta de nuevo mas tarde",
+                headers={"Retry-After": str(math.ceil(espera))},
+            )
+
+
+def obtener_metricas_limitadores() -> dict:
+    return {limitador.nombre: limitador.metricas() for limitador in LIMITADORES}
@@ -0,0 +1,210 @@
+from collections import deque
+from datetime import datetime
+from typing import Callable, Optional
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.database import SessionLocal, engine
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+# Intervalos en segundos y retencion en dias (variables de entorno opcionales)
+MANT_HABILITADO = config.booleano("MANT_HABILITADO", True)
+MANT_TICK_S = config.decimal("MANT_TICK_S", 30)
+MANT_RETRASO_INICIAL_S = config.decimal("MANT_RETRASO_INICIAL_S", 60)
+MANT_TAM_LOTE = config.entero("MANT_TAM_LOTE", 1000)
+
+MANT_INTERVALO_TOKENS_RECUPERACION_S = config.decimal("MANT_INTERVALO_TOKENS_RECUPERACION_S", 3600)
+MANT_INTERVALO_LOGS_S = config.decimal("MANT_INTERVALO_LOGS_S", 86400)
+MANT_INTERVALO_TOKENS_FCM_S = config.decimal("MANT_INTERVALO_TOKENS_FCM_S", 86400)
+MANT_INTERVALO_TRABAJOS_REPORTE_S = config.decimal("MANT_INTERVALO_TRABAJOS_REPORTE_S", 600)
+MANT_INTERVALO_NOTIFICACIONES_S = config.decimal("MANT_INTERVALO_NOTIFICACIONES_S", 86400)
+
+MANT_RETENCION_LOGS_DIAS = config.entero("MANT_RETENCION_LOGS_DIAS", 90)
+MANT_RETENCION_TOKENS_FCM_DIAS = config.entero("MANT_RETENCION_TOKENS_FCM_DIAS", 30)
+MANT_RETENCION_NOTIFICACIONES_DIAS = config.entero("MANT_RETENCION_NOTIFICACIONES_DIAS", 30)
+
+# Nombre del candado de MySQL que elige un solo lider entre workers
+NOMBRE_CANDADO_LIDER = "thermal_mantenimiento"
+
+
+class CandadoLider:
+    """
+    Candado de lider con GET_LOCK de MySQL sobre una conexion dedicada.
+    El candado pertenece a la sesion: si el worker muere, MySQL lo libera y otro worker lo toma.
+    """
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.conexion = None
+
+    def adquirir(self) -> bool:
+        """Retorna True si este proceso es (o se convierte en) el lider."""
+        if self.conexion is not None:
+            try:
+                self.conexion.execute(text("SELECT 1"))
+                self.conexion.commit()
+                return True
+            except Exception as e:
+                print(f"Se perdio la conexion del candado de mantenimiento: {e}")
+                self.liberar()
+
+        conexion = None
+        try:
+            conexion = engine.connect()
+            obtenido = conexion.execute(text("SELECT GET_LOCK(:nombre, 0)"), {"nombre": self.nombre}).scalar()
+            conexion.commit()
+            if obtenido == 1:
+                self.conexion = conexion
+                print("Este worker es el lider del mantenimiento programado")
+                return True
+            conexion.close()
+        except Exception as e:
+            print(f"Error al obtener el candado de mantenimiento: {e}")
+            if conexion is not None:
+                conexion.close()
+        return False
+
+    def liberar(self):
+        if self.conexion is None:
+            return
+        try:
+            self.conexion.execute(text("SELECT RELEASE_LOCK(:nombre)"), {"nombre": self.nombre})
+            self.conexion.commit()
+        except Exception:
+            pass
+        finally:
+            try:
+                self.conexion.close()
+            except Exception:
+                pass
+            self.conexion = None
+
+
+class TareaMantenimiento:
+    """Tarea periodica; `funcion` recibe una sesion y retorna las filas afectadas."""
+
+    def __init__(self, nombre: str, intervalo_s: float, funcion: Callable[[Session], int]):
+        self.nombre = nombre
+        self.intervalo_s = intervalo_s
+        self.funcion = funcion
+        self.proxima = time.monotonic() + MANT_RETRASO_INICIAL_S
+        self.historial = deque(maxlen=20)
+
+
+def _limpiar_tokens_recuperacion(db: Session) -> int:
+    return crud.limpiar_tokens_expirados(db, tam_lote=MANT_TAM_LOTE)
+
+
+def _limpiar_logs(db: Session) -> int:
+    return crud.eliminar_logs_antiguos(db, MANT_RETENCION_LOGS_DIAS, tam_lote=MANT_TAM_LOTE)
+
+
+def _limpiar_tokens_fcm(db: Session) -> int:
+    return crud.eliminar_tokens_fcm_inactivos(db, MANT_RETENCION_TOKENS_FCM_DIAS, tam_lote=MANT_TAM_LOTE)
+
+
+def _limpiar_notificaciones(db: Session) -> int:
+    return crud.eliminar_notificaciones_antiguas(db, MANT_RETENCION_NOTIFICACIONES_DIAS, tam_lote=MANT_TAM_LOTE)
+
+
+def _limpiar_trabajos_reporte(db: Session) -> int:
+    from app.services.reportes_trabajos import limpiar_trabajos_expirados
+    return limpiar_trabajos_expirados(db)
+
+
+TAREAS = [
+    TareaMantenimiento("tokens_recuperacion_expirados", MANT_INTERVALO_TOKENS_RECUPERACION_S, _limpiar_tokens_recuperacion),
+    TareaMantenimiento("logs_antiguos", MANT_INTERVALO_LOGS_S, _limpiar_logs),
+    TareaMantenimiento("tokens_fcm_inactivos", MANT_INTERVALO_TOKENS_FCM_S, _limpiar_tokens_fcm),
+    TareaMantenimiento("trabajos_reporte_expirados", MANT_INTERVALO_TRABAJOS_REPORTE_S, _limpiar_trabajos_reporte),
+    TareaMantenimiento("notificaciones_antiguas", MANT_INTERVALO_NOTIFICACIONES_S, _limpiar_notificaciones),
+]
+
+_candado = CandadoLider(NOMBRE_CANDADO_LIDER)
+_detener = threading.Event()
+_hilo: Optional[threading.Thread] = None
+
+
+def ejecutar_tarea(tarea: TareaMantenimiento) -> dict:
+    """Ejecuta una tarea, registra duracion y filas afectadas y programa la siguiente ejecucion."""
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    registro = {"inicio": datetime.utcnow().isoformat(timespec="seconds"), "filas": 0, "error": None}
+    try:
+        registro["filas"] = tarea.funcion(db)
+    except Exception as e:
+        db.rollback()
+        registro["error"] = str(e)
+    finally:
+        registro["duracion_s"] = round(time.perf_counter() - inicio, 3)
+        tarea.proxima = time.monotonic() + tarea.intervalo_s
+        tarea.historial.append(registro)
+
+        try:
+            if registro["error"]:
+                crud.create_log(db, log=schemas.LogSistemaCreate(
+                    tipo=models.TipoLogEnum.error,
+                    mensaje=f"Mantenimiento '{tarea.nombre}' fallo en {registro['duracion_s']} s: {registro['error']}"
+                ))
+            else:
+                crud.create_log(db, log=schemas.LogSistemaCreate(
+                    tipo=models.TipoLogEnum.info,
+                    mensaje=f"Mantenimiento '{tarea.nombre}': {registro['filas']} filas eliminadas en {registro['duracion_s']} s"
+                ))
+        except Exception as e:
+            print(f"Error al registrar el mantenimiento '{tarea.nombre}': {e}")
+        db.close()
+
+    return registro
+
+
+def _ciclo():
+    while not _detener.wait(MANT_TICK_S):
+        if not _candado.adquirir():
+            continue
+        for tarea in TAREAS:
+            if _detener.is_set():
+                break
+            if time.monotonic() >= tarea.proxima:
+                ejecutar_tarea(tarea)
+    _candado.liberar()
+
+
+def iniciar():
+    """Inicia el programador en un hilo de fondo (se llama al arrancar la aplicacion)."""
+    global _hilo
+    if not MANT_HABILITADO or (_hilo is not None and _hilo.is_alive()):
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_ciclo, name="mantenimiento", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    """Detiene el programador y libera el candado de lider."""
+    _detener.set()
+    if _hilo is not None:
+        _hilo.join(timeout=MANT_TICK_S + 5)
+
+
+def obtener_estado() -> dict:
+    """Estado del programador: si es lider y las ultimas ejecuciones de cada tarea."""
+    ahora = time.monotonic()
+    return {
+        "habilitado": MANT_HABILITADO,
+        "lider": _candado.conexion is not None,
+        "tareas": {
+            tarea.nombre: {
+                "intervalo_s": tarea.intervalo_s,
+                "proxima_en_s": round(max(tarea.proxima - ahora, 0), 1),
+                "ejecuciones": list(tarea.historial),
+            }
+            for tarea in TAREAS
+        },
+    }
@@ -0,0 +1,184 @@
+"""
+Miniaturas de las imagenes de eventos (Pillow).
+
+Las tarjetas de la galeria y la vista previa de EventoOptimizado miden ~200 px: en lugar de la imagen
+original se sirve una miniatura WebP o JPEG generada la primera vez que se pide, o al recibir la imagen
+con `pregenerar`. Se guardan en una cache en disco compartida por todos los procesos; el nombre de cada
+archivo es el hash de la URL de origen y de los parametros de la variante. Se asume que una URL de imagen
+no se reutiliza para otro contenido: si se sobrescribe el original, la miniatura vieja se sigue sirviendo
+hasta que la cache la desaloje.
+"""
+from io import BytesIO
+from typing import Optional
+from urllib.parse import urlsplit
+import hashlib
+import os
+import tempfile
+
+from app.config import obtener_configuracion
+from app.services.cache import CacheDiscoLRU
+
+config = obtener_configuracion()
+
+# Lado mayor de la miniatura en pixeles (el doble de la altura de las tarjetas, para pantallas de alta densidad)
+MINIATURAS_LADO = config.entero("MINIATURAS_LADO", 384)
+MINIATURAS_CALIDAD = config.entero("MINIATURAS_CALIDAD", 80)
+MINIATURAS_CACHE_DIR = config.texto("MINIATURAS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "thermal_miniaturas"))
+MINIATURAS_CACHE_MAX_MB = config.decimal("MINIATURAS_CACHE_MAX_MB", 200)
+MINIATURAS_TIMEOUT_S = config.decimal("MINIATURAS_TIMEOUT_S", 10)
+# Imagenes de origen mas grandes que esto no se descargan
+MINIATURAS_MAX_ORIGEN_MB = config.decimal("MINIATURAS_MAX_ORIGEN_MB", 25)
+# Hosts de los que se descargan originales, separados por comas; cualquier otra URL se rechaza sin pedirla
+MINIATURAS_HOSTS_PERMITIDOS = {
+    host.strip().lower()
+    for host in config.texto("MINIATURAS_HOSTS_PERMITIDOS", "thermalalmacen.blob.core.windows.net").split(",")
+    if host.strip()
+}
+# Generar las miniaturas en segundo plano al recibir una imagen
+MINIATURAS_PREGENERAR = config.booleano("MINIATURAS_PREGENERAR", True)
+
+# Incrementar al cambiar como se generan las miniaturas para no servir las viejas de la cache
+MINIATURA_VERSION = 1
+
+# formato -> (formato de Pillow, tipo MIME)
+FORMATOS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+# Hash corto de los parametros de la variante; va en la URL (?v=) para que un cambio de tamaño,
+# calidad o version produzca URLs nuevas en lugar de servir la miniatura vieja guardada por el cliente
+VERSION_VARIANTE = hashlib.sha256(
+    f"{MINIATURAS_LADO}|{MINIATURAS_CALIDAD}|{MINIATURA_VERSION}".encode()
+).hexdigest()[:12]
+
+# Con la version vigente en la URL el contenido no cambia: los clientes pueden guardarla indefinidamente
+CACHE_CONTROL_MINIATURAS = "public, max-age=31536000, immutable"
+# URLs sin version o con una anterior: el cliente revalida en cada uso
+CACHE_CONTROL_MINIATURAS_SIN_VERSION = "public, no-cache"
+
+cache_miniaturas = CacheDiscoLRU(MINIATURAS_CACHE_DIR, int(MINIATURAS_CACHE_MAX_MB * 1024 * 1024))
+
+
+def url_miniatura(imagen_id: int) -> str:
+    return f"/miniaturas/{imagen_id}?v={VERSION_VARIANTE}"
+
+
+def cache_control_para(version: Optional[str]) -> str:
+    """Cache-Control de una miniatura segun la version (?v=) con la que se pidio."""
+    return CACHE_CONTROL_MINIATURAS if version == VERSION_VARIANTE else CACHE_CONTROL_MINIATURAS_SIN_VERSION
+
+
+def formato_para(accept: Optional[str]) -> str:
+    """WebP si el cliente lo acepta (encabezado Accept); si no, JPEG."""
+    return "webp" if accept and "image/webp" in accept.lower() else "jpeg"
+
+
+def clave_miniatura(ruta_imagen: str, formato: str) -> str:
+    """Nombre en cache: hash del origen y de los parametros de la variante."""
+    contenido = "|".join(str(valor) for valor in (
+        ruta_imagen, formato, MINIATURAS_LADO, MINIATURAS_CALIDAD, MINIATURA_VERSION
+    ))
+    return f"{hashlib.sha256(contenido.encode()).hexdigest()}.{formato}"
+
+
+def origen_permitido(ruta_imagen: str) -> bool:
+    """True si la URL es http(s) y apunta a uno de MINIATURAS_HOSTS_PERMITIDOS."""
+    try:
+        url = urlsplit(ruta_imagen)
+        host = (url.hostname or "").lower()
+    except ValueError:
+        return False
+    return url.scheme in ("http", "https") and host in MINIATURAS_HOSTS_PERMITIDOS
+
+
+def descargar_imagen(ruta_imagen: str) -> bytes:
+    """Descarga la imagen original, cortando si excede MINIATURAS_MAX_ORIGEN_MB."""
+    # Import diferido: requests solo se carga cuando hay que descargar un original
+    import requests
+
+    # La ruta la envia el cliente al registrar la imagen: solo se piden hosts conocidos y sin redirecciones
+    if not origen_permitido(ruta_imagen):
+        raise ValueError(f"Origen de imagen no permitido: {ruta_imagen}")
+
+    limite = int(MINIATURAS_MAX_ORIGEN_MB * 1024 * 1024)
+    datos = bytearray()
+    with requests.get(ruta_imagen, stream=True, timeout=MINIATURAS_TIMEOUT_S, allow_redirects=False) as respuesta:
+        if respuesta.is_redirect:
+            raise ValueError(f"La imagen responde con una redireccion: {ruta_imagen}")
+        respuesta.raise_for_status()
+        for bloque in respuesta.iter_content(64 * 1024):
+            datos.extend(bloque)
+            if len(datos) > limite:
+                raise ValueError(f"La imagen excede {MINIATURAS_MAX_ORIGEN_MB} MB: {ruta_imagen}")
+    return bytes(datos)
+
+
+def generar_miniatura(origen: bytes, formato: str) -> bytes:
+    """Reduce la imagen a MINIATURAS_LADO (conservando proporcion) y la codifica en `formato`."""
+    # Import diferido: Pillow solo se carga al generar una miniatura
+    from PIL import Image, ImageOps
+
+    formato_pil, _ = FORMATOS[formato]
+    salida = BytesIO()
+    with Image.open(BytesIO(origen)) as imagen:
+        # En JPEG el decodificador reduce la escala al leer, sin decodificar la imagen completa
+        imagen.draft("RGB", (MINIATURAS_LADO, MINIATURAS_LADO))
+        miniatura = ImageOps.exif_transpose(imagen)
+        if miniatura.mode not in ("RGB", "L"):
+            miniatura = miniatura.convert("RGB")
+        miniatura.thumbnail((MINIATURAS_LADO, MINIATURAS_LADO), Image.LANCZOS)
+
+        opciones = {"quality": MINIATURAS_CALIDAD}
+        if formato_pil == "JPEG":
+            opciones.update(optimize=True, progressive=True)
+        miniatura.save(salida, format=formato_pil, **opciones)
+    return salida.getvalue()
+
+
+def _guardar_en_cache(clave: str, contenido: bytes):
+    ruta_temporal = cache_miniaturas.ruta_temporal(clave)
+    try:
+        with open(ruta_temporal, "wb") as archivo:
+            archivo.write(contenido)
+        cache_miniaturas.guardar(clave, ruta_temporal)
+    except OSError as e:
+        # Sin cache la miniatura se sigue sirviendo; solo se volvera a generar
+        print(f"No se pudo guardar la miniatura {clave} en la cache: {e}")
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+
+
+def obtener_miniatura(ruta_imagen: str, formato: str) -> bytes:
+    """Contenido de la miniatura: desde la cache o generada (y guardada) si aun no existe."""
+    clave = clave_miniatura(ruta_imagen, formato)
+    ruta = cache_miniaturas.obtener(clave)
+    if ruta:
+        try:
+            with open(ruta, "rb") as archivo:
+                return archivo.read()
+        except FileNotFoundError:
+            pass  # otro proceso la desalojo entre la consulta y la apertura
+
+    contenido = generar_miniatura(descargar_imagen(ruta_imagen), formato)
+    _guardar_en_cache(clave, contenido)
+    return contenido
+
+
+def pregenerar(ruta_imagen: str):
+    """Genera todas las variantes de una imagen recien recibida (se ejecuta en segundo plano)."""
+    if not origen_permitido(ruta_imagen):
+        print(f"No se pregeneran miniaturas de un origen no permitido: {ruta_imagen}")
+        return
+
+    pendientes = [formato for formato in FORMATOS
+                  if not os.path.exists(cache_miniaturas.ruta(clave_miniatura(ruta_imagen, formato)))]
+    if not pendientes:
+        return
+
+    try:
+        origen = descargar_imagen(ruta_imagen)
+        for formato in pendientes:
+            _guardar_en_cache(clave_miniatura(ruta_imagen, formato), generar_miniatura(origen, formato))
+    except Exception as e:
+        print(f"Error al pregenerar las miniaturas de {ruta_imagen}: {e}")
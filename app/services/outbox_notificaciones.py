@@ -0,0 +1,264 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+import random
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.database import SessionLocal, engine
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+# Transporte de envio: "fcm" (Firebase) o "falso" (en memoria, para pruebas locales)
+NOTIFICACIONES_TRANSPORTE = config.texto("NOTIFICACIONES_TRANSPORTE", "fcm").lower()
+NOTIFICACIONES_HABILITADO = config.booleano("NOTIFICACIONES_HABILITADO", True)
+NOTIFICACIONES_INTERVALO_S = config.decimal("NOTIFICACIONES_INTERVALO_S", 5)
+NOTIFICACIONES_TAM_LOTE = config.entero("NOTIFICACIONES_TAM_LOTE", 20)
+NOTIFICACIONES_MAX_INTENTOS = config.entero("NOTIFICACIONES_MAX_INTENTOS", 6)
+NOTIFICACIONES_BACKOFF_BASE_S = config.decimal("NOTIFICACIONES_BACKOFF_BASE_S", 5)
+NOTIFICACIONES_BACKOFF_MAX_S = config.decimal("NOTIFICACIONES_BACKOFF_MAX_S", 900)
+# Ventana de agrupacion: los eventos creados dentro de la ventana del ultimo envio
+# se juntan en un solo resumen ("N nuevos eventos"). 0 desactiva la agrupacion.
+NOTIFICACIONES_VENTANA_S = config.decimal("NOTIFICACIONES_VENTANA_S", 120)
+
+# Candado de MySQL (GET_LOCK) que serializa entre workers la revision de la ventana y el envio
+NOMBRE_CANDADO_ENVIO = "thermal_outbox_envio"
+
+
+class TransporteFCM:
+    """Envia las notificaciones con Firebase Cloud Messaging."""
+    nombre = "fcm"
+
+    def enviar_nuevo_evento(self, tokens_fcm: list, evento_id: int) -> dict:
+        # Import diferido: Firebase solo se inicializa si este transporte se usa
+        from app.services.firebase_notifications import enviar_notificacion_multiple
+        return enviar_notificacion_multiple(tokens_fcm, evento_id)
+
+    def enviar_resumen_eventos(self, tokens_fcm: list, evento_ids: list) -> dict:
+        from app.services.firebase_notifications import enviar_resumen_eventos
+        return enviar_resumen_eventos(tokens_fcm, evento_ids)
+
+
+class TransporteFalso:
+    """Transporte en memoria para desarrollo local; `fallar` simula errores de envio."""
+    nombre = "falso"
+
+    def __init__(self):
+        self.enviados = deque(maxlen=100)
+        self.fallar = False
+
+    def enviar_nuevo_evento(self, tokens_fcm: list, evento_id: int) -> dict:
+        return self.enviar_resumen_eventos(tokens_fcm, [evento_id])
+
+    def enviar_resumen_eventos(self, tokens_fcm: list, evento_ids: list) -> dict:
+        if self.fallar:
+            raise RuntimeError("Fallo simulado del transporte falso")
+        self.enviados.append({"evento_ids": list(evento_ids), "tokens": len(tokens_fcm),
+                              "hora": datetime.utcnow().isoformat(timespec="seconds")})
+        print(f"[notificacion falsa] eventos {list(evento_ids)} a {len(tokens_fcm)} dispositivos")
+        return {"exitosos": len(tokens_fcm), "fallidos": 0, "errores": {}, "tokens_invalidos": []}
+
+
+transporte = TransporteFalso() if NOTIFICACIONES_TRANSPORTE == "falso" else TransporteFCM()
+
+_metricas = {"ciclos": 0, "enviadas": 0, "reintentos": 0, "fallidas": 0, "tokens_desactivados": 0,
+             "resumenes": 0, "envios_suprimidos": 0, "diferidas": 0}
+_metricas_lock = threading.Lock()
+_despertar = threading.Event()
+_detener = threading.Event()
+_hilo: Optional[threading.Thread] = None
+
+
+def _contar(clave: str, cantidad: int = 1):
+    with _metricas_lock:
+        _metricas[clave] += cantidad
+
+
+def calcular_espera(intentos: int) -> float:
+    """Backoff exponencial con jitter: base * 2^(intentos-1), acotado a NOTIFICACIONES_BACKOFF_MAX_S."""
+    espera = min(NOTIFICACIONES_BACKOFF_BASE_S * (2 ** (intentos - 1)), NOTIFICACIONES_BACKOFF_MAX_S)
+    return espera * random.uniform(0.8, 1.2)
+
+
+def _enviar(grupo: list, tokens_fcm: list, tokens_invalidos: set):
+    """
+    Envia un grupo de notificaciones: una sola es individual, varias se envian como resumen.
+    Lanza excepcion si ningun dispositivo valido la recibio.
+    """
+    if not tokens_fcm:
+        return
+    if len(grupo) == 1:
+        resultado = transporte.enviar_nuevo_evento(tokens_fcm, grupo[0].evento_id)
+    else:
+        resultado = transporte.enviar_resumen_eventos(tokens_fcm, [n.evento_id for n in grupo])
+    tokens_invalidos.update(resultado.get("tokens_invalidos", ()))
+    # Los tokens invalidos se desactivan; no justifican reintentar el envio
+    if resultado["exitosos"] == 0 and resultado["fallidos"] > len(resultado.get("tokens_invalidos", ())):
+        primer_error = next(iter(resultado["errores"].values()), None)
+        raise RuntimeError(f"Ningun dispositivo recibio la notificacion: {primer_error}")
+
+
+def _procesar(db: Session, grupo: list, tokens_fcm: list, tokens_invalidos: set):
+    for notificacion in grupo:
+        notificacion.intentos += 1
+    try:
+        _enviar(grupo, tokens_fcm, tokens_invalidos)
+    except Exception as e:
+        for notificacion in grupo:
+            notificacion.ultimo_error = str(e)[:1000]
+            if notificacion.intentos >= NOTIFICACIONES_MAX_INTENTOS:
+                notificacion.estado = models.EstadoNotificacionEnum.fallida
+                # Sin commit intermedio: los candados de las demas filas del lote se conservan
+                db.add(models.LogSistema(
+                    tipo=models.TipoLogEnum.error,
+                    mensaje=f"Notificacion #{notificacion.notificacion_id} del evento #{notificacion.evento_id} "
+                            f"descartada tras {notificacion.intentos} intentos: {notificacion.ultimo_error}"
+                ))
+                _contar("fallidas")
+            else:
+                notificacion.proximo_intento = datetime.utcnow() + timedelta(seconds=calcular_espera(notificacion.intentos))
+                _contar("reintentos")
+        return
+
+    ahora = datetime.utcnow()
+    for notificacion in grupo:
+        notificacion.estado = models.EstadoNotificacionEnum.enviada
+        notificacion.fecha_envio = ahora
+        notificacion.ultimo_error = None
+    _contar("enviadas", len(grupo))
+    if len(grupo) > 1:
+        _contar("resumenes")
+        _contar("envios_suprimidos", len(grupo) - 1)
+
+
+@contextmanager
+def _candado_envio():
+    """
+    Toma NOMBRE_CANDADO_ENVIO en una conexion dedicada; produce False si otro worker lo tiene.
+    Cada worker corre su propio despachador: sin el candado, uno podria revisar la ventana mientras
+    el envio de otro aun no se confirma y enviar de nuevo dentro de la misma ventana.
+    """
+    conexion = engine.connect()
+    try:
+        obtenido = conexion.execute(text("SELECT GET_LOCK(:nombre, 0)"), {"nombre": NOMBRE_CANDADO_ENVIO}).scalar() == 1
+        conexion.commit()
+        try:
+            yield obtenido
+        finally:
+            if obtenido:
+                try:
+                    conexion.execute(text("SELECT RELEASE_LOCK(:nombre)"), {"nombre": NOMBRE_CANDADO_ENVIO})
+                    conexion.commit()
+                except Exception as e:
+                    # Descartar la conexion cierra la sesion de MySQL, y con ella el candado
+                    print(f"No se pudo liberar el candado del outbox: {e}")
+                    conexion.invalidate()
+    finally:
+        conexion.close()
+
+
+def despachar_pendientes() -> int:
+    """
+    Envia las notificaciones vencidas. Si ya hubo un envio dentro de la ventana de agrupacion,
+    las difiere al cierre de la ventana para enviarlas juntas. Retorna cuantas se enviaron o intentaron.
+    Con agrupacion, solo un worker a la vez revisa la ventana y envia (ver _candado_envio).
+    """
+    if NOTIFICACIONES_VENTANA_S <= 0:
+        return _despachar()
+    try:
+        with _candado_envio() as obtenido:
+            # Si otro worker tiene el candado, ese worker despacha en este ciclo
+            return _despachar() if obtenido else 0
+    except Exception as e:
+        print(f"Error al obtener el candado del outbox: {e}")
+        return 0
+
+
+def _despachar() -> int:
+    db = SessionLocal()
+    try:
+        pendientes = crud.get_notificaciones_pendientes(db, NOTIFICACIONES_TAM_LOTE)
+        if not pendientes:
+            db.commit()
+            return 0
+
+        if NOTIFICACIONES_VENTANA_S > 0:
+            ultimo_envio = crud.get_ultimo_envio_notificacion(db)
+            cierre_ventana = ultimo_envio + timedelta(seconds=NOTIFICACIONES_VENTANA_S) if ultimo_envio else None
+            if cierre_ventana and datetime.utcnow() < cierre_ventana:
+                for notificacion in pendientes:
+                    notificacion.proximo_intento = cierre_ventana
+                _contar("diferidas", len(pendientes))
+                db.commit()
+                return 0
+            grupos = [pendientes]
+        else:
+            grupos = [[notificacion] for notificacion in pendientes]
+
+        # Los tokens se resuelven al enviar, no al crear el evento
+        tokens_operadores = crud.get_tokens_operadores_activos(db)
+        tokens_invalidos = set()
+        for grupo in grupos:
+            _procesar(db, grupo, tokens_operadores, tokens_invalidos)
+            if tokens_invalidos:
+                tokens_operadores = [t for t in tokens_operadores if t not in tokens_invalidos]
+
+        db.commit()
+
+        if tokens_invalidos:
+            desactivados = crud.desactivar_tokens_fcm_por_valor(db, list(tokens_invalidos))
+            _contar("tokens_desactivados", desactivados)
+            print(f"{desactivados} tokens FCM invalidos desactivados")
+        return len(pendientes)
+    except Exception as e:
+        db.rollback()
+        print(f"Error al despachar notificaciones: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+def despertar():
+    """Pide al despachador revisar el outbox de inmediato (p. ej. despues de crear un evento)."""
+    _despertar.set()
+
+
+def _ciclo():
+    while not _detener.is_set():
+        _contar("ciclos")
+        procesadas = despachar_pendientes()
+        if procesadas >= NOTIFICACIONES_TAM_LOTE:
+            continue
+        _despertar.wait(NOTIFICACIONES_INTERVALO_S)
+        _despertar.clear()
+
+
+def iniciar():
+    """Inicia el despachador del outbox en un hilo de fondo."""
+    global _hilo
+    if not NOTIFICACIONES_HABILITADO or (_hilo is not None and _hilo.is_alive()):
+        return
+    _detener.clear()
+    _hilo = threading.Thread(target=_ciclo, name="outbox_notificaciones", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    _detener.set()
+    _despertar.set()
+    if _hilo is not None:
+        _hilo.join(timeout=NOTIFICACIONES_INTERVALO_S + 5)
+
+
+def obtener_metricas() -> dict:
+    with _metricas_lock:
+        metricas = dict(_metricas)
+    metricas["transporte"] = transporte.nombre
+    metricas["ventana_s"] = NOTIFICACIONES_VENTANA_S
+    metricas["activo"] = _hilo is not None and _hilo.is_alive()
+    return metricas
@@ -0,0 +1,96 @@
+"""
+Precarga de servicios pesados despues del arranque.
+
+Las librerias grandes (reportlab/matplotlib, firebase_admin, sendgrid, requests, Pillow) se importan
+la primera vez que se usan. Con PRECARGA_SERVICIOS=true se cargan en un hilo de fondo al
+iniciar el worker, asi el arranque sigue siendo rapido y la primera peticion no paga la importacion.
+"""
+from typing import Callable, Optional
+import threading
+import time
+
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+PRECARGA_SERVICIOS = config.booleano("PRECARGA_SERVICIOS", False)
+
+_estado = {"completada": False, "tiempos_ms": {}, "errores": {}}
+_estado_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+
+
+def _precargar_reportes():
+    # Los reportes se renderizan en el pool de procesos: se arranca aqui en lugar de importar en la API
+    from app.services import reportes_trabajos
+    reportes_trabajos.iniciar_pool()
+
+
+def _precargar_firebase():
+    from app.services import outbox_notificaciones
+    if outbox_notificaciones.transporte.nombre != "fcm":
+        return
+    from app.services.firebase_notifications import inicializar_firebase
+    inicializar_firebase()
+
+
+def _precargar_correo():
+    from app.services import email_service
+    if email_service.EMAIL_TRANSPORTE == "sendgrid":
+        import sendgrid  # noqa: F401
+
+
+def _precargar_aire():
+    import requests  # noqa: F401
+
+
+def _precargar_miniaturas():
+    from PIL import Image  # noqa: F401
+
+
+# Nombre -> funcion que importa o inicializa el servicio
+TAREAS_PRECARGA: "dict[str, Callable[[], None]]" = {
+    "reportes": _precargar_reportes,
+    "firebase": _precargar_firebase,
+    "correo": _precargar_correo,
+    "aire": _precargar_aire,
+    "miniaturas": _precargar_miniaturas,
+}
+
+
+def precargar_servicios() -> dict:
+    """Ejecuta todas las precargas y retorna el tiempo en ms de cada una."""
+    for nombre, tarea in TAREAS_PRECARGA.items():
+        inicio = time.perf_counter()
+        try:
+            tarea()
+        except Exception as e:
+            print(f"Error en la precarga de '{nombre}': {e}")
+            with _estado_lock:
+                _estado["errores"][nombre] = str(e)
+        with _estado_lock:
+            _estado["tiempos_ms"][nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    with _estado_lock:
+        _estado["completada"] = True
+        print(f"Precarga de servicios completada: {_estado['tiempos_ms']}")
+        return dict(_estado["tiempos_ms"])
+
+
+def iniciar():
+    """Lanza la precarga en un hilo de fondo si PRECARGA_SERVICIOS esta activa."""
+    global _hilo
+    if not PRECARGA_SERVICIOS or _hilo is not None:
+        return
+    _hilo = threading.Thread(target=precargar_servicios, name="precarga_servicios", daemon=True)
+    _hilo.start()
+
+
+def obtener_estado() -> dict:
+    with _estado_lock:
+        return {
+            "habilitada": PRECARGA_SERVICIOS,
+            "completada": _estado["completada"],
+            "tiempos_ms": dict(_estado["tiempos_ms"]),
+            "errores": dict(_estado["errores"]),
+        }
@@ -4,16 +4,38 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
+from matplotlib.figure import Figure
+import numpy as np
 import io
-import os
-from typing import List, Optional
+import multiprocessing
+import threading
+from typing import BinaryIO, Dict, List, Optional, Union
 
+from app.config import obtener_configuracion
+from app.services.analitica_reportes import DIAS_SEMANA, arreglo_promedios_aire, resumen_valores
 
-def generar_grafica_eventos_por_estatus(eventos_stats: dict) -> str:
+config = obtener_configuracion()
+
+# Procesos para renderizar las graficas en paralelo (0 o 1: en serie, en el mismo proceso)
+GRAFICAS_WORKERS = config.entero("GRAFICAS_WORKERS", 2)
+GRAFICAS_CONTEXTO_MP = config.texto("GRAFICAS_CONTEXTO_MP", "spawn")
+
+# (nombre, clave, limite OMS en ug/m3)
+PARAMETROS_AIRE = (('PM10', 'pm10', 45), ('PM2.5', 'pm2p5', 15), ('PM1.0', 'pm1p0', 10))
+
+
+def _figura_a_png(fig: Figure) -> bytes:
+    img_buffer = io.BytesIO()
+    fig.savefig(img_buffer, format='png', bbox_inches='tight', dpi=150)
+    return img_buffer.getvalue()
+
+
+def generar_grafica_eventos_por_estatus(eventos_stats: dict) -> bytes:
+    """Grafica de pastel por estatus; retorna el PNG en memoria."""
     labels = ['Confirmados', 'Descartados', 'Pendientes']
     sizes = [
         eventos_stats.get('eventos_confirmados', 0),
@@ -23,44 +45,40 @@ def generar_grafica_eventos_por_estatus(eventos_stats: dict) -> str:
     colors_chart = ['#4CAF50', '#D32F2F', '#1976D2']
     explode = (0.05, 0.05, 0.05)
 
-    fig, ax = plt.subplots(figsize=(8, 6))
+    # Figure sin pyplot: no comparte estado global entre hilos
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
     ax.pie(sizes, explode=explode, labels=labels, colors=colors_chart,
            autopct='%1.1f%%', shadow=True, startangle=90)
     ax.axis('equal')
-    plt.title('Distribución de Eventos por Estatus', fontsize=14, fontweight='bold')
-
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png', bbox_inches='tight', dpi=150)
-    img_buffer.seek(0)
-    plt.close()
-
-    temp_path = f"/tmp/grafica_estatus_{datetime.now().timestamp()}.png"
-    with open(temp_path, 'wb') as f:
-        f.write(img_buffer.getvalue())
+    ax.set_title('Distribución de Eventos por Estatus', fontsize=14, fontweight='bold')
 
-    return temp_path
+    return _figura_a_png(fig)
 
 
-def generar_grafica_calidad_aire(eventos_con_aire: List[dict]) -> Optional[str]:
+def generar_grafica_calidad_aire(eventos_con_aire: List[dict]) -> Optional[bytes]:
+    """Grafica de barras de PM contra limites OMS; retorna el PNG en memoria o None sin datos."""
     if not eventos_con_aire:
         return None
 
-    pm10_values = [e['promedio_pm10'] for e in eventos_con_aire if e.get('promedio_pm10')]
-    pm2p5_values = [e['promedio_pm2p5'] for e in eventos_con_aire if e.get('promedio_pm2p5')]
-    pm1p0_values = [e['promedio_pm1p0'] for e in eventos_con_aire if e.get('promedio_pm1p0')]
-
-    if not pm10_values and not pm2p5_values and not pm1p0_values:
+    valores = arreglo_promedios_aire([
+        (e.get('promedio_pm10'), e.get('promedio_pm2p5'), e.get('promedio_pm1p0')) for e in eventos_con_aire
+    ])
+    con_datos = ~np.isnan(valores)
+    if not con_datos.any():
         return None
 
-    promedio_pm10 = sum(pm10_values) / len(pm10_values) if pm10_values else 0
-    promedio_pm2p5 = sum(pm2p5_values) / len(pm2p5_values) if pm2p5_values else 0
-    promedio_pm1p0 = sum(pm1p0_values) / len(pm1p0_values) if pm1p0_values else 0
+    # Promedio por columna ignorando NaN (0 si el parametro no tiene datos)
+    promedio_pm10, promedio_pm2p5, promedio_pm1p0 = (
+        np.where(con_datos, valores, 0).sum(axis=0) / np.maximum(con_datos.sum(axis=0), 1)
+    ).tolist()
 
     limite_pm10 = 45
     limite_pm2p5 = 15
     limite_pm1p0 = 10
 
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
 
     categories = ['PM10', 'PM2.5', 'PM1.0']
     promedios = [promedio_pm10, promedio_pm2p5, promedio_pm1p0]
@@ -94,13 +112,165 @@ def generar_grafica_calidad_aire(eventos_con_aire: List[dict]) -> Optional[str]:
                 f'{height:.1f}',
                 ha='center', va='bottom', fontsize=9, fontweight='bold')
 
-    plt.tight_layout()
+    fig.tight_layout()
+
+    return _figura_a_png(fig)
+
+
+def generar_grafica_detecciones_tiempo(por_hora: List[int], por_dia: List[int]) -> Optional[bytes]:
+    """Detecciones por hora del dia y por dia de la semana; None si no hay detecciones."""
+    por_hora = np.asarray(por_hora)
+    por_dia = np.asarray(por_dia)
+    if por_hora.sum() == 0:
+        return None
+
+    fig = Figure(figsize=(10, 7))
+    ax_hora, ax_dia = fig.subplots(2, 1)
 
-    temp_path = f"/tmp/grafica_aire_{datetime.now().timestamp()}.png"
-    plt.savefig(temp_path, format='png', bbox_inches='tight', dpi=150)
-    plt.close()
+    ax_hora.bar(np.arange(24), por_hora, color='#546E7A')
+    ax_hora.bar(por_hora.argmax(), por_hora.max(), color='#D32F2F')
+    ax_hora.set_xticks(np.arange(0, 24, 2))
+    ax_hora.set_xlabel('Hora del día', fontweight='bold')
+    ax_hora.set_ylabel('Detecciones', fontweight='bold')
+    ax_hora.set_title('Detecciones por Hora del Día', fontsize=13, fontweight='bold')
+    ax_hora.grid(axis='y', alpha=0.3)
 
-    return temp_path
+    ax_dia.bar(DIAS_SEMANA, por_dia, color='#263238')
+    ax_dia.set_ylabel('Detecciones', fontweight='bold')
+    ax_dia.set_title('Detecciones por Día de la Semana', fontsize=13, fontweight='bold')
+    ax_dia.grid(axis='y', alpha=0.3)
+
+    fig.tight_layout()
+    return _figura_a_png(fig)
+
+
+def generar_grafica_percentiles_aire(percentiles: dict) -> Optional[bytes]:
+    """Bandas p10-p90 y p25-p75 con mediana de los promedios por evento, contra el limite OMS."""
+    parametros = [(nombre, percentiles[clave], limite) for nombre, clave, limite in PARAMETROS_AIRE
+                  if percentiles.get(clave)]
+    if not parametros:
+        return None
+
+    nombres = [nombre for nombre, _, _ in parametros]
+    bandas = np.array([[p['p10'], p['p25'], p['p50'], p['p75'], p['p90']] for _, p, _ in parametros])
+    limites = np.array([limite for _, _, limite in parametros])
+    x = np.arange(len(parametros))
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.bar(x, bandas[:, 4] - bandas[:, 0], bottom=bandas[:, 0], width=0.5,
+           color='#90A4AE', alpha=0.6, label='Percentil 10-90')
+    ax.bar(x, bandas[:, 3] - bandas[:, 1], bottom=bandas[:, 1], width=0.5,
+           color='#546E7A', label='Percentil 25-75')
+    ax.hlines(bandas[:, 2], x - 0.25, x + 0.25, colors='#FFC107', linewidth=3, label='Mediana')
+    ax.hlines(limites, x - 0.35, x + 0.35, colors='#D32F2F', linestyles='--', linewidth=2, label='Límite OMS')
+
+    ax.set_xticks(x)
+    ax.set_xticklabels(nombres)
+    ax.set_ylabel('Concentración (μg/m³)', fontweight='bold')
+    ax.set_title('Distribución de PM por Evento', fontsize=14, fontweight='bold')
+    ax.legend()
+    ax.grid(axis='y', alpha=0.3)
+
+    fig.tight_layout()
+    return _figura_a_png(fig)
+
+
+def generar_grafica_duraciones(duraciones: dict) -> Optional[bytes]:
+    """Histograma de duracion de eventos; None si no hay eventos con imagenes."""
+    conteos = np.asarray(duraciones['conteos'])
+    if conteos.sum() == 0:
+        return None
+
+    fig = Figure(figsize=(10, 4.5))
+    ax = fig.subplots()
+    barras = ax.bar(duraciones['etiquetas'], conteos, color='#1976D2')
+    ax.bar_label(barras, fontsize=9)
+    ax.set_xlabel('Duración (minutos)', fontweight='bold')
+    ax.set_ylabel('Eventos', fontweight='bold')
+    ax.set_title('Distribución de Duración de Eventos', fontsize=14, fontweight='bold')
+    ax.grid(axis='y', alpha=0.3)
+
+    fig.tight_layout()
+    return _figura_a_png(fig)
+
+
+def _calentar_matplotlib():
+    """Inicializador de cada proceso de graficas: carga fuentes y backend una sola vez."""
+    _figura_a_png(Figure(figsize=(1, 1)))
+
+
+_pool_graficas: Optional[ProcessPoolExecutor] = None
+_pool_graficas_lock = threading.Lock()
+
+
+def _obtener_pool_graficas() -> ProcessPoolExecutor:
+    global _pool_graficas
+    with _pool_graficas_lock:
+        if _pool_graficas is None:
+            _pool_graficas = ProcessPoolExecutor(
+                max_workers=GRAFICAS_WORKERS,
+                mp_context=multiprocessing.get_context(GRAFICAS_CONTEXTO_MP),
+                initializer=_calentar_matplotlib
+            )
+        return _pool_graficas
+
+
+def resumen_calidad_aire(estadisticas: dict, eventos: List[dict]) -> dict:
+    """
+    Promedio, maximo y minimo de los promedios por evento de cada parametro.
+    Usa estadisticas['calidad_aire'] (agregado en SQL sobre todo el rango) si viene;
+    si no, lo calcula con los eventos recibidos.
+    """
+    if estadisticas.get('calidad_aire') is not None:
+        return estadisticas['calidad_aire']
+
+    valores = arreglo_promedios_aire([tuple(e.get(f'promedio_{clave}') for _, clave, _ in PARAMETROS_AIRE)
+                                      for e in eventos])
+    return {clave: resumen_valores(valores[:, i]) for i, (_, clave, _) in enumerate(PARAMETROS_AIRE)}
+
+
+def renderizar_graficas(estadisticas: dict, resumen_aire: dict) -> Dict[str, Optional[bytes]]:
+    """
+    Renderiza las graficas del reporte; en paralelo si GRAFICAS_WORKERS > 1.
+    Retorna {nombre: PNG o None} con 'estatus', 'aire', 'percentiles', 'detecciones' y 'duraciones'.
+    """
+    # Solo se envian los valores que usan las graficas
+    conteos = {clave: estadisticas.get(clave, 0)
+               for clave in ('eventos_confirmados', 'eventos_descartados', 'eventos_pendientes')}
+    promedios = [{f'promedio_{clave}': resumen_aire[clave]['promedio'] if resumen_aire.get(clave) else None
+                  for _, clave, _ in PARAMETROS_AIRE}]
+
+    tareas = {
+        'estatus': (generar_grafica_eventos_por_estatus, conteos),
+        'aire': (generar_grafica_calidad_aire, promedios),
+    }
+    analitica = estadisticas.get('analitica')
+    if analitica:
+        tareas['percentiles'] = (generar_grafica_percentiles_aire, analitica['percentiles_aire'])
+        tareas['detecciones'] = (generar_grafica_detecciones_tiempo,
+                                 analitica['detecciones_por_hora'], analitica['detecciones_por_dia'])
+        tareas['duraciones'] = (generar_grafica_duraciones, analitica['duraciones'])
+
+    graficas = dict.fromkeys(('estatus', 'aire', 'percentiles', 'detecciones', 'duraciones'))
+    if GRAFICAS_WORKERS <= 1:
+        for nombre, (funcion, *argumentos) in tareas.items():
+            graficas[nombre] = funcion(*argumentos)
+        return graficas
+
+    pool = _obtener_pool_graficas()
+    futuros = {nombre: pool.submit(funcion, *argumentos) for nombre, (funcion, *argumentos) in tareas.items()}
+    for nombre, futuro in futuros.items():
+        graficas[nombre] = futuro.result()
+    return graficas
+
+
+def detener_graficas():
+    global _pool_graficas
+    with _pool_graficas_lock:
+        if _pool_graficas is not None:
+            _pool_graficas.shutdown(wait=False, cancel_futures=True)
+            _pool_graficas = None
 
 
 def generar_reporte_pdf(
@@ -108,8 +278,9 @@ def generar_reporte_pdf(
         eventos: List[dict],
         fecha_inicio: Optional[str] = None,
         fecha_fin: Optional[str] = None,
-        output_path: str = "/tmp/reporte.pdf"
-) -> str:
+        output_path: Union[str, BinaryIO] = "/tmp/reporte.pdf"
+) -> Union[str, BinaryIO]:
+    """Genera el reporte en `output_path`, que puede ser una ruta o un archivo abierto en modo binario."""
     doc = SimpleDocTemplate(output_path, pagesize=letter,
                             rightMargin=0.5*inch, leftMargin=0.5*inch,
                             topMargin=0.5*inch, bottomMargin=0.5*inch)
@@ -186,10 +357,14 @@ def generar_reporte_pdf(
     story.append(resumen_table)
     story.append(Spacer(1, 0.3*inch))
 
+    resumen_aire = resumen_calidad_aire(estadisticas, eventos)
+
+    # Las graficas son independientes: se renderizan juntas antes de armar el documento
+    graficas = renderizar_graficas(estadisticas, resumen_aire)
+
     story.append(Paragraph("2. DISTRIBUCIÓN DE EVENTOS", subtitle_style))
-    grafica_estatus_path = generar_grafica_eventos_por_estatus(estadisticas)
-    if grafica_estatus_path and os.path.exists(grafica_estatus_path):
-        img = Image(grafica_estatus_path, width=5*inch, height=3.75*inch)
+    if graficas['estatus']:
+        img = Image(io.BytesIO(graficas['estatus']), width=5*inch, height=3.75*inch)
         story.append(img)
         story.append(Spacer(1, 0.2*inch))
 
@@ -198,40 +373,17 @@ def generar_reporte_pdf(
     story.append(Paragraph("3. ANÁLISIS DE CALIDAD DEL AIRE", subtitle_style))
     story.append(Spacer(1, 0.2*inch))
 
-    eventos_con_aire = [e for e in eventos if e.get('promedio_pm10') or e.get('promedio_pm2p5') or e.get('promedio_pm1p0')]
-
-    if eventos_con_aire:
-        pm10_values = [e['promedio_pm10'] for e in eventos_con_aire if e.get('promedio_pm10')]
-        pm2p5_values = [e['promedio_pm2p5'] for e in eventos_con_aire if e.get('promedio_pm2p5')]
-        pm1p0_values = [e['promedio_pm1p0'] for e in eventos_con_aire if e.get('promedio_pm1p0')]
-
+    if any(resumen_aire.values()):
         aire_data = [
             ['Parámetro', 'Promedio', 'Máximo', 'Mínimo', 'Límite OMS', 'Estado']
         ]
 
-        if pm10_values:
-            promedio_pm10 = sum(pm10_values) / len(pm10_values)
-            max_pm10 = max(pm10_values)
-            min_pm10 = min(pm10_values)
-            limite_pm10 = 45
-            estado_pm10 = '⚠ ALTO' if promedio_pm10 > limite_pm10 else '✓ Normal'
-            aire_data.append(['PM10', f'{promedio_pm10:.1f}', f'{max_pm10:.1f}', f'{min_pm10:.1f}', f'{limite_pm10}', estado_pm10])
-
-        if pm2p5_values:
-            promedio_pm2p5 = sum(pm2p5_values) / len(pm2p5_values)
-            max_pm2p5 = max(pm2p5_values)
-            min_pm2p5 = min(pm2p5_values)
-            limite_pm2p5 = 15
-            estado_pm2p5 = '⚠ ALTO' if promedio_pm2p5 > limite_pm2p5 else '✓ Normal'
-            aire_data.append(['PM2.5', f'{promedio_pm2p5:.1f}', f'{max_pm2p5:.1f}', f'{min_pm2p5:.1f}', f'{limite_pm2p5}', estado_pm2p5])
-
-        if pm1p0_values:
-            promedio_pm1p0 = sum(pm1p0_values) / len(pm1p0_values)
-            max_pm1p0 = max(pm1p0_values)
-            min_pm1p0 = min(pm1p0_values)
-            limite_pm1p0 = 10
-            estado_pm1p0 = '⚠ ALTO' if promedio_pm1p0 > limite_pm1p0 else '✓ Normal'
-            aire_data.append(['PM1.0', f'{promedio_pm1p0:.1f}', f'{max_pm1p0:.1f}', f'{min_pm1p0:.1f}', f'{limite_pm1p0}', estado_pm1p0])
+        for nombre, clave, limite in PARAMETROS_AIRE:
+            valores = resumen_aire[clave]
+            if valores:
+                estado = '⚠ ALTO' if valores['promedio'] > limite else '✓ Normal'
+                aire_data.append([nombre, f"{valores['promedio']:.1f}", f"{valores['maximo']:.1f}",
+                                  f"{valores['minimo']:.1f}", f'{limite}', estado])
 
         aire_table = Table(aire_data, colWidths=[1*inch, 1*inch, 1*inch, 1*inch, 1.2*inch, 1*inch])
         aire_table.setStyle(TableStyle([
@@ -249,9 +401,8 @@ def generar_reporte_pdf(
         story.append(aire_table)
         story.append(Spacer(1, 0.3*inch))
 
-        grafica_aire_path = generar_grafica_calidad_aire(eventos_con_aire)
-        if grafica_aire_path and os.path.exists(grafica_aire_path):
-            img_aire = Image(grafica_aire_path, width=6*inch, height=3.6*inch)
+        if graficas['aire']:
+            img_aire = Image(io.BytesIO(graficas['aire']), width=6*inch, height=3.6*inch)
             story.append(img_aire)
 
         story.append(Spacer(1, 0.2*inch))
@@ -263,12 +414,72 @@ def generar_reporte_pdf(
     else:
         story.append(Paragraph("No hay datos suficientes de calidad del aire para análisis.", normal_style))
 
+    analitica = estadisticas.get('analitica') or {}
+    percentiles_aire = analitica.get('percentiles_aire') or {}
+    if any(percentiles_aire.values()):
+        story.append(PageBreak())
+        story.append(Paragraph("Distribución de PM por evento (percentiles)", subtitle_style))
+
+        percentiles_data = [['Parámetro', 'P10', 'P25', 'Mediana', 'P75', 'P90', 'Eventos']]
+        for nombre, clave, _ in PARAMETROS_AIRE:
+            bandas = percentiles_aire.get(clave)
+            if bandas:
+                percentiles_data.append([nombre] + [f"{bandas[p]:.1f}" for p in ('p10', 'p25', 'p50', 'p75', 'p90')]
+                                        + [str(bandas['eventos'])])
+
+        percentiles_table = Table(percentiles_data, colWidths=[1*inch] + [0.9*inch] * 6)
+        percentiles_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), color_secundario),
+            ('TEXTCOLOR', (0, 0), (-1, 0), color_texto_cabecera),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9)
+        ]))
+        story.append(percentiles_table)
+        story.append(Spacer(1, 0.2*inch))
+
+        if graficas['percentiles']:
+            story.append(Image(io.BytesIO(graficas['percentiles']), width=6*inch, height=3*inch))
+
     story.append(PageBreak())
 
-    story.append(Paragraph("4. DETALLE DE EVENTOS", subtitle_style))
+    story.append(Paragraph("4. PATRONES TEMPORALES", subtitle_style))
+    story.append(Spacer(1, 0.2*inch))
+
+    if graficas['detecciones']:
+        story.append(Image(io.BytesIO(graficas['detecciones']), width=6.5*inch, height=4.55*inch))
+        story.append(Spacer(1, 0.2*inch))
+
+    duraciones = analitica.get('duraciones') or {}
+    if graficas['duraciones']:
+        story.append(Image(io.BytesIO(graficas['duraciones']), width=6.5*inch, height=2.9*inch))
+        story.append(Paragraph(
+            f"Duración mediana: {duraciones['mediana_min']:.1f} min — "
+            f"percentil 90: {duraciones['p90_min']:.1f} min (de la primera a la última imagen del evento).",
+            normal_style
+        ))
+
+    if not graficas['detecciones'] and not graficas['duraciones']:
+        story.append(Paragraph("No hay detecciones ni imágenes en este período.", normal_style))
+
+    story.append(PageBreak())
+
+    story.append(Paragraph("5. DETALLE DE EVENTOS", subtitle_style))
     story.append(Spacer(1, 0.2*inch))
 
     if eventos:
+        total_eventos = estadisticas.get('total_eventos', len(eventos))
+        if total_eventos > len(eventos):
+            story.append(Paragraph(
+                f"Se muestran los {len(eventos)} eventos más recientes de {total_eventos} en el período.",
+                normal_style
+            ))
+            story.append(Spacer(1, 0.1*inch))
+
         eventos_data = [['ID', 'Fecha', 'Estatus', 'Detecciones', 'Operador']]
 
         for evento in eventos:
@@ -301,13 +512,5 @@ def generar_reporte_pdf(
 
     doc.build(story)
 
-    try:
-        if grafica_estatus_path and os.path.exists(grafica_estatus_path):
-            os.remove(grafica_estatus_path)
-        if 'grafica_aire_path' in locals() and grafica_aire_path and os.path.exists(grafica_aire_path):
-            os.remove(grafica_aire_path)
-    except:
-        pass
-
     return output_path
 
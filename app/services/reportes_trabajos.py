@@ -0,0 +1,439 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+import zlib
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.database import SessionLocal, engine
+from app.services.cache import CacheDiscoLRU
+from app.config import obtener_configuracion
+
+config = obtener_configuracion()
+
+# Procesos que generan reportes y reportes en curso (trabajos y sincronos) permitidos.
+# Ambos limites son por proceso de la API: cada worker de uvicorn tiene su propio pool y contador,
+# asi que el total del servidor es el valor por el numero de workers
+REPORTES_WORKERS = config.entero("REPORTES_WORKERS", 2)
+REPORTES_MAX_EN_CURSO = config.entero("REPORTES_MAX_EN_CURSO", 4)
+# Tiempo que se conservan el trabajo y su PDF despues de crearse
+REPORTES_TTL_S = config.decimal("REPORTES_TTL_S", 3600)
+# Cache en disco de PDFs generados, compartida por todos los procesos del servidor
+REPORTES_CACHE_DIR = config.texto("REPORTES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "thermal_reportes"))
+REPORTES_CACHE_MAX_MB = config.decimal("REPORTES_CACHE_MAX_MB", 500)
+# PDFs de los trabajos completados (y de los reportes sincronos mientras se envian); la cache no los desaloja
+REPORTES_TRABAJOS_DIR = config.texto("REPORTES_TRABAJOS_DIR", os.path.join(tempfile.gettempdir(), "thermal_reportes_trabajos"))
+REPORTES_TAM_BLOQUE = config.entero("REPORTES_TAM_BLOQUE", 64 * 1024)
+# Eventos en la tabla de detalle (los mas recientes); los totales siempre cubren todo el rango
+REPORTES_MAX_EVENTOS = config.entero("REPORTES_MAX_EVENTOS", 500)
+# "spawn" evita heredar hilos y candados del proceso de la API; "fork" arranca mas rapido
+REPORTES_CONTEXTO_MP = config.texto("REPORTES_CONTEXTO_MP", "spawn")
+
+# Incrementar al cambiar el contenido o formato del PDF para no servir reportes viejos de la cache
+REPORTE_VERSION = 4
+
+cache_reportes = CacheDiscoLRU(REPORTES_CACHE_DIR, int(REPORTES_CACHE_MAX_MB * 1024 * 1024), extension=".pdf")
+
+
+def preparar_datos_reporte(db: Session, fecha_inicio: Optional[date], fecha_fin: Optional[date]) -> Tuple[dict, List[dict]]:
+    """
+    Obtiene las estadisticas y las filas de eventos del reporte con consultas agregadas.
+    Las estadisticas (calidad del aire y analitica incluidas) cubren todo el rango; el detalle solo
+    los REPORTES_MAX_EVENTOS eventos mas recientes, asi la memoria no depende del tamaño del rango.
+    """
+    # Import diferido: NumPy solo se carga al generar un reporte
+    from app.services.analitica_reportes import calcular_analitica
+
+    estadisticas = crud.get_estadisticas_eventos(db, fecha_inicio, fecha_fin)
+    analitica = calcular_analitica(
+        crud.get_detecciones_por_hora_y_dia(db, fecha_inicio, fecha_fin),
+        crud.get_promedios_aire_por_evento(db, fecha_inicio, fecha_fin),
+        crud.get_duraciones_eventos(db, fecha_inicio, fecha_fin)
+    )
+    estadisticas["calidad_aire"] = analitica.pop("calidad_aire")
+    estadisticas["analitica"] = analitica
+
+    eventos_list = crud.get_filas_reporte_eventos(db, fecha_inicio, fecha_fin, limite=REPORTES_MAX_EVENTOS)
+    return estadisticas, eventos_list
+
+
+def generar_reporte(db: Session, fecha_inicio: Optional[date], fecha_fin: Optional[date],
+                    output_path: Union[str, BinaryIO]) -> Union[str, BinaryIO]:
+    """Consulta los datos y escribe el reporte PDF en `output_path` (ruta o archivo binario abierto)."""
+    from app.services.reportes_pdf import generar_reporte_pdf
+
+    estadisticas, eventos_list = preparar_datos_reporte(db, fecha_inicio, fecha_fin)
+    return generar_reporte_pdf(
+        estadisticas=estadisticas,
+        eventos=eventos_list,
+        fecha_inicio=fecha_inicio.strftime("%Y-%m-%d") if fecha_inicio else None,
+        fecha_fin=fecha_fin.strftime("%Y-%m-%d") if fecha_fin else None,
+        output_path=output_path
+    )
+
+
+def clave_reporte(db: Session, fecha_inicio: Optional[date], fecha_fin: Optional[date]) -> str:
+    """Clave de cache: rango de fechas + version de los datos del rango + version del formato."""
+    total, suma_ids, ultima_modificacion = crud.get_version_datos_reporte(db, fecha_inicio, fecha_fin)
+    contenido = "|".join(str(valor) for valor in (
+        fecha_inicio, fecha_fin, total, suma_ids, ultima_modificacion, REPORTE_VERSION, REPORTES_MAX_EVENTOS
+    ))
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def ruta_reporte_trabajo(trabajo_id: str) -> str:
+    return os.path.join(REPORTES_TRABAJOS_DIR, f"{trabajo_id}.pdf")
+
+
+def _enlazar_o_copiar(origen: str, destino: str):
+    """Enlace duro si es el mismo sistema de archivos; si no, copia. FileNotFoundError si `origen` no existe."""
+    try:
+        os.link(origen, destino)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(origen, destino)
+
+
+def fijar_archivo(origen: str, destino: str) -> str:
+    """Publica `origen` (p. ej. un PDF de la cache) en `destino` de forma atomica y retorna `destino`."""
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+    try:
+        _enlazar_o_copiar(origen, temporal)
+        os.replace(temporal, destino)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return destino
+
+
+def generar_en_archivo(db: Session, fecha_inicio: Optional[date], fecha_fin: Optional[date], clave: str,
+                       destino: str) -> str:
+    """
+    Deja en `destino` el PDF del rango: tomado de la cache si ya esta, si no lo genera ahi y publica
+    una copia en la cache bajo `clave`. Retorna `destino`, que la cache nunca desaloja.
+    """
+    ruta_cache = cache_reportes.obtener(clave)
+    if ruta_cache:
+        try:
+            return fijar_archivo(ruta_cache, destino)
+        except FileNotFoundError:
+            pass  # otro proceso lo desalojo entre la consulta y el enlace
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+    try:
+        generar_reporte(db, fecha_inicio, fecha_fin, temporal)
+        os.replace(temporal, destino)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    if cache_reportes.max_bytes > 0:
+        ruta_temporal = cache_reportes.ruta_temporal(clave)
+        try:
+            _enlazar_o_copiar(destino, ruta_temporal)
+            cache_reportes.guardar(clave, ruta_temporal)
+        except OSError as e:
+            # Sin cache el reporte se sigue entregando; solo se volvera a generar
+            print(f"No se pudo guardar el reporte {clave} en la cache: {e}")
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+    return destino
+
+
+def iterar_bloques(archivo: BinaryIO, comprimir: bool = False) -> Iterator[bytes]:
+    """Lee el archivo en bloques de REPORTES_TAM_BLOQUE; con `comprimir` los entrega como gzip."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    while True:
+        bloque = archivo.read(REPORTES_TAM_BLOQUE)
+        if not bloque:
+            break
+        if compresor:
+            bloque = compresor.compress(bloque)
+            if not bloque:
+                continue
+        yield bloque
+    if compresor:
+        yield compresor.flush()
+
+
+def _inicializar_proceso():
+    """Se ejecuta una vez en cada proceso del pool."""
+    # Con "fork" el hijo hereda las conexiones del pool del padre: se descartan sin cerrarlas
+    engine.dispose(close=False)
+    # Cargar matplotlib/reportlab aqui para que el primer reporte no pague la importacion
+    import app.services.reportes_pdf  # noqa: F401
+
+
+def _ejecutar_trabajo(trabajo_id: str, fecha_inicio: Optional[date], fecha_fin: Optional[date], clave: str):
+    """Corre en un proceso del pool: genera el PDF del trabajo (y su copia en cache) y guarda el resultado."""
+    db = SessionLocal()
+    try:
+        crud.actualizar_trabajo_reporte(db, trabajo_id, estado=models.EstadoTrabajoEnum.procesando)
+        output_path = generar_en_archivo(db, fecha_inicio, fecha_fin, clave, ruta_reporte_trabajo(trabajo_id))
+        crud.actualizar_trabajo_reporte(
+            db, trabajo_id,
+            estado=models.EstadoTrabajoEnum.completado,
+            ruta_archivo=output_path,
+            fecha_completado=datetime.utcnow()
+        )
+    except Exception as e:
+        db.rollback()
+        print(f"Error al generar el reporte {trabajo_id}: {e}")
+        crud.actualizar_trabajo_reporte(
+            db, trabajo_id,
+            estado=models.EstadoTrabajoEnum.fallido,
+            error=str(e)[:1000],
+            fecha_completado=datetime.utcnow()
+        )
+    finally:
+        db.close()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_en_curso = 0
+
+
+def _obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=REPORTES_WORKERS,
+                mp_context=multiprocessing.get_context(REPORTES_CONTEXTO_MP),
+                initializer=_inicializar_proceso
+            )
+        return _pool
+
+
+def iniciar_pool():
+    """Arranca los procesos del pool, que cargan matplotlib/reportlab en _inicializar_proceso."""
+    pool = _obtener_pool()
+    for futuro in [pool.submit(os.getpid) for _ in range(REPORTES_WORKERS)]:
+        futuro.result()
+
+
+def _descartar_pool(pool: ProcessPoolExecutor):
+    """
+    Olvida un pool roto (un proceso murio, p. ej. por falta de memoria) para que el siguiente
+    envio cree uno nuevo. Si otro hilo ya lo reemplazo no se toca el nuevo.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _reservar_lugar():
+    """Cuenta un reporte mas en curso en este proceso; 429 si ya se alcanzo REPORTES_MAX_EN_CURSO."""
+    global _en_curso
+    with _pool_lock:
+        if _en_curso >= REPORTES_MAX_EN_CURSO:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Hay demasiados reportes en proceso, intenta de nuevo mas tarde",
+                headers={"Retry-After": "30"},
+            )
+        _en_curso += 1
+
+
+def _liberar_lugar():
+    global _en_curso
+    with _pool_lock:
+        _en_curso -= 1
+
+
+def _enviar_al_pool(funcion, *args) -> Future:
+    """Envia `funcion` al pool; si el pool esta roto lo recrea y reintenta una vez."""
+    pool = _obtener_pool()
+    try:
+        futuro = pool.submit(funcion, *args)
+    except BrokenProcessPool:
+        _descartar_pool(pool)
+        pool = _obtener_pool()
+        futuro = pool.submit(funcion, *args)
+    futuro.add_done_callback(lambda f: _al_terminar_envio(pool, f))
+    return futuro
+
+
+def _al_terminar_envio(pool: ProcessPoolExecutor, futuro: Future):
+    _liberar_lugar()
+    if not futuro.cancelled() and isinstance(futuro.exception(), BrokenProcessPool):
+        _descartar_pool(pool)
+
+
+def _al_terminar(trabajo_id: str, futuro: Future):
+    if futuro.cancelled():
+        error = "Trabajo cancelado al detener el servidor"
+    else:
+        error = futuro.exception()
+        if error is None:
+            return
+
+    # El proceso murio, el pool se rompio o se cancelo: el trabajo no pudo registrar su propio fallo
+    print(f"El proceso del reporte {trabajo_id} termino con error: {error}")
+    db = SessionLocal()
+    try:
+        crud.actualizar_trabajo_reporte(
+            db, trabajo_id,
+            estado=models.EstadoTrabajoEnum.fallido,
+            error=str(error)[:1000] or type(error).__name__,
+            fecha_completado=datetime.utcnow()
+        )
+    finally:
+        db.close()
+
+
+def encolar_reporte(db: Session, usuario_id: Optional[int], fecha_inicio: Optional[date],
+                    fecha_fin: Optional[date]) -> models.TrabajoReporte:
+    """
+    Registra un trabajo de reporte. Si el PDF del rango ya esta en cache el trabajo queda completado
+    de inmediato; si no, se envia al pool. Lanza 429 si hay demasiados en curso.
+    """
+    clave = clave_reporte(db, fecha_inicio, fecha_fin)
+    ruta_cache = cache_reportes.obtener(clave)
+    if ruta_cache:
+        trabajo_id = str(uuid.uuid4())
+        try:
+            ruta_trabajo = fijar_archivo(ruta_cache, ruta_reporte_trabajo(trabajo_id))
+        except FileNotFoundError:
+            ruta_trabajo = None  # se desalojo entre la consulta y la copia: se genera de nuevo
+        if ruta_trabajo:
+            trabajo = crud.create_trabajo_reporte(
+                db, trabajo_id, usuario_id, fecha_inicio, fecha_fin, ttl_segundos=REPORTES_TTL_S
+            )
+            return crud.actualizar_trabajo_reporte(
+                db, trabajo.trabajo_id,
+                estado=models.EstadoTrabajoEnum.completado,
+                ruta_archivo=ruta_trabajo,
+                fecha_completado=datetime.utcnow()
+            )
+
+    _reservar_lugar()
+    try:
+        trabajo = crud.create_trabajo_reporte(
+            db, str(uuid.uuid4()), usuario_id, fecha_inicio, fecha_fin, ttl_segundos=REPORTES_TTL_S
+        )
+        futuro = _enviar_al_pool(_ejecutar_trabajo, trabajo.trabajo_id, fecha_inicio, fecha_fin, clave)
+    except Exception:
+        _liberar_lugar()
+        raise
+
+    futuro.add_done_callback(lambda f, trabajo_id=trabajo.trabajo_id: _al_terminar(trabajo_id, f))
+    return trabajo
+
+
+def _generar_sincrono(fecha_inicio: Optional[date], fecha_fin: Optional[date], clave: str, destino: str) -> str:
+    """Corre en un proceso del pool: genera en `destino` el PDF de un reporte sincrono."""
+    db = SessionLocal()
+    try:
+        return generar_en_archivo(db, fecha_inicio, fecha_fin, clave, destino)
+    finally:
+        db.close()
+
+
+def _borrar_archivo(ruta: str):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"No se pudo borrar el reporte temporal {ruta}: {e}")
+
+
+async def abrir_reporte(db: Session, fecha_inicio: Optional[date], fecha_fin: Optional[date]) -> BinaryIO:
+    """
+    Retorna el PDF del rango abierto para lectura. Si los datos no cambiaron sale de la cache; si no,
+    se genera en el pool de procesos con el mismo limite que los trabajos (429 si esta lleno) y se
+    espera sin ocupar un hilo de la API. El llamador debe cerrar el archivo.
+    """
+    clave = await run_in_threadpool(clave_reporte, db, fecha_inicio, fecha_fin)
+    ruta = cache_reportes.obtener(clave)
+    if ruta:
+        try:
+            return open(ruta, "rb")
+        except FileNotFoundError:
+            pass  # otro proceso lo desalojo entre la consulta y la apertura
+
+    destino = ruta_reporte_trabajo(f"sincrono-{uuid.uuid4().hex}")
+    _reservar_lugar()
+    try:
+        futuro = _enviar_al_pool(_generar_sincrono, fecha_inicio, fecha_fin, clave, destino)
+    except Exception:
+        _liberar_lugar()
+        raise
+
+    try:
+        await asyncio.wrap_future(futuro)
+        return open(destino, "rb")
+    finally:
+        # El archivo ya abierto se sigue leyendo despues de borrarlo. Si el cliente se desconecto
+        # antes de terminar, se borra cuando el proceso acabe de escribirlo
+        if futuro.done():
+            _borrar_archivo(destino)
+        else:
+            futuro.add_done_callback(lambda f: _borrar_archivo(destino))
+
+
+def limpiar_trabajos_expirados(db: Session) -> int:
+    """
+    Borra los registros de trabajos expirados y sus PDF en REPORTES_TRABAJOS_DIR.
+    Retorna cuantos trabajos se eliminaron. Las copias en la cache se desalojan por tamaño.
+    """
+    expirados = crud.get_trabajos_reporte_expirados(db)
+    directorio = os.path.abspath(REPORTES_TRABAJOS_DIR)
+    for trabajo in expirados:
+        ruta = trabajo.ruta_archivo
+        if ruta and os.path.dirname(os.path.abspath(ruta)) == directorio:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"No se pudo borrar el reporte del trabajo {trabajo.trabajo_id}: {e}")
+    return crud.eliminar_trabajos_reporte(db, [trabajo.trabajo_id for trabajo in expirados])
+
+
+def detener():
+    """Cancela los trabajos que no han iniciado y cierra los pools de reportes y graficas."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+    # Solo si el modulo ya se cargo en este proceso (p. ej. por la precarga)
+    reportes_pdf = sys.modules.get("app.services.reportes_pdf")
+    if reportes_pdf is not None:
+        reportes_pdf.detener_graficas()
+
+
+def obtener_metricas() -> dict:
+    with _pool_lock:
+        en_curso = _en_curso
+    return {
+        "workers": REPORTES_WORKERS,
+        "en_curso": en_curso,
+        # Por proceso de la API, no del servidor completo
+        "max_en_curso": REPORTES_MAX_EN_CURSO,
+        "ttl_s": REPORTES_TTL_S,
+        "cache": cache_reportes.metricas(),
+    }
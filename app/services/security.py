@@ -1,13 +1,20 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor, Future
+import asyncio
+import threading
+import time
 
 from app import crud, models, schemas
 from app.database import get_db
+from app.services.cache import CacheTTL
+from app.config import obtener_configuracion
 
 
 # TODO: Cambiar estos valores por variables de entorno en producción
@@ -15,17 +22,88 @@ SECRET_KEY = "supersecreto"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10000
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+config = obtener_configuracion()
+
+# Costo de bcrypt calibrado para el host (python -m app.services.calibrar_bcrypt).
+# Los hashes con otro costo se marcan para actualizar y se re-hashean al iniciar sesion.
+BCRYPT_ROUNDS = config.entero("BCRYPT_ROUNDS", 12)
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 
 # autenticación en la URL "/token"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Executor dedicado para bcrypt: el hash es costoso en CPU y no debe correr en el event loop
+HASH_WORKERS = config.entero("HASH_WORKERS", 2)
+HASH_MAX_PENDIENTES = config.entero("HASH_MAX_PENDIENTES", 32)
 
-def verificar_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Cache de usuarios autenticados por `sub` del token, evita un SELECT por peticion
+PRINCIPALES_TTL_S = config.decimal("PRINCIPALES_TTL_S", 60)
+PRINCIPALES_MAX = config.entero("PRINCIPALES_MAX", 1024)
 
+cache_principales = CacheTTL(max_entradas=PRINCIPALES_MAX, ttl_segundos=PRINCIPALES_TTL_S)
 
-def hashear_password(password: str) -> str:
+# Cache de la version de token por usuario, para autorizar solo con los claims del JWT
+VERSIONES_TOKEN_TTL_S = config.decimal("VERSIONES_TOKEN_TTL_S", 30)
+
+cache_versiones_token = CacheTTL(max_entradas=PRINCIPALES_MAX, ttl_segundos=VERSIONES_TOKEN_TTL_S)
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_lock = threading.Lock()
+_hash_metricas = {
+    "enviadas": 0,
+    "completadas": 0,
+    "rechazadas": 0,
+    "pendientes": 0,
+    "tiempo_total_s": 0.0,
+}
+
+
+def _enviar_a_executor_hash(funcion, *args) -> Future:
+    """Enviar una operacion de bcrypt al executor, rechazando con 503 si la cola esta llena."""
+    with _hash_lock:
+        if _hash_metricas["pendientes"] >= HASH_MAX_PENDIENTES:
+            _hash_metricas["rechazadas"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, intenta de nuevo en unos segundos",
+                headers={"Retry-After": "2"},
+            )
+        _hash_metricas["pendientes"] += 1
+        _hash_metricas["enviadas"] += 1
+
+    inicio = time.perf_counter()
+
+    def registrar_fin(_future: Future):
+        with _hash_lock:
+            _hash_metricas["pendientes"] -= 1
+            _hash_metricas["completadas"] += 1
+            _hash_metricas["tiempo_total_s"] += time.perf_counter() - inicio
+
+    future = _hash_executor.submit(funcion, *args)
+    future.add_done_callback(registrar_fin)
+    return future
+
+
+def obtener_metricas_hash() -> dict:
+    """Metricas del executor de bcrypt."""
+    with _hash_lock:
+        metricas = dict(_hash_metricas)
+    completadas = metricas["completadas"]
+    metricas["tiempo_promedio_ms"] = round(metricas["tiempo_total_s"] / completadas * 1000, 2) if completadas else 0
+    metricas["tiempo_total_s"] = round(metricas["tiempo_total_s"], 3)
+    metricas["workers"] = HASH_WORKERS
+    metricas["max_pendientes"] = HASH_MAX_PENDIENTES
+    return metricas
+
+
+def _hashear(password: str) -> str:
     try:
         return pwd_context.hash(password)
     except Exception as e:
@@ -33,6 +111,36 @@ def hashear_password(password: str) -> str:
         raise
 
 
+def verificar_password(plain_password: str, hashed_password: str) -> bool:
+    """Verificar una contraseña en el executor de bcrypt (para codigo sincrono)."""
+    return _enviar_a_executor_hash(pwd_context.verify, plain_password, hashed_password).result()
+
+
+def hashear_password(password: str) -> str:
+    """Hashear una contraseña en el executor de bcrypt (para codigo sincrono)."""
+    return _enviar_a_executor_hash(_hashear, password).result()
+
+
+async def verificar_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verificar una contraseña sin bloquear el event loop."""
+    return await asyncio.wrap_future(_enviar_a_executor_hash(pwd_context.verify, plain_password, hashed_password))
+
+
+async def verificar_y_actualizar_password_async(plain_password: str, hashed_password: str) -> tuple:
+    """
+    Verificar una contraseña sin bloquear el event loop.
+    Retorna (valida, nuevo_hash); nuevo_hash no es None si el hash usa un costo distinto al configurado.
+    """
+    return await asyncio.wrap_future(
+        _enviar_a_executor_hash(pwd_context.verify_and_update, plain_password, hashed_password)
+    )
+
+
+async def hashear_password_async(password: str) -> str:
+    """Hashear una contraseña sin bloquear el event loop."""
+    return await asyncio.wrap_future(_enviar_a_executor_hash(_hashear, password))
+
+
 def crear_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -45,8 +153,18 @@ def crear_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """ Decodifica el token, extrae el nombre de usuario y lo busca en la BD. """
+def claims_usuario(usuario: models.Usuario) -> dict:
+    """Claims firmados en el token: permiten autorizar sin consultar la BD."""
+    return {
+        "sub": usuario.nombre_usuario,
+        "uid": usuario.usuario_id,
+        "rol": usuario.rol.value if usuario.rol else None,
+        "ver": usuario.version_token or 0,
+    }
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.Usuario:
+    """ Decodifica el token, extrae el nombre de usuario y lo busca en el cache o en la BD. """
 
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -62,20 +180,85 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
 
-    usuario = crud.get_user_by_username(db, nombre_usuario=token_data.nombre_usuario)
-    if usuario is None:
+    # Cache de principales: en el caso comun no se consulta la BD
+    usuario = cache_principales.obtener(token_data.nombre_usuario)
+    if usuario is not None:
+        return usuario
+
+    db_usuario = await run_in_threadpool(crud.get_user_by_username, db, nombre_usuario=token_data.nombre_usuario)
+    if db_usuario is None:
         raise credentials_exception
+
+    # Se guarda una copia sin el hash ni relaciones, independiente de la sesion
+    usuario = schemas.Usuario.model_validate(db_usuario)
+    cache_principales.guardar(token_data.nombre_usuario, usuario)
     return usuario
 
 
-def verificar_rol_admin(current_user: models.Usuario = Depends(get_current_user)):
-    """Verifica que el usuario actual sea administrador."""
-    if current_user.rol != models.RolUsuarioEnum.admin:
+def invalidar_principal(*nombres_usuario: str):
+    """Eliminar usuarios del cache de principales (al actualizar o eliminar)."""
+    for nombre_usuario in nombres_usuario:
+        if nombre_usuario:
+            cache_principales.invalidar(nombre_usuario)
+
+
+def invalidar_version_token(usuario_id: int):
+    """Eliminar del cache la version de token de un usuario (al cambiar rol o contraseña)."""
+    cache_versiones_token.invalidar(usuario_id)
+
+
+async def get_principal_token(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.TokenData:
+    """
+    Autoriza usando solo los claims firmados del token.
+    Unicamente verifica la version de token del usuario, que se mantiene en cache.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudieron validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+
+    username = payload.get("sub")
+    usuario_id = payload.get("uid")
+    rol = payload.get("rol")
+    version = payload.get("ver")
+
+    if username is None:
+        raise credentials_exception
+
+    # Tokens emitidos antes de agregar los claims: se resuelven con el usuario completo
+    if usuario_id is None or rol is None or version is None:
+        usuario = await get_current_user(token, db)
+        return schemas.TokenData(nombre_usuario=usuario.nombre_usuario, usuario_id=usuario.usuario_id, rol=usuario.rol)
+
+    version_actual = cache_versiones_token.obtener(usuario_id)
+    if version_actual is None:
+        version_actual = await run_in_threadpool(crud.get_version_token, db, usuario_id)
+        if version_actual is None:
+            raise credentials_exception
+        cache_versiones_token.guardar(usuario_id, version_actual)
+
+    if version != version_actual:
+        raise credentials_exception
+
+    try:
+        return schemas.TokenData(nombre_usuario=username, usuario_id=usuario_id, rol=rol, version_token=version)
+    except ValueError:
+        raise credentials_exception
+
+
+def verificar_rol_admin(principal: schemas.TokenData = Depends(get_principal_token)):
+    """Verifica que el usuario actual sea administrador (sin consultar la BD)."""
+    if principal.rol != models.RolUsuarioEnum.admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Acceso denegado. Solo administradores pueden realizar esta accion."
         )
-    return current_user
+    return principal
 
 
 
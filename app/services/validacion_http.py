@@ -0,0 +1,70 @@
+"""
+Peticiones condicionales (ETag / Last-Modified).
+
+Los dashboards y la app consultan algunos endpoints cada pocos segundos. Esos endpoints calculan primero
+una version barata de sus datos (conteo, IDs maximos y ultima modificacion); si coincide con la que el
+cliente ya tiene se responde 304 sin ejecutar la consulta pesada ni renderizar.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import hashlib
+
+from fastapi import Request, Response
+
+# Incrementar al cambiar el formato de las paginas o respuestas validadas, para invalidar los ETag anteriores
+VERSION_RESPUESTAS = 1
+
+
+def calcular_etag(*partes) -> str:
+    """ETag debil a partir de los filtros de la peticion y la version de los datos."""
+    contenido = "|".join(str(parte) for parte in (VERSION_RESPUESTAS, *partes))
+    return f'W/"{hashlib.sha256(contenido.encode()).hexdigest()[:32]}"'
+
+
+def _a_utc(fecha: datetime) -> datetime:
+    # Las fechas de la BD se guardan en UTC sin zona; HTTP solo maneja segundos
+    return fecha.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def encabezados_validacion(etag: str, ultima_modificacion: Optional[datetime] = None,
+                           privado: bool = False) -> dict:
+    """ETag, Last-Modified y Cache-Control para que el cliente revalide en cada consulta."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache" if privado else "no-cache"}
+    if ultima_modificacion is not None:
+        headers["Last-Modified"] = format_datetime(_a_utc(ultima_modificacion), usegmt=True)
+    return headers
+
+
+def _coincide_etag(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Comparacion debil (RFC 9110): se ignora el prefijo W/
+    propio = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == propio for candidato in if_none_match.split(","))
+
+
+def no_modificado(request: Request, etag: str, ultima_modificacion: Optional[datetime] = None) -> bool:
+    """True si la copia del cliente sigue vigente. If-None-Match tiene prioridad sobre If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _coincide_etag(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or ultima_modificacion is None:
+        return False
+    try:
+        fecha_cliente = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if fecha_cliente.tzinfo is None:
+        fecha_cliente = fecha_cliente.replace(tzinfo=timezone.utc)
+    return _a_utc(ultima_modificacion) <= fecha_cliente
+
+
+def respuesta_no_modificado(request: Request, etag: str, ultima_modificacion: Optional[datetime] = None,
+                            privado: bool = False) -> Optional[Response]:
+    """Respuesta 304 si el cliente ya tiene esta version; None si hay que generar la respuesta completa."""
+    if not no_modificado(request, etag, ultima_modificacion):
+        return None
+    return Response(status_code=304, headers=encabezados_validacion(etag, ultima_modificacion, privado))
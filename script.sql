@@ -13,6 +13,7 @@ CREATE TABLE usuarios(
                          correo_electronico VARCHAR(100) UNIQUE NOT NULL,
                          hash_contrasena VARCHAR(1024) NOT NULL,
                          rol ENUM('admin', 'operador') DEFAULT 'operador',
+                         version_token INT NOT NULL DEFAULT 0, -- se incrementa al cambiar rol o contraseña
                          INDEX idx_nombre_usuario (nombre_usuario)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -29,6 +30,7 @@ CREATE TABLE eventos(
                         descripcion TEXT, -- llm o manual añade descripcion del evento
                         estatus ENUM('confirmado', 'descartado', 'pendiente') DEFAULT 'pendiente', -- asigando por un usuario
                         usuario_id INT, -- usuario que confirma o descarta el evento
+                        fecha_modificacion TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), -- tambien al agregar imagenes o aire
                         FOREIGN KEY (usuario_id) REFERENCES usuarios(usuario_id) ON DELETE SET NULL,
                         INDEX idx_fecha_evento (fecha_evento)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -99,7 +101,9 @@ CREATE TABLE tokens_fcm(
                            activo BOOLEAN DEFAULT TRUE,
                            FOREIGN KEY (usuario_id) REFERENCES usuarios(usuario_id) ON DELETE CASCADE,
                            INDEX idx_usuario_id (usuario_id),
-                           INDEX idx_activo (activo)
+                           INDEX idx_activo (activo),
+                           INDEX idx_token_fcm (token_fcm),
+                           INDEX idx_usuario_dispositivo (usuario_id, dispositivo)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 
@@ -118,6 +122,53 @@ CREATE TABLE password_reset_tokens(
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 
+-- Outbox de notificaciones push
+-- se escribe en la misma transaccion que el evento y un despachador en segundo plano la envia
+CREATE TABLE notificaciones_outbox(
+    notificacion_id INT AUTO_INCREMENT PRIMARY KEY,
+    evento_id INT,
+    tipo VARCHAR(50) NOT NULL DEFAULT 'nuevo_evento',
+    estado ENUM('pendiente', 'enviada', 'fallida') DEFAULT 'pendiente', -- fallida: agoto sus reintentos
+    intentos INT NOT NULL DEFAULT 0,
+    proximo_intento DATETIME NOT NULL,
+    ultimo_error TEXT,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    fecha_envio DATETIME NULL,
+    FOREIGN KEY (evento_id) REFERENCES eventos(evento_id) ON DELETE CASCADE,
+    INDEX idx_evento_id (evento_id),
+    INDEX idx_estado_proximo_intento (estado, proximo_intento),
+    INDEX idx_fecha_envio (fecha_envio)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+
+-- Contadores de version para invalidar caches en memoria entre workers
+-- (p. ej. 'tokens_operadores': se incrementa al cambiar tokens FCM o roles)
+CREATE TABLE versiones_cache(
+    nombre VARCHAR(50) PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT INTO versiones_cache (nombre, version) VALUES ('tokens_operadores', 0);
+
+
+-- Trabajos de generacion de reportes PDF en segundo plano
+CREATE TABLE trabajos_reporte(
+    trabajo_id VARCHAR(36) PRIMARY KEY,
+    usuario_id INT,
+    estado ENUM('pendiente', 'procesando', 'completado', 'fallido') DEFAULT 'pendiente',
+    fecha_inicio DATE NULL,
+    fecha_fin DATE NULL,
+    ruta_archivo VARCHAR(500),
+    error TEXT,
+    fecha_creacion DATETIME NOT NULL,
+    fecha_completado DATETIME NULL,
+    fecha_expiracion DATETIME NOT NULL, -- despues de esta fecha se borran el archivo y el registro
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(usuario_id) ON DELETE SET NULL,
+    INDEX idx_usuario_id (usuario_id),
+    INDEX idx_fecha_expiracion (fecha_expiracion)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+
 
 -- registrar usuario: password= password
 INSERT INTO usuarios (nombre_usuario, correo_electronico, hash_contrasena, rol)
@@ -151,3 +202,40 @@ ALTER TABLE calidad_aire
     ADD COLUMN aqi FLOAT AFTER pm1p0,
     ADD COLUMN descrip VARCHAR(30) AFTER aqi;
 */
+
+
+
+/*
+-- ejecucion agregar version de token a usuarios (claims en JWT):
+
+ALTER TABLE usuarios
+    ADD COLUMN version_token INT NOT NULL DEFAULT 0 AFTER rol;
+*/
+
+
+
+/*
+-- ejecucion indices de tokens FCM (depuracion de tokens invalidos y un token por dispositivo):
+
+ALTER TABLE tokens_fcm
+    ADD INDEX idx_token_fcm (token_fcm),
+    ADD INDEX idx_usuario_dispositivo (usuario_id, dispositivo);
+*/
+
+
+
+/*
+-- ejecucion indice de fecha de envio del outbox (ventana de agrupacion de notificaciones):
+
+ALTER TABLE notificaciones_outbox
+    ADD INDEX idx_fecha_envio (fecha_envio);
+*/
+
+
+
+/*
+-- ejecucion agregar fecha de modificacion a eventos (cache de reportes PDF):
+
+ALTER TABLE eventos
+    ADD COLUMN fecha_modificacion TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6) AFTER usuario_id;
+*/